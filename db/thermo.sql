@@ -60,6 +60,27 @@ CREATE TRIGGER trig_update_image_objects_updated_at
   BEFORE UPDATE ON thermo.image_objects
   FOR EACH ROW EXECUTE FUNCTION thermo.update_updated_at_column();
 
+-- Per-device processing profiles (processing-service); device_id NULL = default for every camera
+CREATE TABLE IF NOT EXISTS thermo.processing_profiles (
+  id            SERIAL PRIMARY KEY,
+  device_id     INTEGER REFERENCES thermo.devices(id) ON DELETE CASCADE,
+  roi_x         INTEGER NOT NULL DEFAULT 0,
+  roi_y         INTEGER NOT NULL DEFAULT 0,
+  roi_w         INTEGER NOT NULL DEFAULT 0,
+  roi_h         INTEGER NOT NULL DEFAULT 0,
+  steps         JSONB NOT NULL DEFAULT '[]',
+  output_format TEXT NOT NULL DEFAULT 'png' CHECK (output_format IN ('png','jpg','webp')),
+  enabled       BOOLEAN NOT NULL DEFAULT TRUE,
+  created_at    TIMESTAMPTZ DEFAULT NOW() NOT NULL,
+  updated_at    TIMESTAMPTZ DEFAULT NOW() NOT NULL
+);
+-- one profile per device (and one default row)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_processing_profiles_device
+  ON thermo.processing_profiles ((COALESCE(device_id, 0)));
+CREATE TRIGGER trig_update_processing_profiles_updated_at
+  BEFORE UPDATE ON thermo.processing_profiles
+  FOR EACH ROW EXECUTE FUNCTION thermo.update_updated_at_column();
+
 -- Temperature readings with validation
 CREATE TABLE IF NOT EXISTS thermo.temperature_readings (
   id                 BIGSERIAL PRIMARY KEY,
@@ -1,10 +1,14 @@
 # app/api/endpoints.py
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 import logging
 import time
 
+from app import metrics
 from app.config import Config
+from app.services.admission import AdmissionLimits, admission_stats
+from app.services.chunk_assembler import ChunkAssembler
 from app.database import engine
 from sqlalchemy import text
 import redis
@@ -99,3 +103,71 @@ def liveness():
     """
     return {"alive": True, "timestamp": int(time.time())}
 
+
+
+@router.get("/stats")
+def stats(request: Request):
+    """
+    Ingestion consumer stats: queue depth ต่อ worker (thread engine) หรือจำนวน task ที่ค้าง (async engine)
+    """
+    consumer = getattr(request.app.state, "consumer", None)
+    if consumer is None:
+        return {"consumer": None, "timestamp": int(time.time())}
+    return {"consumer": consumer.stats(), "timestamp": int(time.time())}
+
+
+def _assembler_for(request: Request) -> ChunkAssembler:
+    consumer = getattr(request.app.state, "consumer", None)
+    reaper = getattr(consumer, "reaper", None)
+    return reaper.assembler if reaper is not None else ChunkAssembler()
+
+
+@router.get("/partials")
+def partials(request: Request):
+    """
+    Image ที่รับ chunk ยังไม่ครบ: จำนวน + อายุของตัวที่ค้างนานที่สุด (จาก index ใน Redis, ครอบคลุมทุก replica)
+    และสรุปการทำงานของ stale reaper ใน process นี้
+    """
+    reaper = getattr(getattr(request.app.state, "consumer", None), "reaper", None)
+    try:
+        inflight = _assembler_for(request).inflight_stats()
+    except Exception as e:
+        logger.exception("Failed reading in-flight partials")
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    return {
+        "inflight": inflight,
+        "reaper": reaper.stats() if reaper is not None else None,
+        "timestamp": int(time.time()),
+    }
+
+
+@router.get("/admission")
+def admission(request: Request, limit: int = 100):
+    """
+    Admission control ต่อกล้อง: limit ที่ใช้อยู่ และกล้องที่โดนจำกัดบ่อยที่สุด (นับรวมทุก replica)
+    """
+    try:
+        devices = admission_stats(_assembler_for(request).redis, limit=limit)
+    except Exception as e:
+        logger.exception("Failed reading admission stats")
+        raise HTTPException(status_code=503, detail={"error": str(e)})
+    return {
+        "limits": AdmissionLimits.from_config()._asdict(),
+        "mode": Config.ADMISSION_MODE,
+        "devices": devices,
+        "timestamp": int(time.time()),
+    }
+
+
+@router.get("/metrics")
+def prometheus_metrics(request: Request):
+    """
+    Prometheus exposition format; gauge ของ partial ที่ค้างอ่านจาก Redis ตอน scrape
+    """
+    try:
+        inflight = _assembler_for(request).inflight_stats()
+        metrics.INFLIGHT_PARTIALS.set(inflight["count"])
+        metrics.INFLIGHT_OLDEST_AGE.set(inflight["oldest_age_seconds"])
+    except Exception as e:
+        logger.warning("Failed reading in-flight partials for metrics: %s", e)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -8,6 +8,23 @@ engine = create_engine(Config.FULL_DATABASE_URL(), pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+_async_session_factory = None
+
+
+def get_async_sessionmaker():
+    """
+    Lazy async session factory (asyncpg) สำหรับ INGESTION_ENGINE=async;
+    import ตอนเรียกเพื่อไม่ให้ thread engine ต้องมี asyncpg
+    """
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        async_engine = create_async_engine(Config.FULL_ASYNC_DATABASE_URL(), pool_pre_ping=True)
+        _async_session_factory = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+    return _async_session_factory
+
+
 def get_db():
     db = SessionLocal()
     try:
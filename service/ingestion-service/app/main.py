@@ -1,4 +1,5 @@
 # app/main.py
+import asyncio
 import logging
 import signal
 import sys
@@ -9,6 +10,7 @@ from fastapi import FastAPI
 import uvicorn
 
 from app.api.endpoints import router
+from app.config import Config
 from app.services.mqtt_consumer import MQTTConsumer
 
 # --- logging setup ---
@@ -22,6 +24,11 @@ shutdown_flag = threading.Event()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if Config.INGESTION_ENGINE == "async":
+        async with async_engine_lifespan(app):
+            yield
+        return
+
     logger.info("Lifespan startup: instantiating MQTTConsumer")
     consumer = MQTTConsumer()
     thread = threading.Thread(target=consumer.start, daemon=True)
@@ -39,6 +46,28 @@ async def lifespan(app: FastAPI):
         logger.warning("Consumer thread did not exit cleanly")
 
 
+@asynccontextmanager
+async def async_engine_lifespan(app: FastAPI):
+    # import ที่นี่เพื่อให้ thread engine ไม่ต้องมี aiomqtt/asyncpg
+    from app.services.async_mqtt_consumer import AsyncMQTTConsumer
+
+    logger.info("Lifespan startup: starting AsyncMQTTConsumer in the event loop")
+    consumer = AsyncMQTTConsumer()
+    task = asyncio.create_task(consumer.run())
+    app.state.consumer = consumer
+    app.state.consumer_task = task
+    yield
+    logger.info("Lifespan shutdown: stopping AsyncMQTTConsumer")
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning("Async consumer exited with error: %s", e)
+    await consumer.stop()
+
+
 def create_app() -> FastAPI:
     app = FastAPI(title="Ingestion Service", lifespan=lifespan)
     app.include_router(router)
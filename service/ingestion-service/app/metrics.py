@@ -0,0 +1,85 @@
+# app/metrics.py
+"""
+Prometheus metrics ของ ingestion service (expose ที่ GET /metrics)
+
+label ที่ใช้บ่อยถูก bind ไว้ล่วงหน้า (.labels() ครั้งเดียวตอน import) เพื่อให้ต้นทุนต่อ chunk เหลือแค่ inc/observe
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# latency ระดับ ms (Redis / assemble) และระดับ 10ms-วินาที (MinIO / DB)
+_FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+_SLOW_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_SIZE_BUCKETS = (16e3, 64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+
+CHUNKS_RECEIVED = Counter(
+    "ingestion_chunks_received_total", "Chunk messages received from MQTT", ["format"]
+)
+CHUNK_BYTES = Counter(
+    "ingestion_chunk_bytes_total", "Decoded chunk payload bytes received", ["format"]
+)
+CHUNKS_REJECTED = Counter(
+    "ingestion_chunks_rejected_total", "Chunk messages that could not be decoded", ["format"]
+)
+CHUNK_RESULTS = Counter(
+    "ingestion_chunk_results_total", "Outcome of storing a chunk", ["result"]
+)
+
+REDIS_SECONDS = Histogram(
+    "ingestion_redis_seconds", "Redis round-trip time per ChunkAssembler operation", ["op"], buckets=_FAST_BUCKETS
+)
+ASSEMBLY_SECONDS = Histogram(
+    "ingestion_assembly_seconds", "Time from the final chunk to a completed image (assemble+upload+DB)",
+    buckets=_SLOW_BUCKETS,
+)
+IMAGES = Counter(
+    "ingestion_images_total", "Assembled images by outcome", ["result"]
+)
+IMAGES_INVALID = Counter(
+    "ingestion_images_invalid_total", "Assembled images that failed structural validation", ["reason"]
+)
+
+MINIO_UPLOAD_SECONDS = Histogram(
+    "ingestion_minio_upload_seconds", "MinIO put_object latency (including retries)", buckets=_SLOW_BUCKETS
+)
+MINIO_UPLOAD_BYTES = Histogram(
+    "ingestion_minio_upload_bytes", "Size of uploaded raw images", buckets=_SIZE_BUCKETS
+)
+MINIO_UPLOAD_FAILURES = Counter(
+    "ingestion_minio_upload_failures_total", "Raw image uploads that failed after retries"
+)
+
+DB_COMMIT_SECONDS = Histogram(
+    "ingestion_db_commit_seconds", "Latency of persisting an image_objects row", buckets=_SLOW_BUCKETS
+)
+
+INFLIGHT_PARTIALS = Gauge(
+    "ingestion_inflight_partials", "Images with some but not all chunks in Redis"
+)
+INFLIGHT_OLDEST_AGE = Gauge(
+    "ingestion_inflight_oldest_age_seconds", "Seconds since the oldest in-flight partial received a chunk"
+)
+
+# children ที่ใช้ใน hot path
+CHUNKS_JSON = CHUNKS_RECEIVED.labels("json")
+CHUNKS_BIN = CHUNKS_RECEIVED.labels("bin")
+CHUNK_BYTES_JSON = CHUNK_BYTES.labels("json")
+CHUNK_BYTES_BIN = CHUNK_BYTES.labels("bin")
+REJECTED_JSON = CHUNKS_REJECTED.labels("json")
+REJECTED_BIN = CHUNKS_REJECTED.labels("bin")
+
+RESULT_FILTERED = CHUNK_RESULTS.labels("filtered")
+RESULT_BY_STATUS = {
+    status: CHUNK_RESULTS.labels(status)
+    for status in ("duplicate", "stored", "ready", "locked", "invalid", "rate_limited")
+}
+
+REDIS_INGEST = REDIS_SECONDS.labels("ingest")
+REDIS_ASSEMBLE = REDIS_SECONDS.labels("assemble")
+REDIS_MARK_PROCESSED = REDIS_SECONDS.labels("mark_processed")
+
+IMAGES_STORED = IMAGES.labels("stored")
+IMAGES_ASSEMBLE_FAILED = IMAGES.labels("assemble_failed")
+IMAGES_UPLOAD_FAILED = IMAGES.labels("upload_failed")
+IMAGES_REJECTED = IMAGES.labels("rejected")
+IMAGES_QUARANTINED = IMAGES.labels("quarantined")
+IMAGES_DEDUPLICATED = IMAGES.labels("deduplicated")
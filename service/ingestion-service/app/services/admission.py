@@ -0,0 +1,107 @@
+# app/services/admission.py
+from typing import List, NamedTuple
+
+from app.config import Config
+
+# จำนวนครั้งที่แต่ละกล้องโดนจำกัด (field = "<camera_uid>:limited_chunks" / "<camera_uid>:limited_bytes")
+ADMISSION_STATS_KEY = "admission_limited"
+
+
+def bucket_key(camera_uid: str) -> str:
+    return f"admission:{camera_uid}"
+
+
+# Token bucket ต่อกล้อง (chunks/s และ bytes/s) เก็บใน Redis hash จึงมีผลรวมทุก replica
+# ใช้เวลาของ Redis (TIME) ไม่ใช่ของเครื่องที่เรียก; rate <= 0 = ไม่จำกัดมิตินั้น
+# chunk ที่ใหญ่กว่า byte_burst ใช้ token เท่ากับ byte_burst (ไม่งั้นจะไม่มีวันผ่าน)
+# return 0 = ผ่าน, > 0 = ต้องรออีกกี่ ms จึงจะมี token พอ
+ADMISSION_LUA_FN = """
+local function admit(bucket, stats, camera, size, chunk_rate, chunk_burst, byte_rate, byte_burst)
+  if chunk_rate <= 0 and byte_rate <= 0 then
+    return 0
+  end
+  local t = redis.call('TIME')
+  local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+  local state = redis.call('HMGET', bucket, 'chunks', 'bytes', 'ts')
+  local chunks = tonumber(state[1]) or chunk_burst
+  local bytes = tonumber(state[2]) or byte_burst
+  local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+  local cost = math.min(size, byte_burst)
+  local wait = 0
+  if chunk_rate > 0 then
+    chunks = math.min(chunk_burst, chunks + elapsed * chunk_rate)
+    if chunks < 1 then
+      wait = math.max(wait, (1 - chunks) / chunk_rate)
+    end
+  end
+  if byte_rate > 0 then
+    bytes = math.min(byte_burst, bytes + elapsed * byte_rate)
+    if bytes < cost then
+      wait = math.max(wait, (cost - bytes) / byte_rate)
+    end
+  end
+  if wait == 0 then
+    if chunk_rate > 0 then
+      chunks = chunks - 1
+    end
+    if byte_rate > 0 then
+      bytes = bytes - cost
+    end
+  else
+    redis.call('HINCRBY', stats, camera .. ':limited_chunks', 1)
+    redis.call('HINCRBY', stats, camera .. ':limited_bytes', size)
+  end
+  redis.call('HSET', bucket, 'chunks', tostring(chunks), 'bytes', tostring(bytes), 'ts', tostring(now))
+  redis.call('EXPIRE', bucket, 60)
+  return math.ceil(wait * 1000)
+end
+"""
+
+# ใช้แยกเมื่อไม่ได้รับ chunk ผ่าน Lua script (REDIS_ATOMIC_INGEST=false)
+# KEYS: bucket, stats
+# ARGV: camera_uid, size, chunk_rate, chunk_burst, byte_rate, byte_burst
+ADMIT_LUA = ADMISSION_LUA_FN + """
+return admit(KEYS[1], KEYS[2], ARGV[1], tonumber(ARGV[2]),
+  tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5]), tonumber(ARGV[6]))
+"""
+
+
+class AdmissionLimits(NamedTuple):
+    chunks_per_second: float = 0
+    chunk_burst: float = 0
+    bytes_per_second: float = 0
+    byte_burst: float = 0
+    max_defer_ms: int = 0  # > 0 = ถ้าต้องรอไม่เกินนี้ให้รอแล้วลองอีกครั้ง แทนการทิ้งทันที
+
+    @classmethod
+    def from_config(cls) -> "AdmissionLimits":
+        chunk_rate = Config.ADMISSION_CHUNKS_PER_SECOND
+        byte_rate = Config.ADMISSION_BYTES_PER_SECOND
+        return cls(
+            chunks_per_second=chunk_rate,
+            chunk_burst=Config.ADMISSION_CHUNK_BURST or chunk_rate * 2,
+            bytes_per_second=byte_rate,
+            byte_burst=Config.ADMISSION_BYTE_BURST or byte_rate * 2,
+            max_defer_ms=Config.ADMISSION_MAX_DEFER_MS if Config.ADMISSION_MODE == "defer" else 0,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.chunks_per_second > 0 or self.bytes_per_second > 0
+
+    def args(self) -> List[float]:
+        return [self.chunks_per_second, self.chunk_burst, self.bytes_per_second, self.byte_burst]
+
+
+def admission_stats(redis_client, limit: int = 100) -> List[dict]:
+    """
+    กล้องที่โดนจำกัดมากที่สุด (รวมทุก replica) เรียงตามจำนวน chunk ที่โดนจำกัด
+    """
+    devices = {}
+    for field, value in redis_client.hgetall(ADMISSION_STATS_KEY).items():
+        field = field.decode() if isinstance(field, bytes) else field
+        camera_uid, _, counter = field.rpartition(":")
+        devices.setdefault(camera_uid, {"camera_uid": camera_uid, "limited_chunks": 0, "limited_bytes": 0})
+        if counter in ("limited_chunks", "limited_bytes"):
+            devices[camera_uid][counter] = int(value)
+    return sorted(devices.values(), key=lambda d: d["limited_chunks"], reverse=True)[:limit]
@@ -0,0 +1,388 @@
+# app/services/async_ingestion.py
+import asyncio
+import base64
+import binascii
+import datetime
+import functools
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import metrics
+from app.config import Config
+from app.database import get_async_sessionmaker
+from app.models.image_object import ImageObject, ObjectStatus
+from app.services.chunk_assembler import CHUNK_TTL_SECONDS, AsyncChunkAssembler, IngestResult
+from app.services.chunk_hasher import IncrementalHasher
+from app.services.content_index import (
+    NAMING_CONTENT,
+    checksum_index_key,
+    content_object_name,
+    existing_object_query,
+    parse_index_value,
+)
+from app.services.chunk_frame import decode_frame, valid_chunk_range
+from app.services.device_cache import DeviceCache, resolve_device_id_async
+from app.services.event_publisher import RawEventPublisher, raw_created_event
+from app.services.image_validator import ImageCheck, validate_image
+from app.services.image_writer import ImageObjectWriter, image_object_row, raw_metadata
+from app.services.ingestion_service import (
+    ASSEMBLE_LOCK_TTL,
+    SESSION_TTL_SECONDS,
+    camera_uid_from_topic,
+    expected_sha256_from,
+    quarantine_metadata,
+    quarantine_object_name,
+    raw_content_type,
+    raw_extension,
+)
+from app.services.minio_uploader import MinIOUploader
+from app.services.processed_filter import RecentlyProcessedFilter
+from app.services.redis_client import AsyncRedisClient
+
+logger = logging.getLogger("async_ingestion")
+
+
+class AsyncIngestionService:
+    """
+    IngestionService เวอร์ชัน asyncio: Redis ผ่าน redis.asyncio (Lua script เดียวกัน), DB ผ่าน AsyncSession (asyncpg),
+    MinIO upload (SDK เป็น blocking) ส่งไปทำใน thread pool แยก
+    """
+
+    def __init__(self):
+        self.redis = AsyncRedisClient.get_client()
+        self.assembler = AsyncChunkAssembler(self.redis)
+        self.uploader = MinIOUploader()
+        self.devices = DeviceCache(Config.DEVICE_CACHE_TTL_SECONDS, Config.DEVICE_CACHE_MAX_SIZE)
+        self.hasher = IncrementalHasher(max_age_seconds=CHUNK_TTL_SECONDS)
+        self.recent = RecentlyProcessedFilter(Config.PROCESSED_FILTER_TTL_SECONDS)
+        self.writer = None
+        if Config.IMAGE_WRITER_ENABLED:
+            self.writer = ImageObjectWriter(
+                max_rows=Config.IMAGE_WRITER_BATCH_ROWS, max_delay_ms=Config.IMAGE_WRITER_BATCH_MS
+            )
+            self.writer.start()
+        # raw.created ไป processing-service (connection เดียวค้างไว้, publisher confirms)
+        self.events = None
+        if Config.RAW_EVENT_PUBLISH_ENABLED:
+            self.events = RawEventPublisher(
+                Config.get_rabbitmq_url(),
+                Config.RABBITMQ_EXCHANGE,
+                Config.RAW_ROUTING_KEY,
+                queue_name=Config.RABBITMQ_QUEUE_RAW,
+                max_retries=Config.RAW_EVENT_MAX_RETRIES,
+            )
+            self.events.start()
+        self.session_factory = get_async_sessionmaker()
+        self.content_addressed = Config.RAW_OBJECT_NAMING == NAMING_CONTENT
+        self._upload_executor = ThreadPoolExecutor(
+            max_workers=Config.ASYNC_UPLOAD_THREADS, thread_name_prefix="minio-upload"
+        )
+
+    async def get_or_create_session_for_camera(self, camera_uid: str) -> str:
+        key = f"camera_session:{camera_uid}"
+        new_sess = str(uuid.uuid4())
+        # GETEX ต่ออายุ session ทุก chunk (resend ที่มาช้ายังได้ image_id เดิม); ไม่มีค่อย SET NX GET (ไม่ race)
+        existing = await self.redis.getex(key, ex=SESSION_TTL_SECONDS)
+        if existing is None:
+            existing = await self.redis.set(key, new_sess, ex=SESSION_TTL_SECONDS, nx=True, get=True)
+        if existing:
+            return existing.decode() if isinstance(existing, bytes) else existing
+        return new_sess
+
+    async def process_chunk_message(self, payload: dict, topic: str):
+        metrics.CHUNKS_JSON.inc()
+        camera_uid = camera_uid_from_topic(topic, payload.get("id"))
+        # ตรวจก่อนเปิด session ของกล้อง (frame เสียไม่ควรสร้าง image_id ใหม่)
+        try:
+            index = int(payload.get("index", 0))
+            total = int(payload.get("total", 0))
+        except (TypeError, ValueError):
+            index = total = -1
+        if not valid_chunk_range(index, total):
+            logger.warning(
+                "Invalid chunk index/total %r/%r for image %s (camera %s)",
+                payload.get("index"), payload.get("total"), payload.get("image_id"), camera_uid,
+            )
+            metrics.REJECTED_JSON.inc()
+            return
+
+        image_id = payload.get("image_id") or await self.get_or_create_session_for_camera(camera_uid)
+
+        data_b64 = payload.get("data")
+        if data_b64 is None:
+            logger.warning("Invalid payload, missing data; payload=%s", payload)
+            metrics.REJECTED_JSON.inc()
+            return
+
+        try:
+            data = base64.b64decode(data_b64)
+        except (binascii.Error, ValueError) as e:
+            logger.warning("Invalid base64 chunk %s for image %s (camera %s): %s", index, image_id, camera_uid, e)
+            metrics.REJECTED_JSON.inc()
+            return
+        metrics.CHUNK_BYTES_JSON.inc(len(data))
+
+        expected = expected_sha256_from(payload)
+        if expected and Config.IMAGE_VALIDATION != "off":
+            await self.assembler.set_expected_checksum(image_id, expected)
+
+        return await self.process_chunk(camera_uid, image_id, index, total, data, topic)
+
+    async def process_binary_message(self, payload: bytes, topic: str):
+        metrics.CHUNKS_BIN.inc()
+        camera_uid = camera_uid_from_topic(topic)
+        try:
+            frame = decode_frame(payload)
+        except ValueError as e:
+            logger.warning("Invalid binary frame on topic %s: %s", topic, e)
+            metrics.REJECTED_BIN.inc()
+            return
+        metrics.CHUNK_BYTES_BIN.inc(len(frame.data))
+
+        image_id = frame.image_id or await self.get_or_create_session_for_camera(camera_uid)
+        return await self.process_chunk(camera_uid, image_id, frame.index, frame.total, frame.data, topic)
+
+    async def process_chunk(self, camera_uid: str, image_id: str, index: int, total: int, data: bytes, topic: str):
+        if image_id in self.recent:
+            metrics.RESULT_FILTERED.inc()
+            logger.debug("Dropping chunk %d for recently processed image %s (camera %s)", index, image_id, camera_uid)
+            return
+
+        lock_name = f"assemble:{image_id}"
+        result = await self.assembler.ingest_chunk(
+            image_id, index, total, data, lock_name, ASSEMBLE_LOCK_TTL, camera_uid
+        )
+        if result is IngestResult.RATE_LIMITED:
+            return
+        if result is IngestResult.INVALID:
+            await self.assembler.discard(image_id)
+            self.hasher.discard(image_id)
+            return
+        if result is IngestResult.DUPLICATE:
+            logger.info("Skipping already processed image %s (camera %s)", image_id, camera_uid)
+            self.recent.add(image_id)
+            return
+        self.hasher.update(image_id, index, data)
+        if result is IngestResult.STORED:
+            return  # ยังไม่ครบ
+        if result is IngestResult.LOCKED:
+            logger.info("Another worker is handling image %s, skipping", image_id)
+            return
+
+        started = time.perf_counter()
+        try:
+            image_bytes = await self.assembler.assemble(image_id)
+            if image_bytes is None:
+                logger.error("Failed to assemble image %s", image_id)
+                metrics.IMAGES_ASSEMBLE_FAILED.inc()
+                return
+
+            recorded_at = datetime.datetime.utcnow()
+            checksum = self.hasher.finish(image_id, total, len(image_bytes))
+            if checksum is None:
+                checksum = hashlib.sha256(image_bytes).hexdigest()
+
+            check = await self._validate(image_id, image_bytes, checksum)
+            if not check.valid:
+                await self._reject_invalid(camera_uid, image_id, recorded_at, image_bytes, checksum, check)
+                return
+
+            if self.content_addressed:
+                object_name = content_object_name(camera_uid, checksum, raw_extension(check))
+                existing_id = await self._existing_raw_object(camera_uid, object_name, checksum)
+                if existing_id is not None:
+                    logger.info(
+                        "Image %s from camera %s is identical to stored raw image %s (db image_id=%s); skipping",
+                        image_id, camera_uid, object_name, existing_id,
+                    )
+                    metrics.IMAGES_DEDUPLICATED.inc()
+                    await self._finish_capture(camera_uid, image_id)
+                    return existing_id
+            else:
+                object_name = f"{camera_uid}/{image_id}-{int(recorded_at.timestamp())}.{raw_extension(check)}"
+
+            loop = asyncio.get_running_loop()
+            try:
+                upload_info = await loop.run_in_executor(
+                    self._upload_executor,
+                    functools.partial(
+                        self.uploader.upload_raw_image, object_name, image_bytes,
+                        content_type=raw_content_type(check), checksum=checksum,
+                    ),
+                )
+            except Exception:
+                metrics.IMAGES_UPLOAD_FAILED.inc()
+                # raise ต่อ (ไม่ mark processed, lock ถูกปล่อยใน finally): chunk ครบใน Redis แล้วจึงไม่มีใครขอ resend
+                # stream mode จะไม่ ack entry ของ chunk สุดท้าย -> XCLAIM ส่งมาใหม่ -> ingest ได้ READY แล้วประกอบอีกรอบ
+                logger.error("Failed uploading image %s to MinIO", image_id)
+                raise
+
+            with metrics.DB_COMMIT_SECONDS.time():
+                db_image_id, device_id = await self._persist(
+                    camera_uid, image_id, recorded_at, upload_info, checksum, topic
+                )
+            self._publish_raw_created(
+                db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info, image_bytes, checksum
+            )
+            if self.content_addressed and db_image_id is not None:
+                await self._remember_checksum(camera_uid, checksum, db_image_id)
+
+            await self._finish_capture(camera_uid, image_id)
+            metrics.IMAGES_STORED.inc()
+            metrics.ASSEMBLY_SECONDS.observe(time.perf_counter() - started)
+        finally:
+            await AsyncRedisClient.release_lock(lock_name)
+
+        return db_image_id
+
+    async def _finish_capture(self, camera_uid: str, image_id: str):
+        await self.assembler.mark_processed(image_id)
+        self.recent.add(image_id)
+        try:
+            await self.redis.delete(f"camera_session:{camera_uid}")
+        except Exception:
+            logger.debug("Failed clearing camera session for %s", camera_uid)
+
+    async def _existing_raw_object(self, camera_uid: str, object_name: str, checksum: str):
+        try:
+            cached = parse_index_value(await self.redis.get(checksum_index_key(camera_uid, checksum)))
+        except Exception as e:
+            logger.debug("Checksum index lookup failed for %s: %s", checksum, e)
+            cached = None
+        if cached is not None:
+            return cached
+        async with self.session_factory() as db:
+            found = (await db.execute(
+                existing_object_query(Config.MINIO_RAW_BUCKET, object_name)
+            )).scalar_one_or_none()
+        if found is not None:
+            await self._remember_checksum(camera_uid, checksum, found)
+        return found
+
+    async def _remember_checksum(self, camera_uid: str, checksum: str, db_image_id: int):
+        try:
+            await self.redis.set(checksum_index_key(camera_uid, checksum), db_image_id, ex=Config.RAW_CHECKSUM_INDEX_TTL_SECONDS)
+        except Exception as e:
+            logger.debug("Failed updating checksum index for %s: %s", checksum, e)
+
+    async def _validate(self, image_id: str, image_bytes: bytes, checksum: str) -> ImageCheck:
+        if Config.IMAGE_VALIDATION == "off":
+            return ImageCheck(True)
+        expected = await self.assembler.expected_checksum(image_id)
+        return validate_image(image_bytes, expected, checksum, Config.IMAGE_MAX_PIXELS)
+
+    async def _reject_invalid(self, camera_uid, image_id, recorded_at, image_bytes, checksum, check: ImageCheck):
+        metrics.IMAGES_INVALID.labels(check.reason).inc()
+        logger.warning(
+            "Invalid image %s from camera %s (%s, %d bytes); %s",
+            image_id, camera_uid, check.reason, len(image_bytes),
+            "quarantined" if Config.IMAGE_VALIDATION == "quarantine" else "rejected",
+        )
+        if Config.IMAGE_VALIDATION == "quarantine":
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(
+                    self._upload_executor,
+                    functools.partial(
+                        self.uploader.upload_raw_image,
+                        quarantine_object_name(camera_uid, image_id, recorded_at, check), image_bytes,
+                        content_type="application/octet-stream", checksum=checksum,
+                        bucket=Config.MINIO_QUARANTINE_BUCKET,
+                        metadata=quarantine_metadata(camera_uid, image_id, check),
+                    ),
+                )
+                metrics.IMAGES_QUARANTINED.inc()
+            except Exception as e:
+                logger.warning("Failed quarantining image %s: %s", image_id, e)
+        else:
+            metrics.IMAGES_REJECTED.inc()
+        await self.assembler.discard(image_id)
+        try:
+            await self.redis.delete(f"camera_session:{camera_uid}")
+        except Exception:
+            logger.debug("Failed clearing camera session for %s", camera_uid)
+
+    async def _persist(self, camera_uid, image_id, recorded_at, upload_info, checksum, topic):
+        """
+        คืน (db_image_id, device_id) ที่ใช้ insert จริง (ไม่อ่าน device cache ซ้ำทีหลัง)
+        """
+        bucket = upload_info.get("bucket")
+        stored_name = upload_info.get("object_name")
+
+        async with self.session_factory() as db:
+            device_id = self.devices.get(camera_uid)
+            if device_id is None:
+                device_id = await resolve_device_id_async(db, camera_uid)
+                self.devices.put(camera_uid, device_id)
+
+            if self.writer is not None:
+                # group commit: รอผลของ batch โดยไม่ block event loop
+                row = image_object_row(device_id, recorded_at, upload_info, checksum, topic, camera_uid, image_id)
+                try:
+                    db_image_id = await asyncio.wrap_future(self.writer.submit(row))
+                except IntegrityError as e:
+                    self.devices.invalidate(camera_uid)
+                    logger.warning("Failed inserting image object for original image_id=%s: %s", image_id, e)
+                    return None, device_id
+                logger.info(
+                    "Saved image object %s for camera %s (db image_id=%s, original image_id=%s)",
+                    stored_name, camera_uid, db_image_id, image_id
+                )
+                return db_image_id, device_id
+
+            image_obj = ImageObject(
+                device_id=device_id,
+                recorded_at=recorded_at,
+                minio_bucket=bucket,
+                object_name=stored_name,
+                object_version=upload_info.get("version"),
+                checksum=checksum,
+                image_type="raw",
+                status=ObjectStatus.pending,
+                metadata_json=raw_metadata(topic, camera_uid, image_id),
+            )
+            db.add(image_obj)
+            try:
+                await db.commit()
+                logger.info(
+                    "Saved image object %s for camera %s (db image_id=%s, original image_id=%s)",
+                    stored_name, camera_uid, image_obj.id, image_id
+                )
+                return image_obj.id, device_id
+            except IntegrityError as e:
+                await db.rollback()
+                self.devices.invalidate(camera_uid)
+                logger.warning("Image object already exists (unique constraint) for original image_id=%s: %s", image_id, e)
+                existing_obj = (await db.execute(
+                    select(ImageObject).where(
+                        ImageObject.minio_bucket == bucket,
+                        ImageObject.object_name == stored_name
+                    )
+                )).scalar_one_or_none()
+                return (existing_obj.id if existing_obj else None), device_id
+
+    def _publish_raw_created(
+        self, db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info, image_bytes, checksum
+    ):
+        if self.events is None or db_image_id is None:
+            return
+        event = raw_created_event(
+            db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info,
+            len(image_bytes), checksum,
+        )
+        # ภาพเล็ก: แนบ bytes ไปด้วย (ยังอยู่ใน MinIO ตามปกติ)
+        inline = image_bytes if len(image_bytes) <= Config.RAW_EVENT_INLINE_MAX_BYTES else None
+        self.events.publish(event, inline=inline)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.stop()
+        if self.events is not None:
+            self.events.stop()
+        self._upload_executor.shutdown(wait=False)
@@ -0,0 +1,145 @@
+# app/services/async_mqtt_consumer.py
+import asyncio
+import json
+import logging
+from urllib.parse import urlparse
+
+import aiomqtt
+from paho.mqtt.client import topic_matches_sub
+
+from app.config import Config
+from app.services.async_ingestion import AsyncIngestionService
+from app.services.chunk_assembler import ChunkAssembler
+from app.services.gap_detector import GapDetector
+from app.services.redis_client import AsyncRedisClient
+from app.services.stale_reaper import StaleReaper
+
+logger = logging.getLogger("async_mqtt_consumer")
+
+
+class AsyncMQTTConsumer:
+    """
+    MQTT consumer ที่รันใน event loop ของ uvicorn (INGESTION_ENGINE=async).
+    แต่ละ message เป็น task ของตัวเอง; จำนวน task ที่ค้างพร้อมกันจำกัดด้วย ASYNC_MAX_INFLIGHT
+    (ถ้าเต็ม loop จะหยุดอ่าน message ใหม่ = backpressure ไปที่ broker)
+    """
+
+    def __init__(self):
+        self.ingestion = AsyncIngestionService()
+        parsed = urlparse(Config.MQTT_BROKER_URL)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 1883
+        self.topics = Config.mqtt_subscriptions()
+        self.protocol = aiomqtt.ProtocolVersion.V5 if Config.MQTT_PROTOCOL_V5 else aiomqtt.ProtocolVersion.V311
+        # reaper ใช้ sync Redis client ใน thread ของตัวเอง (งานนานๆ ครั้ง ไม่ต้องอยู่ใน event loop)
+        # (gap detector เช่นกัน: publish กลับเข้า loop ผ่าน publish_threadsafe)
+        sync_assembler = ChunkAssembler()
+        self.reaper = None
+        if Config.REAPER_INTERVAL_SECONDS > 0:
+            self.reaper = StaleReaper(sync_assembler, Config.REAPER_INTERVAL_SECONDS, Config.REAPER_MAX_AGE_SECONDS)
+        self.gap_detector = None
+        if Config.RESEND_SCAN_INTERVAL_SECONDS > 0:
+            self.gap_detector = GapDetector(
+                sync_assembler,
+                self.publish_threadsafe,
+                topic_template=Config.MQTT_RESEND_TOPIC,
+                interval_seconds=Config.RESEND_SCAN_INTERVAL_SECONDS,
+                idle_seconds=Config.RESEND_AFTER_SECONDS,
+                cooldown_seconds=Config.RESEND_COOLDOWN_SECONDS,
+                max_attempts=Config.RESEND_MAX_ATTEMPTS,
+            )
+        self._client = None
+        self._loop = None
+
+        self._inflight = asyncio.Semaphore(Config.ASYNC_MAX_INFLIGHT)
+        self._tasks: set = set()
+        self._stopping = asyncio.Event()
+        self.received = 0
+        self.failed = 0
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        if self.reaper is not None:
+            self.reaper.start()
+        if self.gap_detector is not None:
+            self.gap_detector.start()
+        backoff = 1
+        while not self._stopping.is_set():
+            try:
+                logger.info("Trying MQTT connect to %s:%s", self.host, self.port)
+                async with aiomqtt.Client(
+                    self.host,
+                    self.port,
+                    username=Config.MQTT_USER or None,
+                    password=Config.MQTT_PASSWORD or None,
+                    protocol=self.protocol,
+                ) as client:
+                    logger.info("MQTT connected, subscribing to %s", self.topics)
+                    await client.subscribe([(topic, 0) for topic in self.topics])
+                    self._client = client
+                    backoff = 1
+                    async for msg in client.messages:
+                        await self._inflight.acquire()
+                        task = asyncio.create_task(self._handle(msg.topic.value, msg.payload))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._task_done)
+            except aiomqtt.MqttError as e:
+                self._client = None
+                if self._stopping.is_set():
+                    break
+                logger.warning("MQTT connection lost: %s; retrying in %s seconds", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def publish_threadsafe(self, topic: str, payload: bytes, timeout: float = 5.0):
+        """
+        publish จาก thread อื่น (gap detector) ผ่าน client ที่ต่ออยู่ใน event loop
+        """
+        client, loop = self._client, self._loop
+        if client is None or loop is None:
+            raise RuntimeError("MQTT client not connected")
+        asyncio.run_coroutine_threadsafe(client.publish(topic, payload, qos=1), loop).result(timeout=timeout)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self._inflight.release()
+
+    async def _handle(self, topic: str, raw_payload: bytes):
+        self.received += 1
+        try:
+            if topic_matches_sub(Config.MQTT_TOPIC_BIN, topic):
+                await self.ingestion.process_binary_message(raw_payload, topic)
+                return
+            payload = json.loads(raw_payload)
+            await self.ingestion.process_chunk_message(payload, topic)
+        except Exception:
+            self.failed += 1
+            logger.exception("Failed to process chunk message on %s", topic)
+
+    async def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._tasks:
+            # ให้งานที่ค้างอยู่ทำต่อจนเสร็จ (หรือหมดเวลา)
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+        if self.reaper is not None:
+            self.reaper.stop()
+        if self.gap_detector is not None:
+            self.gap_detector.stop()
+        self.ingestion.close()
+        await AsyncRedisClient.close()
+        logger.info("Async MQTT consumer stopped")
+
+    def stats(self) -> dict:
+        return {
+            "engine": "async",
+            "inflight": len(self._tasks),
+            "max_inflight": Config.ASYNC_MAX_INFLIGHT,
+            "received": self.received,
+            "failed": self.failed,
+            "device_cache": self.ingestion.devices.stats(),
+            "recently_processed": self.ingestion.recent.stats(),
+            "reaper": self.reaper.stats() if self.reaper is not None else None,
+            "gap_detector": self.gap_detector.stats() if self.gap_detector is not None else None,
+            "image_writer": self.ingestion.writer.stats() if self.ingestion.writer is not None else None,
+            "raw_events": self.ingestion.events.stats() if self.ingestion.events is not None else None,
+        }
@@ -1,9 +1,13 @@
 # app/services/chunk_assembler.py
-import base64
+import asyncio
+import enum
 import time
 import logging
 from typing import Optional, List
 
+from app import metrics
+from app.config import Config
+from app.services.admission import ADMISSION_LUA_FN, ADMISSION_STATS_KEY, ADMIT_LUA, AdmissionLimits, bucket_key
 from app.services.redis_client import RedisClient
 
 logger = logging.getLogger("chunk_assembler")
@@ -12,6 +16,14 @@ logger = logging.getLogger("chunk_assembler")
 CHUNK_TTL_SECONDS = 300  # 5 นาที
 PROCESSED_TTL_SECONDS = 3600  # เก็บว่า process เสร็จแล้ว 1 ชั่วโมง
 
+# รูปแบบเก็บ partial ใน Redis
+STORAGE_HASH = "hash"      # hash index -> chunk bytes (เดิม)
+STORAGE_OFFSET = "offset"  # string เดียว เขียน chunk ที่ byte offset ของมัน + bitmap ของ index ที่ได้รับ
+
+# sorted set ของ image ที่ยังรับ chunk ไม่ครบ: member = image_id, score = last_update
+# ใช้หา partial ที่ค้างนานโดยไม่ต้อง SCAN ทั้ง keyspace
+INFLIGHT_KEY = "image_inflight"
+
 def _chunks_key(image_id: str) -> str:
     return f"image_chunks:{image_id}"
 
@@ -21,36 +33,332 @@ def _meta_key(image_id: str) -> str:
 def _processed_key(image_id: str) -> str:
     return f"processed:{image_id}"
 
+def _buf_key(image_id: str) -> str:
+    return f"image_buf:{image_id}"
+
+def _bits_key(image_id: str) -> str:
+    return f"image_bits:{image_id}"
+
+def _partial_keys(image_id: str) -> List[str]:
+    return [_chunks_key(image_id), _meta_key(image_id), _buf_key(image_id), _bits_key(image_id)]
+
+
+# รับ chunk ทั้งขั้นตอนใน round-trip เดียว (atomic บน Redis):
+# dedupe -> admission (token bucket ต่อกล้อง) -> reconcile total -> store chunk -> refresh TTL
+# -> check complete -> acquire assemble lock
+# KEYS: processed, meta, chunks, lock, inflight, admission bucket, admission stats
+# ARGV: index, total, data, now, chunk_ttl, lock_ttl, image_id, camera_uid,
+#       chunk_rate, chunk_burst, byte_rate, byte_burst
+# return {status, stored, needed} (status 5: stored = ms ที่ต้องรอ)
+_INGEST_CHUNK_LUA = ADMISSION_LUA_FN + """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return {0, 0, 0}
+end
+local wait = admit(KEYS[#KEYS - 1], KEYS[#KEYS], ARGV[8], string.len(ARGV[3]),
+  tonumber(ARGV[9]), tonumber(ARGV[10]), tonumber(ARGV[11]), tonumber(ARGV[12]))
+if wait > 0 then
+  return {5, wait, 0}
+end
+local needed = tonumber(redis.call('HGET', KEYS[2], 'total'))
+if needed == nil then
+  needed = tonumber(ARGV[2])
+  redis.call('HSET', KEYS[2], 'total', ARGV[2], 'last_update', ARGV[4], 'camera', ARGV[8])
+else
+  redis.call('HSET', KEYS[2], 'last_update', ARGV[4])
+end
+if tonumber(ARGV[1]) >= needed then
+  -- total ของ chunk นี้ไม่ตรงกับที่บันทึกไว้: ไม่เก็บและไม่นับ (ไม่งั้นครบ "ปลอม" แล้ว assemble ไม่ได้)
+  return {1, redis.call('HLEN', KEYS[3]), needed}
+end
+redis.call('HSETNX', KEYS[3], ARGV[1], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('ZADD', KEYS[5], ARGV[4], ARGV[7])
+local stored = redis.call('HLEN', KEYS[3])
+if stored < needed then
+  return {1, stored, needed}
+end
+if redis.call('SET', KEYS[4], '1', 'NX', 'EX', ARGV[6]) then
+  return {2, stored, needed}
+end
+return {3, stored, needed}
+"""
+
+
+# เหมือนข้างบนแต่สำหรับ STORAGE_OFFSET: chunk ทุกตัว (ยกเว้นตัวสุดท้าย) ต้องยาวเท่ากัน = chunk_size
+# ซึ่งรู้จาก chunk แรกที่ไม่ใช่ตัวสุดท้าย; ถ้าตัวสุดท้ายมาก่อนจะพักไว้ใน meta field "tail"
+# KEYS: processed, meta, buf, bits, lock, inflight, admission bucket, admission stats
+# ARGV: เหมือน _INGEST_CHUNK_LUA
+# return {status, stored, needed}
+_INGEST_CHUNK_OFFSET_LUA = ADMISSION_LUA_FN + """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return {0, 0, 0}
+end
+local wait = admit(KEYS[#KEYS - 1], KEYS[#KEYS], ARGV[8], string.len(ARGV[3]),
+  tonumber(ARGV[9]), tonumber(ARGV[10]), tonumber(ARGV[11]), tonumber(ARGV[12]))
+if wait > 0 then
+  return {5, wait, 0}
+end
+local index = tonumber(ARGV[1])
+local needed = tonumber(redis.call('HGET', KEYS[2], 'total'))
+if needed == nil then
+  needed = tonumber(ARGV[2])
+  redis.call('HSET', KEYS[2], 'total', ARGV[2], 'last_update', ARGV[4], 'camera', ARGV[8])
+else
+  redis.call('HSET', KEYS[2], 'last_update', ARGV[4])
+end
+redis.call('ZADD', KEYS[6], ARGV[4], ARGV[7])
+if index >= needed then
+  return {1, redis.call('BITCOUNT', KEYS[4]), needed}
+end
+if redis.call('GETBIT', KEYS[4], index) == 0 then
+  local len = string.len(ARGV[3])
+  local chunk_size = tonumber(redis.call('HGET', KEYS[2], 'chunk_size'))
+  if index < needed - 1 then
+    if chunk_size == nil then
+      chunk_size = len
+      redis.call('HSET', KEYS[2], 'chunk_size', len)
+      local tail = redis.call('HGET', KEYS[2], 'tail')
+      if tail then
+        redis.call('SETRANGE', KEYS[3], (needed - 1) * chunk_size, tail)
+        redis.call('HDEL', KEYS[2], 'tail')
+      end
+    elseif chunk_size ~= len then
+      return {4, redis.call('BITCOUNT', KEYS[4]), needed}
+    end
+    redis.call('SETRANGE', KEYS[3], index * chunk_size, ARGV[3])
+  elseif needed == 1 then
+    redis.call('SET', KEYS[3], ARGV[3])
+  elseif chunk_size == nil then
+    redis.call('HSET', KEYS[2], 'tail', ARGV[3])
+  else
+    redis.call('SETRANGE', KEYS[3], index * chunk_size, ARGV[3])
+  end
+  redis.call('SETBIT', KEYS[4], index, 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('EXPIRE', KEYS[4], ARGV[5])
+local stored = redis.call('BITCOUNT', KEYS[4])
+if stored < needed then
+  return {1, stored, needed}
+end
+if redis.call('SET', KEYS[5], '1', 'NX', 'EX', ARGV[6]) then
+  return {2, stored, needed}
+end
+return {3, stored, needed}
+"""
+
+
+# ลบ partial ของ image ที่ค้างเกิน cutoff (ตรวจ score ซ้ำใน script: ถ้ามี chunk ใหม่เข้ามาระหว่างนั้นจะไม่ลบ)
+# KEYS: inflight, chunks, meta, buf, bits
+# ARGV: image_id, cutoff
+# return จำนวน bytes ของ chunk data ที่ลบ, -1 ถ้าไม่ได้ลบ
+_REAP_PARTIAL_LUA = """
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then
+  return -1
+end
+local bytes = redis.call('STRLEN', KEYS[4])
+for _, chunk in ipairs(redis.call('HVALS', KEYS[2])) do
+  bytes = bytes + string.len(chunk)
+end
+local tail = redis.call('HGET', KEYS[3], 'tail')
+if tail then
+  bytes = bytes + string.len(tail)
+end
+redis.call('DEL', KEYS[2], KEYS[3], KEYS[4], KEYS[5])
+redis.call('ZREM', KEYS[1], ARGV[1])
+return bytes
+"""
+
+
+# ขอ resend ได้ไม่เกิน max_attempts ครั้ง และห่างกันอย่างน้อย cooldown วินาที (กันหลาย replica ส่งซ้ำกัน)
+# KEYS: meta
+# ARGV: now, cooldown, max_attempts
+# return attempt ที่ได้ (1..max_attempts) หรือ 0 ถ้าไม่ต้องส่ง
+_CLAIM_RESEND_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  return 0
+end
+local last = tonumber(redis.call('HGET', KEYS[1], 'resend_at') or '0')
+if tonumber(ARGV[1]) - last < tonumber(ARGV[2]) then
+  return 0
+end
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'resend_count') or '0')
+if attempts >= tonumber(ARGV[3]) then
+  return 0
+end
+redis.call('HSET', KEYS[1], 'resend_at', ARGV[1], 'resend_count', attempts + 1)
+return attempts + 1
+"""
+
+
+class IngestResult(enum.IntEnum):
+    DUPLICATE = 0  # image นี้ process ไปแล้ว
+    STORED = 1     # เก็บ chunk แล้ว ยังไม่ครบ
+    READY = 2      # ครบแล้วและได้ assemble lock -> caller ต้อง assemble + release lock
+    LOCKED = 3     # ครบแล้วแต่ worker อื่นถือ lock อยู่
+    INVALID = 4    # ขนาด chunk ไม่ตรงกับ chunk_size (STORAGE_OFFSET) -> partial ใช้ไม่ได้
+    RATE_LIMITED = 5  # กล้องส่งเกิน admission limit -> chunk ถูกทิ้ง (ไม่ได้เก็บ)
+
+
+def _ingest_keys(storage_mode: str, image_id: str, lock_name: str, camera_uid: str) -> List[str]:
+    if storage_mode == STORAGE_OFFSET:
+        return [
+            _processed_key(image_id), _meta_key(image_id), _buf_key(image_id), _bits_key(image_id), lock_name,
+            INFLIGHT_KEY, bucket_key(camera_uid), ADMISSION_STATS_KEY,
+        ]
+    return [
+        _processed_key(image_id), _meta_key(image_id), _chunks_key(image_id), lock_name,
+        INFLIGHT_KEY, bucket_key(camera_uid), ADMISSION_STATS_KEY,
+    ]
+
+
+def _ingest_args(index, total, data, lock_ttl, image_id, camera_uid, limits: AdmissionLimits) -> list:
+    return [
+        index, total, data, int(time.time()), CHUNK_TTL_SECONDS, lock_ttl, image_id, camera_uid, *limits.args()
+    ]
+
+
+def _ingest_result(image_id: str, index: int, total: int, size: int, reply) -> IngestResult:
+    status, stored, needed = reply
+    result = IngestResult(int(status))
+    metrics.RESULT_BY_STATUS[result.name.lower()].inc()
+    if result is IngestResult.RATE_LIMITED:
+        logger.debug("Rate limited chunk %d/%d (%d bytes) for image %s", index + 1, total, size, image_id)
+    elif result is IngestResult.INVALID:
+        logger.error(
+            "Rejected chunk %d/%d (%d bytes) for image %s: chunk size mismatch",
+            index + 1, total, size, image_id,
+        )
+    elif result is not IngestResult.DUPLICATE:
+        if index >= int(needed):
+            logger.warning("Ignoring out-of-range chunk %d for image %s (total=%s)", index, image_id, needed)
+        if int(needed) != total:
+            logger.warning("Mismatch total for image %s: previous=%s new=%s", image_id, needed, total)
+        logger.debug(
+            "Image %s chunk %d/%d stored (received=%d)", image_id, index + 1, int(needed), int(stored)
+        )
+    return result
+
+
+def _join_chunks(image_id: str, total: int, raw_chunks: dict) -> Optional[bytes]:
+    # Normalize keys to int
+    indexed: List[Optional[bytes]] = [None] * total
+    for key, val in raw_chunks.items():
+        try:
+            idx = int(key)
+            indexed[idx] = val
+        except Exception:
+            logger.warning("Non-int chunk key for image %s: %s", image_id, key)
+
+    if any(c is None for c in indexed):
+        logger.error("Missing some chunks for image %s even though counts match", image_id)
+        return None
+
+    # chunk ถูก decode ตั้งแต่ตอนรับแล้ว แค่ต่อกัน
+    return b"".join(indexed)
+
+
+def _missing_from_bitmap(bits: Optional[bytes], total: int) -> List[int]:
+    # bit 0 ของ Redis bitmap คือ MSB ของ byte แรก
+    bits = bits or b""
+    missing = []
+    for index in range(total):
+        byte = bits[index >> 3] if (index >> 3) < len(bits) else 0
+        if not (byte >> (7 - (index & 7))) & 1:
+            missing.append(index)
+    return missing
+
+
+def _check_offset_buffer(image_id: str, total, stored: int, buf: Optional[bytes]) -> Optional[bytes]:
+    if total is None or buf is None:
+        logger.error("No metadata/buffer for image %s; cannot assemble", image_id)
+        return None
+    if stored < int(total):
+        logger.debug("Image %s incomplete: have %d / %s", image_id, stored, total)
+        return None
+    return buf
+
 
 class ChunkAssembler:
     def __init__(self):
         self.redis = RedisClient.get_client()
+        self.storage_mode = Config.CHUNK_STORAGE_MODE
+        self.limits = AdmissionLimits.from_config()
+        self._admit_script = self.redis.register_script(ADMIT_LUA)
+        if self.storage_mode == STORAGE_OFFSET:
+            self._ingest_script = self.redis.register_script(_INGEST_CHUNK_OFFSET_LUA)
+        else:
+            self._ingest_script = self.redis.register_script(_INGEST_CHUNK_LUA)
+        self._reap_script = self.redis.register_script(_REAP_PARTIAL_LUA)
+        self._claim_resend_script = self.redis.register_script(_CLAIM_RESEND_LUA)
 
     def already_processed(self, image_id: str) -> bool:
         return bool(self.redis.exists(_processed_key(image_id)))
 
+    def set_expected_checksum(self, image_id: str, sha256: str):
+        """
+        sha256 ของทั้งภาพที่กล้องส่งมากับ chunk ใดก็ได้ (เก็บใน meta ของ partial, หมดอายุพร้อมกัน)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(_meta_key(image_id), "sha256", sha256)
+        pipe.expire(_meta_key(image_id), CHUNK_TTL_SECONDS)
+        pipe.execute()
+
+    def expected_checksum(self, image_id: str) -> Optional[str]:
+        value = self.redis.hget(_meta_key(image_id), "sha256")
+        return value.decode() if value else None
+
     def mark_processed(self, image_id: str):
         # ตั้ง flag ว่าเสร็จแล้ว พร้อม TTL
         try:
-            self.redis.set(_processed_key(image_id), "1", ex=PROCESSED_TTL_SECONDS)
-            # ล้าง chunk ข้างหลังถ้าต้องการ (optional)
-            self.redis.delete(_chunks_key(image_id))
-            self.redis.delete(_meta_key(image_id))
+            with metrics.REDIS_MARK_PROCESSED.time():
+                self.redis.set(_processed_key(image_id), "1", ex=PROCESSED_TTL_SECONDS)
+                # ล้าง chunk ข้างหลังถ้าต้องการ (optional)
+                self.discard(image_id)
         except Exception as e:
             logger.warning("Failed to mark processed for %s: %s", image_id, e)
 
-    def add_chunk(self, image_id: str, index: int, total: int, data_b64: str) -> bool:
+    def discard(self, image_id: str):
+        """
+        ลบ partial ทั้งหมดของ image (ทั้งแบบ hash และ offset)
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(*_partial_keys(image_id))
+        pipe.zrem(INFLIGHT_KEY, image_id)
+        pipe.execute()
+
+    def admit(self, camera_uid: str, size: int) -> bool:
+        """
+        ตรวจ admission limit แยก (สำหรับ add_chunk; ingest_chunk ตรวจใน script เดียวกันอยู่แล้ว)
+        """
+        if not self.limits.enabled:
+            return True
+        wait = int(self._admit_script(
+            keys=[bucket_key(camera_uid), ADMISSION_STATS_KEY], args=[camera_uid, size, *self.limits.args()]
+        ))
+        if 0 < wait <= self.limits.max_defer_ms:
+            time.sleep(wait / 1000.0)
+            wait = int(self._admit_script(
+                keys=[bucket_key(camera_uid), ADMISSION_STATS_KEY], args=[camera_uid, size, *self.limits.args()]
+            ))
+        return wait == 0
+
+    def add_chunk(self, image_id: str, index: int, total: int, data: bytes, camera_uid: str = "") -> bool:
         """
-        เก็บ chunk, คืนค่า True ถ้าครบทั้งหมดแล้ว (พร้อมประกอบ)
+        เก็บ chunk (raw bytes ที่ decode แล้ว), คืนค่า True ถ้าครบทั้งหมดแล้ว (พร้อมประกอบ)
         """
         pipe = self.redis.pipeline()
         chunks_key = _chunks_key(image_id)
         meta_key = _meta_key(image_id)
 
         # ถ้าเพิ่งเริ่ม: บันทึก total และ last_update
+        now = int(time.time())
         existing_total = self.redis.hget(meta_key, "total")
         if existing_total is None:
-            pipe.hset(meta_key, mapping={"total": total, "last_update": int(time.time())})
+            pipe.hset(meta_key, mapping={"total": total, "last_update": now, "camera": camera_uid})
         else:
             # ถ้ามี total อยู่แล้ว แต่ไม่ตรง ให้ log (แต่เอา original)
             try:
@@ -61,14 +369,15 @@ class ChunkAssembler:
                     )
             except Exception:
                 pass
-            pipe.hset(meta_key, "last_update", int(time.time()))
+            pipe.hset(meta_key, "last_update", now)
 
-        # เก็บ chunk (field name เป็น index)
-        pipe.hset(chunks_key, index, data_b64)
+        # เก็บ chunk (field name เป็น index); chunk ซ้ำไม่เขียนทับ ให้ตรงกับ hash ที่คำนวณระหว่างรับ
+        pipe.hsetnx(chunks_key, index, data)
 
         # ตั้ง expiration ทั้งคู่ (refresh)
         pipe.expire(chunks_key, CHUNK_TTL_SECONDS)
         pipe.expire(meta_key, CHUNK_TTL_SECONDS)
+        pipe.zadd(INFLIGHT_KEY, {image_id: now})
 
         pipe.execute()
 
@@ -85,10 +394,38 @@ class ChunkAssembler:
 
         return stored >= needed
 
+    def ingest_chunk(
+        self, image_id: str, index: int, total: int, data: bytes, lock_name: str, lock_ttl: int = 30,
+        camera_uid: str = "",
+    ) -> IngestResult:
+        """
+        เหมือน already_processed + add_chunk + acquire_lock แต่ทำใน Lua script เดียว (1 round-trip)
+        """
+        keys = _ingest_keys(self.storage_mode, image_id, lock_name, camera_uid)
+        start = time.perf_counter()
+        reply = self._ingest_script(
+            keys=keys, args=_ingest_args(index, total, data, lock_ttl, image_id, camera_uid, self.limits)
+        )
+        metrics.REDIS_INGEST.observe(time.perf_counter() - start)
+        if int(reply[0]) == IngestResult.RATE_LIMITED and 0 < int(reply[1]) <= self.limits.max_defer_ms:
+            # ADMISSION_MODE=defer: รอจน bucket เติม token แล้วลองอีกครั้งเดียว
+            time.sleep(int(reply[1]) / 1000.0)
+            reply = self._ingest_script(
+                keys=keys, args=_ingest_args(index, total, data, lock_ttl, image_id, camera_uid, self.limits)
+            )
+        return _ingest_result(image_id, index, total, len(data), reply)
+
     def assemble(self, image_id: str) -> Optional[bytes]:
         """
         รวมชิ้นส่วนเป็นภาพเดียว ถ้าครบแล้ว คืน image bytes ถ้าไม่ครบคืน None
         """
+        with metrics.REDIS_ASSEMBLE.time():
+            return self._assemble(image_id)
+
+    def _assemble(self, image_id: str) -> Optional[bytes]:
+        if self.storage_mode == STORAGE_OFFSET:
+            return self._assemble_offset(image_id)
+
         chunks_key = _chunks_key(image_id)
         meta_key = _meta_key(image_id)
 
@@ -109,40 +446,176 @@ class ChunkAssembler:
 
         # ดึงทุก chunk ตาม index เรียง
         raw_chunks = self.redis.hgetall(chunks_key)  # keys are bytes of index or str
-        # Normalize keys to int
-        indexed: List[Optional[str]] = [None] * total
-        for key, val in raw_chunks.items():
-            try:
-                idx = int(key)
-                indexed[idx] = val.decode() if isinstance(val, bytes) else val
-            except Exception:
-                logger.warning("Non-int chunk key for image %s: %s", image_id, key)
+        return _join_chunks(image_id, total, raw_chunks)
 
-        if any(c is None for c in indexed):
-            logger.error("Missing some chunks for image %s even though counts match", image_id)
-            return None
+    def _assemble_offset(self, image_id: str) -> Optional[bytes]:
+        # buffer อยู่ในตำแหน่งที่ถูกต้องแล้ว: GET เดียวได้ bytes พร้อมอัปโหลด
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(_meta_key(image_id), "total")
+        pipe.bitcount(_bits_key(image_id))
+        pipe.get(_buf_key(image_id))
+        total, stored, buf = pipe.execute()
+        return _check_offset_buffer(image_id, total, stored, buf)
 
-        # รวม base64 แล้ว decode
-        try:
-            full_bytes = b"".join(base64.b64decode(c) for c in indexed)
-            return full_bytes
-        except Exception as e:
-            logger.exception("Failed to decode/assemble image %s: %s", image_id, e)
+    def cleanup_stale(self, max_age_seconds: int = CHUNK_TTL_SECONDS, batch_size: int = 100) -> dict:
+        """
+        ล้าง partials ที่ last_update เก่ากว่า max_age_seconds โดยอ่านจาก INFLIGHT_KEY
+        (ZRANGEBYSCORE เฉพาะตัวที่หมดอายุ, O(log N) ต่อ image) แทนการ SCAN ทุก image_meta:*
+
+        image ที่ key หมด TTL ไปเองแล้วก็ถูกลบออกจาก index ด้วย (นับใน expired, bytes = 0)
+        คืน {"reaped": จำนวนที่ลบ partial จริง, "expired": จำนวนที่หมดอายุไปเอง, "bytes": bytes ของ chunk ที่คืน}
+        """
+        cutoff = int(time.time()) - max_age_seconds
+        report = {"reaped": 0, "expired": 0, "bytes": 0}
+        while True:
+            image_ids = self.redis.zrangebyscore(INFLIGHT_KEY, "-inf", cutoff, start=0, num=batch_size)
+            if not image_ids:
+                break
+            for raw_id in image_ids:
+                image_id = raw_id.decode() if isinstance(raw_id, bytes) else raw_id
+                freed = int(self._reap_script(
+                    keys=[INFLIGHT_KEY, _chunks_key(image_id), _meta_key(image_id), _buf_key(image_id), _bits_key(image_id)],
+                    args=[image_id, cutoff],
+                ))
+                if freed < 0:
+                    continue  # มี chunk ใหม่เข้ามา
+                if freed > 0:
+                    report["reaped"] += 1
+                    report["bytes"] += freed
+                    logger.info("Cleaning stale partial image %s (%d bytes)", image_id, freed)
+                else:
+                    report["expired"] += 1
+            if len(image_ids) < batch_size:
+                break
+        return report
+
+    def stalled_partials(self, idle_seconds: int, limit: int = 100) -> List[str]:
+        """
+        image_id ที่ไม่มี chunk ใหม่มาแล้วอย่างน้อย idle_seconds แต่ยังไม่หมด TTL
+        """
+        now = int(time.time())
+        image_ids = self.redis.zrangebyscore(
+            INFLIGHT_KEY, now - CHUNK_TTL_SECONDS, now - idle_seconds, start=0, num=limit
+        )
+        return [i.decode() if isinstance(i, bytes) else i for i in image_ids]
+
+    def claim_resend(self, image_id: str, cooldown_seconds: int, max_attempts: int) -> int:
+        """
+        จองสิทธิ์ส่ง resend request ของ image นี้ คืนเลข attempt หรือ 0 ถ้ายังไม่ถึงเวลา/ขอครบแล้ว
+        """
+        return int(self._claim_resend_script(
+            keys=[_meta_key(image_id)], args=[int(time.time()), cooldown_seconds, max_attempts]
+        ))
+
+    def missing_chunks(self, image_id: str):
+        """
+        คืน (camera_uid, total, [index ที่ยังไม่ได้รับ]) หรือ None ถ้า partial หายไปแล้ว
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hmget(_meta_key(image_id), "total", "camera")
+        if self.storage_mode == STORAGE_OFFSET:
+            pipe.get(_bits_key(image_id))
+        else:
+            pipe.hkeys(_chunks_key(image_id))
+        (total, camera), received = pipe.execute()
+        if total is None:
             return None
+        total = int(total)
+        camera = camera.decode() if isinstance(camera, bytes) else (camera or "")
+        if self.storage_mode == STORAGE_OFFSET:
+            return camera, total, _missing_from_bitmap(received, total)
+        have = {int(k) for k in received}
+        return camera, total, [i for i in range(total) if i not in have]
 
-    def cleanup_stale(self, max_age_seconds: int = CHUNK_TTL_SECONDS):
+    def inflight_stats(self) -> dict:
         """
-        ล้าง partials เก่าที่ last_update เก่าเกิน (ต้องเรียกเป็น periodical ถ้าต้องการ)
+        จำนวน image ที่รับ chunk ไม่ครบ และอายุ (วินาทีตั้งแต่ chunk ล่าสุด) ของตัวที่ค้างนานที่สุด
         """
-        # ถ้าอยาก implement: scan สำหรับ meta keys แล้วลบที่เก่า
-        for key in self.redis.scan_iter("image_meta:*"):
-            try:
-                meta = self.redis.hgetall(key)
-                last_update = int(meta.get(b"last_update", 0) if isinstance(meta.get(b"last_update", 0), bytes) else meta.get("last_update", 0))
-                image_id = key.decode().split(":", 1)[1] if isinstance(key, bytes) else key.split(":", 1)[1]
-                if time.time() - last_update > max_age_seconds:
-                    logger.info("Cleaning stale partial image %s", image_id)
-                    self.redis.delete(_chunks_key(image_id))
-                    self.redis.delete(_meta_key(image_id))
-            except Exception:
-                continue
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zcard(INFLIGHT_KEY)
+        pipe.zrange(INFLIGHT_KEY, 0, 0, withscores=True)
+        count, oldest = pipe.execute()
+        oldest_age = int(time.time() - oldest[0][1]) if oldest else 0
+        return {"count": count, "oldest_age_seconds": max(oldest_age, 0)}
+
+
+class AsyncChunkAssembler:
+    """
+    ChunkAssembler สำหรับ async engine (redis.asyncio); ใช้ Lua script เดียวกันเสมอ
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.storage_mode = Config.CHUNK_STORAGE_MODE
+        self.limits = AdmissionLimits.from_config()
+        if self.storage_mode == STORAGE_OFFSET:
+            self._ingest_script = self.redis.register_script(_INGEST_CHUNK_OFFSET_LUA)
+        else:
+            self._ingest_script = self.redis.register_script(_INGEST_CHUNK_LUA)
+
+    async def ingest_chunk(
+        self, image_id: str, index: int, total: int, data: bytes, lock_name: str, lock_ttl: int = 30,
+        camera_uid: str = "",
+    ) -> IngestResult:
+        keys = _ingest_keys(self.storage_mode, image_id, lock_name, camera_uid)
+        start = time.perf_counter()
+        reply = await self._ingest_script(
+            keys=keys, args=_ingest_args(index, total, data, lock_ttl, image_id, camera_uid, self.limits)
+        )
+        metrics.REDIS_INGEST.observe(time.perf_counter() - start)
+        if int(reply[0]) == IngestResult.RATE_LIMITED and 0 < int(reply[1]) <= self.limits.max_defer_ms:
+            await asyncio.sleep(int(reply[1]) / 1000.0)
+            reply = await self._ingest_script(
+                keys=keys, args=_ingest_args(index, total, data, lock_ttl, image_id, camera_uid, self.limits)
+            )
+        return _ingest_result(image_id, index, total, len(data), reply)
+
+    async def assemble(self, image_id: str) -> Optional[bytes]:
+        with metrics.REDIS_ASSEMBLE.time():
+            return await self._assemble(image_id)
+
+    async def _assemble(self, image_id: str) -> Optional[bytes]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(_meta_key(image_id), "total")
+            if self.storage_mode == STORAGE_OFFSET:
+                pipe.bitcount(_bits_key(image_id))
+                pipe.get(_buf_key(image_id))
+                total, stored, buf = await pipe.execute()
+                return _check_offset_buffer(image_id, total, stored, buf)
+            pipe.hgetall(_chunks_key(image_id))
+            total, raw_chunks = await pipe.execute()
+
+        if total is None:
+            logger.error("No metadata for image %s; cannot assemble", image_id)
+            return None
+        if len(raw_chunks) < int(total):
+            logger.debug("Image %s incomplete: have %d / %s", image_id, len(raw_chunks), total)
+            return None
+        return _join_chunks(image_id, int(total), raw_chunks)
+
+    async def mark_processed(self, image_id: str):
+        try:
+            with metrics.REDIS_MARK_PROCESSED.time():
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(_processed_key(image_id), "1", ex=PROCESSED_TTL_SECONDS)
+                    pipe.delete(*_partial_keys(image_id))
+                    pipe.zrem(INFLIGHT_KEY, image_id)
+                    await pipe.execute()
+        except Exception as e:
+            logger.warning("Failed to mark processed for %s: %s", image_id, e)
+
+    async def set_expected_checksum(self, image_id: str, sha256: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(_meta_key(image_id), "sha256", sha256)
+            pipe.expire(_meta_key(image_id), CHUNK_TTL_SECONDS)
+            await pipe.execute()
+
+    async def expected_checksum(self, image_id: str) -> Optional[str]:
+        value = await self.redis.hget(_meta_key(image_id), "sha256")
+        return value.decode() if value else None
+
+    async def discard(self, image_id: str):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.delete(*_partial_keys(image_id))
+            pipe.zrem(INFLIGHT_KEY, image_id)
+            await pipe.execute()
@@ -0,0 +1,109 @@
+# app/services/chunk_frame.py
+import struct
+import zlib
+from typing import NamedTuple, Optional
+
+# Binary chunk frame (topic camera/<uid>/image_bin)
+#
+# version 1 (image_id ไม่เกิน 16 bytes)
+#   offset size field
+#   0      2    magic     b"TS"
+#   2      1    version   (1)
+#   3      1    flags     bit0 = crc32 present
+#   4      16   image_id  ASCII, NUL-padded (all NUL = ไม่มี image_id ใช้ session ของกล้องแทน)
+#   20     2    index     uint16 big-endian (0-based)
+#   22     2    total     uint16 big-endian
+#   24     4    crc32     uint32 big-endian ของ data (0 ถ้าไม่ได้ตั้ง flag)
+#   28     ...  data      raw image bytes (ไม่ใช่ base64)
+#
+# version 2 (image_id ยาวได้ถึง 64 bytes เช่น UUID 36 ตัวอักษร)
+#   0      2    magic     b"TS"
+#   2      1    version   (2)
+#   3      1    flags
+#   4      1    id_len    ความยาว image_id (0 = ใช้ session ของกล้อง)
+#   5      2    index
+#   7      2    total
+#   9      4    crc32
+#   13     id_len image_id ASCII
+#   ...    ...  data
+FRAME_MAGIC = b"TS"
+FRAME_VERSION = 1
+FRAME_VERSION_LONG_ID = 2
+FLAG_CRC32 = 0x01
+IMAGE_ID_SIZE = 16
+MAX_IMAGE_ID_SIZE = 64
+
+_HEADER = struct.Struct(f"!2sBB{IMAGE_ID_SIZE}sHHI")
+HEADER_SIZE = _HEADER.size
+_HEADER_V2 = struct.Struct("!2sBBBHHI")
+HEADER_V2_SIZE = _HEADER_V2.size
+
+# index/total เป็น uint16 ใน binary frame; JSON chunk ใช้เพดานเดียวกัน
+MAX_CHUNKS = 0xFFFF
+
+
+def valid_chunk_range(index: int, total: int) -> bool:
+    """
+    index/total ที่ส่งเข้า ingest script ได้ (ติดลบ / เกิน total ทำให้ GETBIT/SETRANGE error หรือเขียนที่ offset มหาศาล)
+    """
+    return 0 < total <= MAX_CHUNKS and 0 <= index < total
+
+
+class ChunkFrame(NamedTuple):
+    image_id: Optional[str]
+    index: int
+    total: int
+    data: memoryview
+
+
+def encode_frame(
+    image_id: Optional[str], index: int, total: int, data: bytes, with_crc: bool = True
+) -> bytes:
+    """
+    Build one binary chunk frame (ใช้ทั้งฝั่ง firmware/test publisher)
+    image_id ไม่เกิน 16 bytes ได้ version 1 (header 28 bytes เดิม), ยาวกว่านั้นได้ version 2
+    """
+    raw_id = (image_id or "").encode("ascii")
+    if len(raw_id) > MAX_IMAGE_ID_SIZE:
+        raise ValueError(f"image_id longer than {MAX_IMAGE_ID_SIZE} bytes: {image_id!r}")
+    flags = FLAG_CRC32 if with_crc else 0
+    crc = zlib.crc32(data) if with_crc else 0
+    if len(raw_id) <= IMAGE_ID_SIZE:
+        header = _HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, raw_id, index, total, crc)
+    else:
+        header = _HEADER_V2.pack(FRAME_MAGIC, FRAME_VERSION_LONG_ID, flags, len(raw_id), index, total, crc) + raw_id
+    return header + data
+
+
+def decode_frame(payload: bytes) -> ChunkFrame:
+    """
+    Parse binary chunk frame; raise ValueError ถ้า header ผิดหรือ crc ไม่ตรง.
+    data ที่คืนเป็น memoryview ชี้เข้า payload เดิม (ไม่ copy)
+    """
+    if len(payload) < HEADER_V2_SIZE:
+        raise ValueError(f"frame too short ({len(payload)} bytes)")
+    if payload[:2] != FRAME_MAGIC:
+        raise ValueError(f"bad frame magic {bytes(payload[:2])!r}")
+    version = payload[2]
+    if version == FRAME_VERSION:
+        if len(payload) < HEADER_SIZE:
+            raise ValueError(f"frame too short ({len(payload)} bytes)")
+        _, _, flags, raw_id, index, total, crc = _HEADER.unpack_from(payload)
+        data_start = HEADER_SIZE
+    elif version == FRAME_VERSION_LONG_ID:
+        _, _, flags, id_len, index, total, crc = _HEADER_V2.unpack_from(payload)
+        data_start = HEADER_V2_SIZE + id_len
+        if id_len > MAX_IMAGE_ID_SIZE or len(payload) < data_start:
+            raise ValueError(f"bad image_id length {id_len}")
+        raw_id = bytes(payload[HEADER_V2_SIZE:data_start])
+    else:
+        raise ValueError(f"unsupported frame version {version}")
+    if not valid_chunk_range(index, total):
+        raise ValueError(f"bad chunk index {index}/{total}")
+
+    data = memoryview(payload)[data_start:]
+    if flags & FLAG_CRC32 and zlib.crc32(data) != crc:
+        raise ValueError(f"crc32 mismatch for chunk {index}/{total}")
+
+    image_id = raw_id.rstrip(b"\x00").decode("ascii") or None
+    return ChunkFrame(image_id=image_id, index=index, total=total, data=data)
@@ -0,0 +1,73 @@
+# app/services/chunk_hasher.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class _Entry:
+    __slots__ = ("sha", "next_index", "size", "created")
+
+    def __init__(self):
+        self.sha = hashlib.sha256()
+        self.next_index = 0
+        self.size = 0
+        self.created = time.monotonic()
+
+
+class IncrementalHasher:
+    """
+    คำนวณ sha256 ของภาพไปพร้อมกับการรับ chunk (ใน process นี้) เพื่อไม่ต้อง hash ภาพทั้งก้อนอีกรอบตอน assemble
+
+    ใช้ได้เฉพาะเมื่อ chunk มาเรียง index (กรณีปกติ: กล้องส่งตามลำดับ + worker affinity ต่อกล้อง).
+    ถ้ามีช่องว่าง (chunk มาสลับ, chunk บางตัวไปลง replica อื่น) entry จะถูกทิ้ง และ finish() คืน None
+    ให้ caller hash จาก bytes ที่ assemble แล้วแทน
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age_seconds: float = 300):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._entries: "OrderedDict[str, Optional[_Entry]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def update(self, image_id: str, index: int, data: bytes):
+        with self._lock:
+            if image_id not in self._entries:
+                if index != 0:
+                    return  # เริ่มกลาง capture: hash ต่อเนื่องไม่ได้แล้ว
+                self._prune()
+                self._entries[image_id] = _Entry()
+            entry = self._entries[image_id]
+            if entry is None or index < entry.next_index:
+                return  # เสียไปแล้ว หรือ chunk ซ้ำที่ hash ไปแล้ว
+            if index > entry.next_index:
+                self._entries[image_id] = None  # มีช่องว่าง
+                return
+            entry.sha.update(data)
+            entry.next_index += 1
+            entry.size += len(data)
+
+    def finish(self, image_id: str, total: int, size: int) -> Optional[str]:
+        """
+        คืน hex digest ถ้า hash ครบทุก chunk ตามลำดับและขนาดตรงกับภาพที่ assemble ได้, ไม่งั้น None
+        """
+        with self._lock:
+            entry = self._entries.pop(image_id, None)
+        if entry is None or entry.next_index != total or entry.size != size:
+            return None
+        return entry.sha.hexdigest()
+
+    def discard(self, image_id: str):
+        with self._lock:
+            self._entries.pop(image_id, None)
+
+    def _prune(self):
+        # entries เรียงตามเวลาสร้าง: ทิ้งตัวเก่าที่หมดอายุ / เกินจำนวน
+        now = time.monotonic()
+        while self._entries:
+            image_id, entry = next(iter(self._entries.items()))
+            expired = entry is None or now - entry.created > self.max_age_seconds
+            if not expired and len(self._entries) < self.max_entries:
+                break
+            del self._entries[image_id]
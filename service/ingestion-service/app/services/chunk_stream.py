@@ -0,0 +1,211 @@
+# app/services/chunk_stream.py
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, List
+
+import redis
+
+logger = logging.getLogger("chunk_stream")
+
+
+class PoisonMessage(Exception):
+    """
+    ข้อความที่ process ซ้ำกี่ครั้งก็ไม่ผ่าน (JSON เสีย ฯลฯ): ack ทิ้งเลย ไม่ต้องรอ redelivery
+    """
+
+
+class ChunkStream:
+    """
+    Redis Stream คั่นระหว่างการรับ MQTT กับการประกอบภาพ (INGEST_STREAM_ENABLED=true)
+
+    ฝั่งรับ: on_message แค่ XADD raw frame (topic + payload) แล้วจบ -> Redis/MinIO สะดุดไม่ทำให้ chunk หาย
+    ฝั่งประกอบ: worker ใน consumer group อ่านด้วย XREADGROUP, XACK เมื่อ handler ผ่าน; ถ้า handler
+    raise หรือ process ตายกลางทาง entry ค้างใน PEL แล้ว worker อื่นจะ XCLAIM ไปทำต่อหลัง claim_idle_ms
+
+    entry ที่ถูกส่งซ้ำครบ max_deliveries ครั้งจะถูก ack ทิ้ง (นับใน dead_lettered). stream ถูกตัดด้วย
+    MAXLEN ~ maxlen: ถ้า backlog เกินนี้ entry เก่าสุดจะหายก่อนถูกประกอบ
+
+    XADD ที่ล้มจะลองใหม่ append_retries ครั้ง (backoff สั้นๆ บน paho thread); Redis ล่มนานกว่านั้น chunk ยังหาย
+    (นับใน append_failed) และต้องพึ่ง resend ของกล้องเมื่อ Redis กลับมา
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        key: str = "ingest_chunks",
+        group: str = "assemblers",
+        maxlen: int = 100000,
+        batch_size: int = 32,
+        block_ms: int = 1000,
+        claim_idle_ms: int = 30000,
+        max_deliveries: int = 5,
+        append_retries: int = 2,
+        append_backoff: float = 0.05,
+    ):
+        self.redis = redis_client
+        self.key = key
+        self.group = group
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.append_retries = append_retries
+        self.append_backoff = append_backoff
+        self.consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+        self._stats_lock = threading.Lock()
+        self.appended = 0
+        self.append_failed = 0
+        self.processed = 0
+        self.failed = 0
+        self.claimed = 0
+        self.dead_lettered = 0
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.key, self.group, id="0", mkstream=True)
+            logger.info("Created consumer group %s on stream %s", self.group, self.key)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _count(self, name: str, n: int = 1):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    # ---------- receive side ----------
+
+    def append(self, topic: str, payload: bytes) -> bool:
+        for attempt in range(self.append_retries + 1):
+            try:
+                self.redis.xadd(
+                    self.key, {"topic": topic, "payload": payload}, maxlen=self.maxlen, approximate=True
+                )
+            except Exception as e:
+                if attempt < self.append_retries:
+                    # connection หลุดชั่วคราว / failover: รอสั้นๆ แล้วลองใหม่ (redis-py reconnect ให้เอง)
+                    time.sleep(self.append_backoff * (attempt + 1))
+                    continue
+                self._count("append_failed")
+                logger.warning("Failed appending chunk from %s to stream %s: %s", topic, self.key, e)
+                return False
+            self._count("appended")
+            return True
+
+    # ---------- assembler side ----------
+
+    def start_workers(self, handler: Callable[[str, bytes], None], workers: int):
+        self.ensure_group()
+        for i in range(workers):
+            consumer = f"{self.consumer_prefix}-{i}"
+            t = threading.Thread(
+                target=self._run, args=(handler, consumer), name=f"stream-worker-{i}", daemon=True
+            )
+            t.start()
+            self.threads.append(t)
+        logger.info(
+            "Started %d stream assembler workers on %s (group=%s, claim_idle=%sms)",
+            workers, self.key, self.group, self.claim_idle_ms,
+        )
+
+    def _run(self, handler: Callable[[str, bytes], None], consumer: str):
+        while not self._stop.is_set():
+            try:
+                entries = self._claim_stale(consumer)
+                if not entries:
+                    reply = self.redis.xreadgroup(
+                        self.group, consumer, {self.key: ">"}, count=self.batch_size, block=self.block_ms
+                    )
+                    entries = reply[0][1] if reply else []
+                for entry_id, fields in entries:
+                    self._handle(handler, entry_id, fields)
+            except redis.ResponseError as e:
+                if "NOGROUP" in str(e):
+                    # stream/group ถูกลบไป (เช่น FLUSHDB) สร้างใหม่แล้วอ่านต่อ
+                    self.ensure_group()
+                    continue
+                logger.warning("Stream worker %s error: %s", consumer, e)
+                self._stop.wait(1)
+            except Exception as e:
+                logger.warning("Stream worker %s error: %s", consumer, e)
+                self._stop.wait(1)
+
+    def _claim_stale(self, consumer: str) -> list:
+        """
+        XCLAIM entry ที่ค้างใน PEL นานเกิน claim_idle_ms (consumer เดิมตายหรือ handler ล้มเหลว)
+        """
+        pending = self.redis.xpending_range(
+            self.key, self.group, min="-", max="+", count=self.batch_size, idle=self.claim_idle_ms
+        )
+        if not pending:
+            return []
+        retry_ids = []
+        for p in pending:
+            if p["times_delivered"] >= self.max_deliveries:
+                self.redis.xack(self.key, self.group, p["message_id"])
+                self._count("dead_lettered")
+                logger.error(
+                    "Dropping stream entry %s after %d deliveries", p["message_id"], p["times_delivered"]
+                )
+            else:
+                retry_ids.append(p["message_id"])
+        if not retry_ids:
+            return []
+        claimed = self.redis.xclaim(self.key, self.group, consumer, self.claim_idle_ms, retry_ids)
+        # entry ที่ถูกตัดออกจาก stream ไปแล้ว (MAXLEN) กลับมาเป็น None
+        claimed = [(entry_id, fields) for entry_id, fields in claimed if fields]
+        self._count("claimed", len(claimed))
+        return claimed
+
+    def _handle(self, handler: Callable[[str, bytes], None], entry_id, fields: dict):
+        topic = fields.get(b"topic", b"").decode()
+        try:
+            handler(topic, fields.get(b"payload", b""))
+        except PoisonMessage as e:
+            logger.error("Dropping unprocessable stream entry %s from %s: %s", entry_id, topic, e)
+            self._count("dead_lettered")
+        except Exception:
+            # ไม่ ack: ค้างใน PEL ให้ถูก XCLAIM มาทำใหม่
+            logger.exception("Failed processing stream entry %s from %s", entry_id, topic)
+            self._count("failed")
+            return
+        else:
+            self._count("processed")
+        self.redis.xack(self.key, self.group, entry_id)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for t in self.threads:
+            t.join(timeout=timeout)
+            if t.is_alive():
+                logger.warning("Stream worker %s did not exit cleanly", t.name)
+
+    def stats(self) -> dict:
+        backlog = None
+        try:
+            groups = self.redis.xinfo_groups(self.key)
+            for g in groups:
+                name = g.get("name")
+                if (name.decode() if isinstance(name, bytes) else name) == self.group:
+                    backlog = {"pending": g.get("pending"), "lag": g.get("lag")}
+        except Exception:
+            pass
+        with self._stats_lock:
+            return {
+                "key": self.key,
+                "group": self.group,
+                "workers": len(self.threads),
+                "appended": self.appended,
+                "append_failed": self.append_failed,
+                "processed": self.processed,
+                "failed": self.failed,
+                "claimed": self.claimed,
+                "dead_lettered": self.dead_lettered,
+                "group_backlog": backlog,
+            }
@@ -0,0 +1,43 @@
+# app/services/content_index.py
+"""
+Content-addressed raw objects (RAW_OBJECT_NAMING=content)
+
+object_name ได้จาก sha256 ของภาพ ไม่ใช่จากเวลา capture: bytes เดียวกันจากกล้องเดียวกัน (ส่งซ้ำทั้งภาพ, resend หลัง timeout)
+ได้ object เดิม แถวเดิมใน image_objects และไม่ถูก process ซ้ำ. index checksum -> image_objects.id อยู่ใน Redis
+(ถ้าหลุดจาก Redis ยังหาเจอจาก unique (minio_bucket, object_name) ใน Postgres)
+
+camera_uid เป็นส่วนหนึ่งของ key: ภาพที่ bytes ตรงกันจากคนละกล้อง (ฝาปิดเลนส์ / เฟรมดำ) ยังเป็นคนละแถวของแต่ละ device
+"""
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.models.image_object import ImageObject
+
+NAMING_CAPTURE = "capture"
+NAMING_CONTENT = "content"
+
+
+def content_object_name(camera_uid: str, checksum: str, ext: str = "jpg") -> str:
+    # prefix 2 ตัวแรกกระจาย object ไม่ให้กองอยู่ prefix เดียว
+    return f"{camera_uid}/sha256/{checksum[:2]}/{checksum}.{ext}"
+
+
+def checksum_index_key(camera_uid: str, checksum: str) -> str:
+    return f"raw_checksum:{camera_uid}:{checksum}"
+
+
+def existing_object_query(bucket: str, object_name: str):
+    return select(ImageObject.id).where(
+        ImageObject.minio_bucket == bucket,
+        ImageObject.object_name == object_name,
+    )
+
+
+def parse_index_value(value) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
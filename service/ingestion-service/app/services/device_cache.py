@@ -0,0 +1,89 @@
+# app/services/device_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models.device import Device
+
+
+class DeviceCache:
+    """
+    In-process cache device_uid -> devices.id (TTL + LRU จำกัดขนาด, thread-safe)
+    ชุด device เล็กและแทบไม่เปลี่ยน จึงไม่ต้อง SELECT ทุกภาพ
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_size: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, device_uid: str) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(device_uid)
+            if entry is None or entry[1] < now:
+                if entry is not None:
+                    del self._entries[device_uid]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(device_uid)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, device_uid: str, device_id: int):
+        with self._lock:
+            self._entries[device_uid] = (device_id, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(device_uid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, device_uid: str):
+        with self._lock:
+            self._entries.pop(device_uid, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _upsert_device_stmt(device_uid: str):
+    # ON CONFLICT DO NOTHING: ถ้า replica/worker อื่น insert พร้อมกัน จะไม่ error แค่ไม่ได้ RETURNING
+    return (
+        insert(Device)
+        .values(device_uid=device_uid, name=device_uid)
+        .on_conflict_do_nothing(index_elements=[Device.device_uid])
+        .returning(Device.id)
+    )
+
+
+def resolve_device_id(db, device_uid: str) -> int:
+    """
+    SELECT id, ถ้าไม่มีก็ insert (race-safe) แล้ว commit
+    """
+    device_id = db.execute(select(Device.id).where(Device.device_uid == device_uid)).scalar()
+    if device_id is not None:
+        return device_id
+    device_id = db.execute(_upsert_device_stmt(device_uid)).scalar()
+    db.commit()
+    if device_id is None:
+        # แพ้ race: อีกฝั่ง insert ไปแล้ว
+        device_id = db.execute(select(Device.id).where(Device.device_uid == device_uid)).scalar_one()
+    return device_id
+
+
+async def resolve_device_id_async(db, device_uid: str) -> int:
+    device_id = (await db.execute(select(Device.id).where(Device.device_uid == device_uid))).scalar()
+    if device_id is not None:
+        return device_id
+    device_id = (await db.execute(_upsert_device_stmt(device_uid))).scalar()
+    await db.commit()
+    if device_id is None:
+        device_id = (await db.execute(select(Device.id).where(Device.device_uid == device_uid))).scalar_one()
+    return device_id
@@ -0,0 +1,99 @@
+# app/services/dispatcher.py
+import logging
+import queue
+import threading
+import zlib
+from typing import Callable, List
+
+logger = logging.getLogger("dispatcher")
+
+_STOP = object()
+
+
+class ChunkDispatcher:
+    """
+    ส่งงานจาก MQTT network thread ไปให้ worker threads จำนวนจำกัด
+
+    - key เดียวกัน (เช่น camera_uid) ไปลง worker เดิมเสมอ -> chunk ของ image เดียวกันเรียงลำดับใน worker เดียว
+    - queue ต่อ worker มีขนาดจำกัด; ถ้าเต็ม submit() จะ block (backpressure ไปที่ paho) ได้นาน enqueue_timeout
+      แล้วจึงทิ้งงานนั้นและนับใน rejected
+    """
+
+    def __init__(self, handler: Callable, workers: int = 4, queue_size: int = 1000, enqueue_timeout: float = 5.0):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.enqueue_timeout = enqueue_timeout
+        self.queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads: List[threading.Thread] = []
+
+        self._stats_lock = threading.Lock()
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self):
+        for i, q in enumerate(self.queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"ingest-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+        logger.info("Started %d ingestion workers (queue_size=%d)", len(self.queues), self.queue_size)
+
+    def _queue_for(self, key: str) -> queue.Queue:
+        return self.queues[zlib.crc32(key.encode()) % len(self.queues)]
+
+    def submit(self, key: str, *args) -> bool:
+        q = self._queue_for(key)
+        try:
+            q.put(args, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            logger.warning("Worker queue full for key %s (depth=%d); dropping message", key, q.qsize())
+            return False
+        with self._stats_lock:
+            self.submitted += 1
+        return True
+
+    def _run(self, q: queue.Queue):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(*item)
+                with self._stats_lock:
+                    self.processed += 1
+            except Exception:
+                logger.exception("Ingestion worker failed to handle message")
+                with self._stats_lock:
+                    self.failed += 1
+            finally:
+                q.task_done()
+
+    def stop(self, timeout: float = 5.0):
+        # ให้ worker เคลียร์งานที่ค้างใน queue ก่อนแล้วค่อยหยุด
+        for q in self.queues:
+            try:
+                q.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.warning("Could not enqueue stop signal; worker queue still full")
+        for t in self.threads:
+            t.join(timeout=timeout)
+            if t.is_alive():
+                logger.warning("Worker %s did not exit cleanly", t.name)
+
+    def stats(self) -> dict:
+        depths = [q.qsize() for q in self.queues]
+        with self._stats_lock:
+            return {
+                "workers": len(self.queues),
+                "queue_size": self.queue_size,
+                "queue_depth": depths,
+                "queue_depth_total": sum(depths),
+                "saturated_workers": sum(1 for d in depths if d >= self.queue_size),
+                "submitted": self.submitted,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,211 @@
+# app/services/event_publisher.py
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import pika
+from pika.exceptions import AMQPError
+
+logger = logging.getLogger("event_publisher")
+
+_STOP = object()
+
+
+def raw_created_event(
+    db_image_id: int,
+    device_id: Optional[int],
+    camera_uid: str,
+    image_id: str,
+    recorded_at: datetime.datetime,
+    upload_info: dict,
+    size: int,
+    checksum: str,
+) -> dict:
+    """
+    Body ของ raw.created: มีข้อมูลครบให้ processing ไม่ต้อง query DB/MinIO เพิ่ม
+    (id + raw_object_name ตรงกับที่ RabbitMQConsumer ของ processing-service อ่านอยู่แล้ว)
+    """
+    return {
+        "id": db_image_id,
+        "device_id": device_id,
+        "camera_uid": camera_uid,
+        "source_image_id": image_id,
+        "recorded_at": recorded_at.replace(tzinfo=datetime.timezone.utc).isoformat(),
+        "bucket": upload_info.get("bucket"),
+        "raw_object_name": upload_info.get("object_name"),
+        "object_version": upload_info.get("version"),
+        "size": size,
+        "checksum": checksum,
+        "content_type": upload_info.get("content_type", "image/jpeg"),
+        "status": "pending",
+    }
+
+
+class RawEventPublisher:
+    """
+    Publish raw.created ไปที่ exchange ผ่าน connection/channel เดียวที่เปิดค้างไว้ (publisher confirms)
+    แทนการเปิด connection ใหม่ต่อ message
+
+    pika BlockingConnection ใช้ข้าม thread ไม่ได้: worker แค่ใส่ event ลง queue แล้ว thread ของ publisher
+    เป็นคน publish, รอ confirm, reconnect/retry เอง และคอย process heartbeat ตอนว่าง
+    """
+
+    def __init__(
+        self,
+        url: str,
+        exchange: str,
+        routing_key: str,
+        queue_name: Optional[str] = None,
+        max_retries: int = 5,
+        max_queued: int = 10000,
+    ):
+        self.url = url
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.queue_name = queue_name
+        self.max_retries = max_retries
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queued)
+        self._thread = threading.Thread(target=self._run, name="raw-event-publisher", daemon=True)
+        self._connection = None
+        self._channel = None
+
+        self.published = 0
+        self.inlined = 0
+        self.failed = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    def start(self):
+        self._thread.start()
+        logger.info("Raw event publisher started (exchange=%s, routing_key=%s)", self.exchange, self.routing_key)
+
+    def publish(self, event: dict, inline: Optional[bytes] = None) -> Future:
+        """
+        ส่ง event เข้าคิว (ไม่ block); Future จะได้ผลเมื่อ broker confirm แล้ว
+
+        inline: ภาพเล็กที่แนบไปกับ message ให้ processing ไม่ต้อง download จาก MinIO;
+        body = raw bytes (content_type ตาม format ของภาพ) และ field ของ event ย้ายไปอยู่ใน headers (+ inline=True)
+        """
+        fut: Future = Future()
+        try:
+            self._queue.put_nowait((event, inline, fut))
+        except queue.Full:
+            self.dropped += 1
+            logger.error("Raw event queue full, dropping raw.created for image %s", event.get("id"))
+            fut.set_exception(RuntimeError("raw event queue full"))
+        return fut
+
+    def _connect(self):
+        self._connection = pika.BlockingConnection(pika.URLParameters(self.url))
+        self._channel = self._connection.channel()
+        self._channel.exchange_declare(exchange=self.exchange, exchange_type="direct", durable=True)
+        if self.queue_name:
+            # declare/bind แบบเดียวกับ processing consumer เพื่อไม่ให้ event หายถ้า consumer ยังไม่เคยขึ้น
+            self._channel.queue_declare(queue=self.queue_name, durable=True)
+            self._channel.queue_bind(queue=self.queue_name, exchange=self.exchange, routing_key=self.routing_key)
+        self._channel.confirm_delivery()
+        logger.info("Connected to RabbitMQ for raw.created events")
+
+    def _close(self):
+        if self._connection is not None and not self._connection.is_closed:
+            try:
+                self._connection.close()
+            except Exception:
+                logger.debug("Error closing RabbitMQ connection", exc_info=True)
+        self._connection = None
+        self._channel = None
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._idle()
+                continue
+            if item is _STOP:
+                break
+            event, inline, fut = item
+            self._send(event, inline, fut)
+        self._close()
+
+    def _idle(self):
+        # ให้ pika ตอบ heartbeat ระหว่างที่ไม่มี event
+        if self._connection is None:
+            return
+        try:
+            self._connection.process_data_events(time_limit=0)
+        except AMQPError as e:
+            logger.warning("RabbitMQ connection lost while idle: %s", e)
+            self._close()
+
+    def _send(self, event: dict, inline: Optional[bytes], fut: Future):
+        if inline is None:
+            body = json.dumps(event)
+            content_type, headers = "application/json", None
+        else:
+            body = inline
+            content_type, headers = event.get("content_type", "application/octet-stream"), dict(event, inline=True)
+        properties = pika.BasicProperties(
+            content_type=content_type,
+            headers=headers,
+            delivery_mode=2,
+            message_id=str(event.get("id")),
+            timestamp=int(time.time()),
+        )
+        delay = 1.0
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                if self._channel is None:
+                    if attempt > 1:
+                        self.reconnects += 1
+                    self._connect()
+                # confirm_delivery: return หลัง broker ack, raise ถ้า nack
+                self._channel.basic_publish(
+                    exchange=self.exchange, routing_key=self.routing_key, body=body, properties=properties
+                )
+            except Exception as e:
+                # AMQPError (รวม NackError/connection lost) หรือ socket error: ต่อใหม่แล้วลองอีกครั้ง
+                logger.warning(
+                    "Publishing raw.created for image %s failed (attempt %d/%d): %r",
+                    event.get("id"), attempt, self.max_retries, e,
+                )
+                self._close()
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+                continue
+            self.published += 1
+            if inline is not None:
+                self.inlined += 1
+            logger.debug("Published raw.created for image %s", event.get("id"))
+            fut.set_result(True)
+            return
+
+        self.failed += 1
+        logger.error("Giving up publishing raw.created for image %s", event.get("id"))
+        fut.set_exception(RuntimeError(f"raw.created for image {event.get('id')} not confirmed"))
+
+    def stop(self, timeout: float = 5.0):
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Raw event queue still full at shutdown; %d events not published", self._queue.qsize())
+            return
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning("Raw event publisher did not exit cleanly")
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "inlined": self.inlined,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+            "queued": self._queue.qsize(),
+        }
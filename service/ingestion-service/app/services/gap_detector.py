@@ -0,0 +1,96 @@
+# app/services/gap_detector.py
+import json
+import logging
+import threading
+from typing import Callable
+
+from app.services.chunk_assembler import ChunkAssembler
+
+logger = logging.getLogger("gap_detector")
+
+
+class GapDetector:
+    """
+    หา partial ที่ไม่มี chunk ใหม่มานานเกิน idle_seconds แล้วส่ง resend request ไปที่ control topic ของกล้อง
+    (เช่น camera/<uid>/resend) พร้อมรายการ index ที่ยังขาด แทนการรอให้ทั้งภาพหมด TTL
+
+    publish(topic, payload) มาจาก MQTT consumer ของ engine นั้นๆ; ขอซ้ำได้ไม่เกิน max_attempts ครั้งต่อภาพ
+    ห่างกันอย่างน้อย cooldown_seconds (จองใน Redis จึงไม่ส่งซ้ำเมื่อมีหลาย replica)
+
+    payload: {"image_id": ..., "total": N, "missing": [index, ...], "attempt": k}
+    """
+
+    def __init__(
+        self,
+        assembler: ChunkAssembler,
+        publish: Callable[[str, bytes], None],
+        topic_template: str = "camera/{camera_uid}/resend",
+        interval_seconds: float = 5,
+        idle_seconds: int = 10,
+        cooldown_seconds: int = 15,
+        max_attempts: int = 3,
+    ):
+        self.assembler = assembler
+        self.publish = publish
+        self.topic_template = topic_template
+        self.interval = interval_seconds
+        self.idle_seconds = idle_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.max_attempts = max_attempts
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gap-detector", daemon=True)
+
+        self.requests = 0
+        self.requested_chunks = 0
+        self.failed = 0
+
+    def start(self):
+        self._thread.start()
+        logger.info(
+            "Gap detector started (idle=%ss, cooldown=%ss, max_attempts=%d)",
+            self.idle_seconds, self.cooldown_seconds, self.max_attempts,
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.warning("Gap detection failed: %s", e)
+
+    def run_once(self) -> int:
+        sent = 0
+        for image_id in self.assembler.stalled_partials(self.idle_seconds):
+            attempt = self.assembler.claim_resend(image_id, self.cooldown_seconds, self.max_attempts)
+            if not attempt:
+                continue
+            info = self.assembler.missing_chunks(image_id)
+            if info is None:
+                continue
+            camera_uid, total, missing = info
+            if not camera_uid or not missing:
+                continue
+            topic = self.topic_template.format(camera_uid=camera_uid)
+            payload = {"image_id": image_id, "total": total, "missing": missing, "attempt": attempt}
+            try:
+                self.publish(topic, json.dumps(payload).encode())
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Failed publishing resend request for image %s: %s", image_id, e)
+                continue
+            self.requests += 1
+            self.requested_chunks += len(missing)
+            sent += 1
+            logger.info(
+                "Requested resend of %d/%d chunks for image %s (camera %s, attempt %d)",
+                len(missing), total, image_id, camera_uid, attempt,
+            )
+        return sent
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "requested_chunks": self.requested_chunks, "failed": self.failed}
@@ -0,0 +1,90 @@
+# app/services/image_validator.py
+import struct
+from typing import NamedTuple, Optional
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"IEND\xaeB`\x82"
+
+# SOF markers ที่มีขนาดภาพ (C4 = DHT, C8 = JPG, CC = DAC ไม่ใช่ SOF)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# marker ที่ไม่มี length ตามหลัง
+_STANDALONE_MARKERS = frozenset(range(0xD0, 0xD8)) | {0x01}
+
+
+class ImageCheck(NamedTuple):
+    valid: bool
+    reason: Optional[str] = None  # None ถ้า valid
+    format: Optional[str] = None
+    width: int = 0
+    height: int = 0
+
+
+def _jpeg_dimensions(data) -> Optional[tuple]:
+    """
+    เดิน marker segment จากต้นไฟล์จนเจอ SOFn (อ่านแค่ header ไม่ decode)
+    """
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1
+            continue
+        if marker in _STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS ก่อนเจอ SOF = header เสีย
+            return None
+        (length,) = struct.unpack_from(">H", data, pos + 2)
+        if length < 2:
+            return None
+        if marker in _SOF_MARKERS:
+            if pos + 9 > end:
+                return None
+            height, width = struct.unpack_from(">HH", data, pos + 5)
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def validate_image(data, expected_sha256: Optional[str] = None, checksum: Optional[str] = None,
+                   max_pixels: int = 0) -> ImageCheck:
+    """
+    ตรวจโครงสร้างของภาพที่ประกอบเสร็จแบบถูกๆ ก่อน upload: SOI/EOI (JPEG) หรือ signature/IEND (PNG),
+    ขนาดภาพจาก header และ checksum ที่กล้องส่งมา (ถ้ามี). ไม่ decode pixel
+
+    checksum = sha256 ที่คำนวณไว้แล้วระหว่างรับ chunk (เทียบกับ expected_sha256)
+    """
+    if not data:
+        return ImageCheck(False, "empty")
+    if expected_sha256 and checksum and expected_sha256.lower() != checksum.lower():
+        return ImageCheck(False, "checksum_mismatch")
+
+    view = memoryview(data)
+    if view[:2] == JPEG_SOI:
+        fmt = "jpeg"
+        # บาง firmware เติม 0x00 ต่อท้าย buffer ของกล้อง
+        tail = bytes(view[-64:]).rstrip(b"\x00")
+        if not tail.endswith(JPEG_EOI):
+            return ImageCheck(False, "missing_eoi", fmt)
+        dims = _jpeg_dimensions(view)
+    elif view[:8] == PNG_SIGNATURE:
+        fmt = "png"
+        if bytes(view[-8:]) != PNG_IEND:
+            return ImageCheck(False, "missing_iend", fmt)
+        # IHDR เป็น chunk แรกเสมอ: length(4) type(4) width(4) height(4)
+        dims = struct.unpack_from(">II", view, 16) if len(view) >= 24 and view[12:16] == b"IHDR" else None
+    else:
+        return ImageCheck(False, "unknown_format")
+
+    if dims is None:
+        return ImageCheck(False, "bad_header", fmt)
+    width, height = dims
+    if width == 0 or height == 0:
+        return ImageCheck(False, "bad_dimensions", fmt, width, height)
+    if max_pixels and width * height > max_pixels:
+        return ImageCheck(False, "too_large", fmt, width, height)
+    return ImageCheck(True, None, fmt, width, height)
@@ -0,0 +1,208 @@
+# app/services/image_writer.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from app.database import SessionLocal
+from app.models.image_object import ImageObject, ObjectStatus
+
+logger = logging.getLogger("image_writer")
+
+_STOP = object()
+
+
+def raw_metadata(topic: str, camera_uid: str, image_id: str) -> dict:
+    # ที่มาของภาพ: object_name ของโหมด content ไม่มี image_id (และภาพซ้ำชี้มาที่แถวเดียวกัน)
+    return {"source_topic": topic, "camera_uid": camera_uid, "image_id": image_id}
+
+
+def image_object_row(
+    device_id: int, recorded_at, upload_info: dict, checksum: str, topic: str, camera_uid: str, image_id: str
+) -> dict:
+    return {
+        "device_id": device_id,
+        "recorded_at": recorded_at,
+        "minio_bucket": upload_info.get("bucket"),
+        "object_name": upload_info.get("object_name"),
+        "object_version": upload_info.get("version"),
+        "checksum": checksum,
+        "image_type": "raw",
+        "status": ObjectStatus.pending,
+        "metadata": raw_metadata(topic, camera_uid, image_id),
+    }
+
+
+def _row_key(row: dict) -> Tuple[str, str]:
+    return row["minio_bucket"], row["object_name"]
+
+
+_table = ImageObject.__table__
+
+
+def _insert_stmt(rows: List[dict]):
+    # DO NOTHING: แถวที่มีอยู่แล้วไม่ถูกแตะ (DO UPDATE แบบ no-op ยิง trigger ให้ updated_at ของแถวเดิมเปลี่ยน)
+    # RETURNING จึงคืนเฉพาะแถวที่ insert จริง; id ของแถวเดิมได้จาก _existing_ids
+    return insert(_table).values(rows).on_conflict_do_nothing(
+        index_elements=["minio_bucket", "object_name"],
+    ).returning(_table.c.id, _table.c.minio_bucket, _table.c.object_name)
+
+
+def _existing_ids(db, keys: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    """
+    id ของแถวที่ชน unique (minio_bucket, object_name) (พฤติกรรมเดิม: ใช้ id ของแถวเดิม)
+    """
+    if not keys:
+        return {}
+    rows = db.execute(
+        select(_table.c.id, _table.c.minio_bucket, _table.c.object_name).where(
+            tuple_(_table.c.minio_bucket, _table.c.object_name).in_(keys)
+        )
+    ).all()
+    return {(bucket, name): image_id for image_id, bucket, name in rows}
+
+
+class ImageObjectWriter:
+    """
+    Group-commit writer สำหรับ image_objects: รวม insert จากหลาย worker เป็น multi-row
+    INSERT ... ON CONFLICT (minio_bucket, object_name) DO NOTHING RETURNING id ทุก max_delay_ms หรือ max_rows แถว
+    แล้วคืน id ให้ผู้เรียกแต่ละคนผ่าน Future (1 transaction/fsync ต่อ batch แทนต่อภาพ)
+
+    row เป็น dict ตามชื่อ column ของตาราง (เช่น "metadata" ไม่ใช่ metadata_json)
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_rows: int = 100, max_delay_ms: float = 20):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="image-writer", daemon=True)
+
+        self.batches = 0
+        self.rows = 0
+        self.fallbacks = 0
+
+    def start(self):
+        self._thread.start()
+        logger.info("Image writer started (max_rows=%d, max_delay=%.0fms)", self.max_rows, self.max_delay * 1000)
+
+    def submit(self, row: dict) -> Future:
+        fut: Future = Future()
+        self._queue.put((row, fut))
+        return fut
+
+    def insert(self, row: dict, timeout: float = 30.0) -> int:
+        """
+        Block จนกว่า batch ที่มี row นี้ commit แล้วคืน id (raise ถ้า insert ล้มเหลว)
+
+        ถ้าเกิน timeout แต่ row ยังอยู่ใน queue จะถูกยกเลิก (ไม่มีทาง commit ทีหลัง) แล้ว raise TimeoutError
+        ให้ caller retry ได้; ถ้า row เข้า batch ไปแล้วจะรอผลจริงต่อ (ไม่งั้น retry ได้แถว/event ซ้ำ)
+        """
+        fut = self.submit(row)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            if fut.cancel():
+                raise
+            logger.warning("Image object %s still committing after %.0fs; waiting", _row_key(row), timeout)
+            return fut.result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[tuple]):
+        # รวม row ที่ key ซ้ำใน batch เดียวกันเป็น insert เดียว: RETURNING ได้ id ต่อ key แล้ว map กลับให้ทุก future ของ key นั้น
+        pending: Dict[Tuple[str, str], List[Future]] = {}
+        rows: List[dict] = []
+        for row, fut in batch:
+            # ผู้เรียกยกเลิกไปแล้ว (insert timeout) -> ไม่ insert; หลังจากนี้ cancel ไม่ได้แล้ว
+            if not fut.set_running_or_notify_cancel():
+                continue
+            key = _row_key(row)
+            if key not in pending:
+                pending[key] = []
+                rows.append(row)
+            pending[key].append(fut)
+
+        if not rows:
+            return
+        try:
+            with self.session_factory() as db:
+                ids = {(bucket, name): image_id for image_id, bucket, name in db.execute(_insert_stmt(rows)).all()}
+                ids.update(_existing_ids(db, [key for key in pending if key not in ids]))
+                db.commit()
+        except Exception as e:
+            logger.warning("Batch insert of %d image objects failed (%s); retrying row by row", len(rows), e)
+            self.fallbacks += 1
+            self._flush_rows(rows, pending)
+            return
+
+        self.batches += 1
+        self.rows += len(rows)
+        for key, futures in pending.items():
+            image_id = ids.get(key)
+            for fut in futures:
+                if image_id is None:
+                    fut.set_exception(RuntimeError(f"No id returned for image object {key}"))
+                else:
+                    fut.set_result(image_id)
+        logger.debug("Committed %d image objects in one batch", len(rows))
+
+    def _flush_rows(self, rows: List[dict], pending: Dict[Tuple[str, str], List[Future]]):
+        # แยก transaction ต่อแถว เพื่อให้แถวที่เสีย (เช่น FK device) ไม่ทำให้แถวอื่นล้มด้วย
+        for row in rows:
+            key = _row_key(row)
+            try:
+                with self.session_factory() as db:
+                    inserted = db.execute(_insert_stmt([row])).all()
+                    image_id = inserted[0][0] if inserted else _existing_ids(db, [key]).get(key)
+                    db.commit()
+                if image_id is None:
+                    raise RuntimeError(f"No id returned for image object {key}")
+            except Exception as e:
+                for fut in pending[key]:
+                    fut.set_exception(e)
+                continue
+            self.rows += 1
+            for fut in pending[key]:
+                fut.set_result(image_id)
+
+    def stop(self, timeout: float = 5.0):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            logger.warning("Image writer did not exit cleanly")
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "avg_batch_size": round(self.rows / self.batches, 2) if self.batches else 0,
+            "fallbacks": self.fallbacks,
+            "queued": self._queue.qsize(),
+        }
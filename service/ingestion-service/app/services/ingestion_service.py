@@ -1,159 +1,477 @@
 # app/services/ingestion_service.py
+import base64
+import binascii
 import datetime
 import hashlib
 import logging
+import re
+import time
 import uuid
 
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
-from app.services.chunk_assembler import ChunkAssembler
+from app import metrics
+from app.config import Config
+from app.services.chunk_assembler import CHUNK_TTL_SECONDS, ChunkAssembler, IngestResult, STORAGE_OFFSET
+from app.services.chunk_hasher import IncrementalHasher
+from app.services.content_index import (
+    NAMING_CONTENT,
+    checksum_index_key,
+    content_object_name,
+    existing_object_query,
+    parse_index_value,
+)
+from app.services.chunk_frame import decode_frame, valid_chunk_range
+from app.services.device_cache import DeviceCache, resolve_device_id
+from app.services.event_publisher import RawEventPublisher, raw_created_event
+from app.services.image_validator import ImageCheck, validate_image
+from app.services.image_writer import ImageObjectWriter, image_object_row, raw_metadata
+from app.services.processed_filter import RecentlyProcessedFilter
 from app.services.redis_client import RedisClient
 from app.services.minio_uploader import MinIOUploader
 from app.database import SessionLocal
-from app.models.device import Device
 from app.models.image_object import ImageObject, ObjectStatus
 
 logger = logging.getLogger("ingestion_service")
 
 # session per camera to generate a unique image_id when upstream only gives camera id
-SESSION_TTL_SECONDS = 60  # ถ้า capture หนึ่งใช้เวลานาน เพิ่มค่านี้ได้
+SESSION_TTL_SECONDS = 60  # นับจาก chunk ล่าสุด (ต่ออายุทุก chunk); ต้องนานกว่ารอบ resend ทั้งหมดของ gap detector
+ASSEMBLE_LOCK_TTL = 30
+
+
+_SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
+def expected_sha256_from(payload: dict):
+    """
+    sha256 (hex) ของทั้งภาพที่กล้องแนบมากับ chunk (field `sha256`, optional)
+    """
+    value = payload.get("sha256")
+    if isinstance(value, str) and _SHA256_RE.fullmatch(value):
+        return value.lower()
+    return None
+
+
+def quarantine_object_name(camera_uid: str, image_id: str, recorded_at, check: ImageCheck) -> str:
+    return f"{camera_uid}/{image_id}-{int(recorded_at.timestamp())}.{check.format or 'bin'}"
+
+
+def quarantine_metadata(camera_uid: str, image_id: str, check: ImageCheck) -> dict:
+    return {"reason": check.reason, "camera-uid": camera_uid, "image-id": image_id}
+
+
+def raw_extension(check: ImageCheck) -> str:
+    return "png" if check.format == "png" else "jpg"
+
+
+def raw_content_type(check: ImageCheck) -> str:
+    # IMAGE_VALIDATION=off ไม่รู้ format: ถือเป็น JPEG แบบเดิม
+    return "image/png" if check.format == "png" else "image/jpeg"
 
 
 def get_or_create_session_for_camera(camera_uid: str) -> str:
     r = RedisClient.get_client()
     key = f"camera_session:{camera_uid}"
-    session = r.get(key)
-    if session:
-        return session.decode() if isinstance(session, bytes) else session
     new_sess = str(uuid.uuid4())
+    # SET NX GET: ได้ session เดิมถ้ามี ไม่งั้นตั้งของใหม่ในคำสั่งเดียว
+    # (GET แล้ว SET แยกกัน race ได้เมื่อ chunk ของกล้องเดียวกันไปลงหลาย worker/replica -> ภาพถูกแบ่งเป็นสอง image_id)
     # เก็บไว้ชั่วคราว; หมดอายุแล้วถ้ามี capture ใหม่จะได้ session ใหม่
-    r.set(key, new_sess, ex=SESSION_TTL_SECONDS)
+    # GETEX ต่ออายุทุก chunk: chunk ที่ resend มาช้า (ไม่มี image_id) ยังลง session เดิม ไม่เปิด partial ใหม่ค้างไว้
+    existing = r.getex(key, ex=SESSION_TTL_SECONDS)
+    if existing is None:
+        existing = r.set(key, new_sess, ex=SESSION_TTL_SECONDS, nx=True, get=True)
+    if existing:
+        return existing.decode() if isinstance(existing, bytes) else existing
     return new_sess
 
 
+def camera_uid_from_topic(topic: str, fallback: str = None) -> str:
+    # topic รูปแบบ camera/<uid>/<kind>
+    try:
+        _, camera_uid, _ = topic.split("/")
+    except ValueError:
+        camera_uid = fallback or "unknown"
+    return camera_uid
+
+
 class IngestionService:
     def __init__(self):
         self.assembler = ChunkAssembler()
         self.uploader = MinIOUploader()
+        self.devices = DeviceCache(Config.DEVICE_CACHE_TTL_SECONDS, Config.DEVICE_CACHE_MAX_SIZE)
+        self.hasher = IncrementalHasher(max_age_seconds=CHUNK_TTL_SECONDS)
+        self.recent = RecentlyProcessedFilter(Config.PROCESSED_FILTER_TTL_SECONDS)
+        # group commit ของ image_objects (ปิดด้วย IMAGE_WRITER_ENABLED=false = commit ทีละภาพแบบเดิม)
+        self.writer = None
+        if Config.IMAGE_WRITER_ENABLED:
+            self.writer = ImageObjectWriter(
+                max_rows=Config.IMAGE_WRITER_BATCH_ROWS, max_delay_ms=Config.IMAGE_WRITER_BATCH_MS
+            )
+            self.writer.start()
+        # raw.created ไป processing-service (connection เดียวค้างไว้, publisher confirms)
+        self.events = None
+        if Config.RAW_EVENT_PUBLISH_ENABLED:
+            self.events = RawEventPublisher(
+                Config.get_rabbitmq_url(),
+                Config.RABBITMQ_EXCHANGE,
+                Config.RAW_ROUTING_KEY,
+                queue_name=Config.RABBITMQ_QUEUE_RAW,
+                max_retries=Config.RAW_EVENT_MAX_RETRIES,
+            )
+            self.events.start()
+        # offset storage ต้องใช้ script เสมอ (chunk_size/tail ต้อง update แบบ atomic)
+        self.atomic_ingest = Config.REDIS_ATOMIC_INGEST or self.assembler.storage_mode == STORAGE_OFFSET
+        self.content_addressed = Config.RAW_OBJECT_NAMING == NAMING_CONTENT
 
     def process_chunk_message(self, payload: dict, topic: str):
-        # camera id ที่กล้องส่งมา (ยังไม่ใช่ image_id จริง)
-        raw_camera_id = payload.get("id")
+        """
+        Legacy JSON chunk (camera/<uid>/image_json) ที่มี base64 ใน field `data`
+        """
+        metrics.CHUNKS_JSON.inc()
+        camera_uid = camera_uid_from_topic(topic, payload.get("id"))
+
+        # ตรวจก่อนเปิด session ของกล้อง (frame เสียไม่ควรสร้าง image_id ใหม่)
         try:
-            _, camera_uid, _ = topic.split("/")
-        except ValueError:
-            camera_uid = raw_camera_id or "unknown"
+            index = int(payload.get("index", 0))
+            total = int(payload.get("total", 0))
+        except (TypeError, ValueError):
+            index = total = -1
+        if not valid_chunk_range(index, total):
+            logger.warning(
+                "Invalid chunk index/total %r/%r for image %s (camera %s)",
+                payload.get("index"), payload.get("total"), payload.get("image_id"), camera_uid,
+            )
+            metrics.REJECTED_JSON.inc()
+            return
 
         # กำหนด image_id: ถ้า publisher ส่ง image_id จริงๆ ให้ใช้, ถ้าไม่มีก็ fallback สร้าง session per camera
         image_id = payload.get("image_id")
         if not image_id:
             image_id = get_or_create_session_for_camera(camera_uid)
 
-        index = int(payload.get("index", 0))
-        total = int(payload.get("total", 0))
         data_b64 = payload.get("data")
         if not image_id or data_b64 is None:
             logger.warning("Invalid payload, missing image_id or data; payload=%s", payload)
+            metrics.REJECTED_JSON.inc()
             return
 
-        # dedupe guard
-        if self.assembler.already_processed(image_id):
-            logger.info("Skipping already processed image %s (camera %s)", image_id, camera_uid)
+        # decode ครั้งเดียวตอนรับ แล้วเก็บ raw bytes ใน Redis
+        try:
+            data = base64.b64decode(data_b64)
+        except (binascii.Error, ValueError) as e:
+            logger.warning("Invalid base64 chunk %s for image %s (camera %s): %s", index, image_id, camera_uid, e)
+            metrics.REJECTED_JSON.inc()
             return
+        metrics.CHUNK_BYTES_JSON.inc(len(data))
 
-        # store chunk
-        complete = self.assembler.add_chunk(image_id, index, total, data_b64)
-        if not complete:
-            logger.debug("Stored chunk %d/%d for image %s (camera %s)", index + 1, total, image_id, camera_uid)
-            return  # ยังไม่ครบ
+        expected = expected_sha256_from(payload)
+        if expected and Config.IMAGE_VALIDATION != "off":
+            self.assembler.set_expected_checksum(image_id, expected)
 
-        lock_name = f"assemble:{image_id}"
-        if not RedisClient.acquire_lock(lock_name, ttl=30):
-            logger.info("Another worker is handling image %s, skipping", image_id)
+        return self.process_chunk(camera_uid, image_id, index, total, data, topic)
+
+    def process_binary_message(self, payload: bytes, topic: str):
+        """
+        Binary chunk frame (camera/<uid>/image_bin): fixed header + raw bytes, ดู chunk_frame.py
+        """
+        metrics.CHUNKS_BIN.inc()
+        camera_uid = camera_uid_from_topic(topic)
+        try:
+            frame = decode_frame(payload)
+        except ValueError as e:
+            logger.warning("Invalid binary frame on topic %s: %s", topic, e)
+            metrics.REJECTED_BIN.inc()
+            return
+        metrics.CHUNK_BYTES_BIN.inc(len(frame.data))
+
+        image_id = frame.image_id or get_or_create_session_for_camera(camera_uid)
+        return self.process_chunk(camera_uid, image_id, frame.index, frame.total, frame.data, topic)
+
+    def process_chunk(self, camera_uid: str, image_id: str, index: int, total: int, data: bytes, topic: str):
+        # chunk ซ้ำของภาพที่เพิ่งเสร็จ: ทิ้งใน memory ไม่ต้องถาม Redis
+        if image_id in self.recent:
+            metrics.RESULT_FILTERED.inc()
+            logger.debug("Dropping chunk %d for recently processed image %s (camera %s)", index, image_id, camera_uid)
             return
 
+        lock_name = f"assemble:{image_id}"
+        if self.atomic_ingest:
+            result = self.assembler.ingest_chunk(
+                image_id, index, total, data, lock_name, ASSEMBLE_LOCK_TTL, camera_uid
+            )
+            if result is IngestResult.RATE_LIMITED:
+                return  # กล้องส่งเร็วเกิน admission limit; chunk หายไปให้ gap detector ขอส่งใหม่
+            if result is IngestResult.INVALID:
+                # partial เสีย (chunk size ไม่สม่ำเสมอ) ทิ้งไปให้กล้องส่งใหม่
+                self.assembler.discard(image_id)
+                self.hasher.discard(image_id)
+                return
+            if result is IngestResult.DUPLICATE:
+                logger.info("Skipping already processed image %s (camera %s)", image_id, camera_uid)
+                self.recent.add(image_id)
+                return
+            self.hasher.update(image_id, index, data)
+            if result is IngestResult.STORED:
+                logger.debug("Stored chunk %d/%d for image %s (camera %s)", index + 1, total, image_id, camera_uid)
+                return  # ยังไม่ครบ
+            if result is IngestResult.LOCKED:
+                logger.info("Another worker is handling image %s, skipping", image_id)
+                return
+        else:
+            # นับ ingestion_chunk_results_total เหมือน _ingest_result ของ Lua path (REDIS_ATOMIC_INGEST=false)
+            # dedupe guard
+            if self.assembler.already_processed(image_id):
+                metrics.RESULT_BY_STATUS["duplicate"].inc()
+                logger.info("Skipping already processed image %s (camera %s)", image_id, camera_uid)
+                self.recent.add(image_id)
+                return
+
+            if not self.assembler.admit(camera_uid, len(data)):
+                metrics.RESULT_BY_STATUS["rate_limited"].inc()
+                logger.debug("Rate limited chunk %d/%d for image %s (camera %s)", index + 1, total, image_id, camera_uid)
+                return
+
+            # store chunk
+            complete = self.assembler.add_chunk(image_id, index, total, data, camera_uid)
+            self.hasher.update(image_id, index, data)
+            if not complete:
+                metrics.RESULT_BY_STATUS["stored"].inc()
+                logger.debug("Stored chunk %d/%d for image %s (camera %s)", index + 1, total, image_id, camera_uid)
+                return  # ยังไม่ครบ
+
+            if not RedisClient.acquire_lock(lock_name, ttl=ASSEMBLE_LOCK_TTL):
+                metrics.RESULT_BY_STATUS["locked"].inc()
+                logger.info("Another worker is handling image %s, skipping", image_id)
+                return
+            metrics.RESULT_BY_STATUS["ready"].inc()
+
+        started = time.perf_counter()
         try:
             image_bytes = self.assembler.assemble(image_id)
             if image_bytes is None:
                 logger.error("Failed to assemble image %s", image_id)
+                metrics.IMAGES_ASSEMBLE_FAILED.inc()
                 return
 
             recorded_at = datetime.datetime.utcnow()
-            # ตั้งชื่อ object แบบ unique ต่อ capture; ใช้ camera_uid เพื่อจัดโฟลเดอร์
-            object_name = f"{camera_uid}/{image_id}-{int(recorded_at.timestamp())}.jpg"
-            checksum = hashlib.sha256(image_bytes).hexdigest()
-
-            # upload to MinIO (จับ error พวก transient)
-            try:
-                upload_info = self.uploader.upload_raw_image(object_name, image_bytes)
-            except Exception as e:
-                logger.exception("Failed uploading image %s to MinIO: %s", image_id, e)
-                return  # ไม่ mark processed เพื่อให้ retry ได้
+            # hash ระหว่างรับ chunk ไปแล้ว; hash ทั้งก้อนเฉพาะถ้า chunk มาไม่เรียง
+            checksum = self.hasher.finish(image_id, total, len(image_bytes))
+            if checksum is None:
+                checksum = hashlib.sha256(image_bytes).hexdigest()
 
-            bucket = upload_info.get("bucket")
-            stored_name = upload_info.get("object_name")
-            object_version = upload_info.get("version")
+            # ภาพเสีย (ตัดท้าย / header พัง / checksum ไม่ตรง) ไม่ต้องไปถึง MinIO / DB / processing
+            check = self._validate(image_id, image_bytes, checksum)
+            if not check.valid:
+                self._reject_invalid(camera_uid, image_id, recorded_at, image_bytes, checksum, check)
+                return
 
-            # persist to DB
-            with SessionLocal() as db:
-                # get or create device safely
-                stmt = select(Device).where(Device.device_uid == camera_uid)
-                try:
-                    device = db.execute(stmt).scalars().first()
-                    if not device:
-                        device = Device(device_uid=camera_uid, name=camera_uid)
-                        db.add(device)
-                        db.commit()
-                        db.refresh(device)
-                except IntegrityError:
-                    db.rollback()
-                    device = db.execute(stmt).scalars().first()
-
-                # insert image object idempotently
-                image_obj = ImageObject(
-                    device_id=device.id,
-                    recorded_at=recorded_at,
-                    minio_bucket=bucket,
-                    object_name=stored_name,
-                    object_version=object_version,
-                    checksum=checksum,
-                    image_type="raw",
-                    status=ObjectStatus.pending,
-                    metadata={"source_topic": topic} if hasattr(ImageObject, "metadata") else {"source_topic": topic},
-                )
-                db.add(image_obj)
-                try:
-                    db.commit()
-                    db.refresh(image_obj)  # ดึง id จริงจาก DB
-                    db_image_id = image_obj.id  # ใช้ id นี้แทน UUID image_id
+            if self.content_addressed:
+                object_name = content_object_name(camera_uid, checksum, raw_extension(check))
+                existing_id = self._existing_raw_object(camera_uid, object_name, checksum)
+                if existing_id is not None:
+                    # bytes เดียวกับภาพที่เก็บแล้ว: อ้างถึงแถวเดิม ไม่ upload / insert / process ซ้ำ
                     logger.info(
-                        "Saved image object %s for camera %s (db image_id=%s, original image_id=%s)",
-                        stored_name, camera_uid, db_image_id, image_id
+                        "Image %s from camera %s is identical to stored raw image %s (db image_id=%s); skipping",
+                        image_id, camera_uid, object_name, existing_id,
                     )
-                except IntegrityError as e:
-                    db.rollback()
-                    logger.warning("Image object already exists (unique constraint) for original image_id=%s: %s", image_id, e)
-                    existing_obj = db.execute(
-                        select(ImageObject).where(
-                            ImageObject.minio_bucket == bucket,
-                            ImageObject.object_name == stored_name
-                        )
-                    ).scalar_one_or_none()
-                    if existing_obj:
-                        db_image_id = existing_obj.id
-                    else:
-                        db_image_id = None
-
-            # mark processed และลบ session mapping เพื่อให้ capture ถัดไปได้ image_id ใหม่
-            self.assembler.mark_processed(image_id)
+                    metrics.IMAGES_DEDUPLICATED.inc()
+                    self._finish_capture(camera_uid, image_id)
+                    return existing_id
+            else:
+                # ตั้งชื่อ object แบบ unique ต่อ capture; ใช้ camera_uid เพื่อจัดโฟลเดอร์
+                object_name = f"{camera_uid}/{image_id}-{int(recorded_at.timestamp())}.{raw_extension(check)}"
+
+            # upload to MinIO (จับ error พวก transient)
             try:
-                r = RedisClient.get_client()
-                r.delete(f"camera_session:{camera_uid}")
+                upload_info = self.uploader.upload_raw_image(
+                    object_name, image_bytes, content_type=raw_content_type(check), checksum=checksum
+                )
             except Exception:
-                logger.debug("Failed clearing camera session for %s", camera_uid)
+                metrics.IMAGES_UPLOAD_FAILED.inc()
+                # raise ต่อ (ไม่ mark processed, lock ถูกปล่อยใน finally): chunk ครบใน Redis แล้วจึงไม่มีใครขอ resend
+                # stream mode จะไม่ ack entry ของ chunk สุดท้าย -> XCLAIM ส่งมาใหม่ -> ingest ได้ READY แล้วประกอบอีกรอบ
+                logger.error("Failed uploading image %s to MinIO", image_id)
+                raise
+
+            with metrics.DB_COMMIT_SECONDS.time():
+                db_image_id, device_id = self._persist(camera_uid, image_id, recorded_at, upload_info, checksum, topic)
+            # หลัง commit แล้วเท่านั้น: processing จะเจอแถวใน DB เสมอ
+            self._publish_raw_created(
+                db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info, image_bytes, checksum
+            )
+            if self.content_addressed and db_image_id is not None:
+                self._remember_checksum(camera_uid, checksum, db_image_id)
+
+            self._finish_capture(camera_uid, image_id)
+            metrics.IMAGES_STORED.inc()
+            metrics.ASSEMBLY_SECONDS.observe(time.perf_counter() - started)
         finally:
             RedisClient.release_lock(lock_name)
 
         # คืนค่า db_image_id ที่เป็น integer เพื่อใช้ส่งต่อใน service อื่นๆ
         return db_image_id
+
+    def _finish_capture(self, camera_uid: str, image_id: str):
+        # mark processed และลบ session mapping เพื่อให้ capture ถัดไปได้ image_id ใหม่
+        self.assembler.mark_processed(image_id)
+        self.recent.add(image_id)
+        try:
+            r = RedisClient.get_client()
+            r.delete(f"camera_session:{camera_uid}")
+        except Exception:
+            logger.debug("Failed clearing camera session for %s", camera_uid)
+
+    def _existing_raw_object(self, camera_uid: str, object_name: str, checksum: str):
+        """
+        image_objects.id ของ raw object ที่มี checksum นี้แล้ว (Redis index ก่อน, พลาดแล้วค่อยถาม Postgres)
+        """
+        try:
+            cached = parse_index_value(RedisClient.get_client().get(checksum_index_key(camera_uid, checksum)))
+        except Exception as e:
+            logger.debug("Checksum index lookup failed for %s: %s", checksum, e)
+            cached = None
+        if cached is not None:
+            return cached
+        with SessionLocal() as db:
+            found = db.execute(existing_object_query(Config.MINIO_RAW_BUCKET, object_name)).scalar_one_or_none()
+        if found is not None:
+            self._remember_checksum(camera_uid, checksum, found)
+        return found
+
+    def _remember_checksum(self, camera_uid: str, checksum: str, db_image_id: int):
+        try:
+            RedisClient.get_client().set(
+                checksum_index_key(camera_uid, checksum), db_image_id, ex=Config.RAW_CHECKSUM_INDEX_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.debug("Failed updating checksum index for %s: %s", checksum, e)
+
+    def _validate(self, image_id: str, image_bytes: bytes, checksum: str) -> ImageCheck:
+        if Config.IMAGE_VALIDATION == "off":
+            return ImageCheck(True)
+        expected = self.assembler.expected_checksum(image_id)
+        return validate_image(image_bytes, expected, checksum, Config.IMAGE_MAX_PIXELS)
+
+    def _reject_invalid(self, camera_uid, image_id, recorded_at, image_bytes, checksum, check: ImageCheck):
+        metrics.IMAGES_INVALID.labels(check.reason).inc()
+        logger.warning(
+            "Invalid image %s from camera %s (%s, %d bytes); %s",
+            image_id, camera_uid, check.reason, len(image_bytes),
+            "quarantined" if Config.IMAGE_VALIDATION == "quarantine" else "rejected",
+        )
+        if Config.IMAGE_VALIDATION == "quarantine":
+            try:
+                self.uploader.upload_raw_image(
+                    quarantine_object_name(camera_uid, image_id, recorded_at, check), image_bytes,
+                    content_type="application/octet-stream", checksum=checksum,
+                    bucket=Config.MINIO_QUARANTINE_BUCKET, metadata=quarantine_metadata(camera_uid, image_id, check),
+                )
+                metrics.IMAGES_QUARANTINED.inc()
+            except Exception as e:
+                logger.warning("Failed quarantining image %s: %s", image_id, e)
+        else:
+            metrics.IMAGES_REJECTED.inc()
+        # ไม่ mark processed: กล้องส่งทั้งภาพใหม่ด้วย image_id เดิมได้
+        self.assembler.discard(image_id)
+        try:
+            RedisClient.get_client().delete(f"camera_session:{camera_uid}")
+        except Exception:
+            logger.debug("Failed clearing camera session for %s", camera_uid)
+
+    def _persist(self, camera_uid, image_id, recorded_at, upload_info, checksum, topic):
+        """
+        คืน (db_image_id, device_id) ที่ใช้ insert จริง (ไม่อ่าน device cache ซ้ำทีหลัง: entry อาจหมดอายุ/ถูก invalidate ไปแล้ว)
+        """
+        if self.writer is not None:
+            return self._persist_batched(camera_uid, image_id, recorded_at, upload_info, checksum, topic)
+
+        bucket = upload_info.get("bucket")
+        stored_name = upload_info.get("object_name")
+        object_version = upload_info.get("version")
+
+        with SessionLocal() as db:
+            # device_uid -> id จาก cache; query/insert เฉพาะตอน miss
+            device_id = self.devices.get(camera_uid)
+            if device_id is None:
+                device_id = resolve_device_id(db, camera_uid)
+                self.devices.put(camera_uid, device_id)
+
+            # insert image object idempotently
+            image_obj = ImageObject(
+                device_id=device_id,
+                recorded_at=recorded_at,
+                minio_bucket=bucket,
+                object_name=stored_name,
+                object_version=object_version,
+                checksum=checksum,
+                image_type="raw",
+                status=ObjectStatus.pending,
+                metadata_json=raw_metadata(topic, camera_uid, image_id),
+            )
+            db.add(image_obj)
+            try:
+                db.commit()
+                db.refresh(image_obj)  # ดึง id จริงจาก DB
+                db_image_id = image_obj.id  # ใช้ id นี้แทน UUID image_id
+                logger.info(
+                    "Saved image object %s for camera %s (db image_id=%s, original image_id=%s)",
+                    stored_name, camera_uid, db_image_id, image_id
+                )
+            except IntegrityError as e:
+                db.rollback()
+                # อาจเป็น FK ของ device ที่ถูกลบไปแล้ว -> ให้ภาพถัดไป resolve ใหม่
+                self.devices.invalidate(camera_uid)
+                logger.warning("Image object already exists (unique constraint) for original image_id=%s: %s", image_id, e)
+                existing_obj = db.execute(
+                    select(ImageObject).where(
+                        ImageObject.minio_bucket == bucket,
+                        ImageObject.object_name == stored_name
+                    )
+                ).scalar_one_or_none()
+                if existing_obj:
+                    db_image_id = existing_obj.id
+                else:
+                    db_image_id = None
+        return db_image_id, device_id
+
+    def _persist_batched(self, camera_uid, image_id, recorded_at, upload_info, checksum, topic):
+        device_id = self.devices.get(camera_uid)
+        if device_id is None:
+            with SessionLocal() as db:
+                device_id = resolve_device_id(db, camera_uid)
+            self.devices.put(camera_uid, device_id)
+
+        row = image_object_row(device_id, recorded_at, upload_info, checksum, topic, camera_uid, image_id)
+        try:
+            # TimeoutError หลุดออกไปได้: writer ยกเลิก row ให้แล้ว (ไม่ commit ทีหลัง) จึง retry capture นี้ได้โดยไม่ได้แถวซ้ำ
+            db_image_id = self.writer.insert(row)
+        except IntegrityError as e:
+            # เช่น FK ของ device ที่ถูกลบไปแล้ว -> ให้ภาพถัดไป resolve ใหม่
+            self.devices.invalidate(camera_uid)
+            logger.warning("Failed inserting image object for original image_id=%s: %s", image_id, e)
+            return None, device_id
+        logger.info(
+            "Saved image object %s for camera %s (db image_id=%s, original image_id=%s)",
+            row["object_name"], camera_uid, db_image_id, image_id
+        )
+        return db_image_id, device_id
+
+    def _publish_raw_created(
+        self, db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info, image_bytes, checksum
+    ):
+        if self.events is None or db_image_id is None:
+            return
+        event = raw_created_event(
+            db_image_id, device_id, camera_uid, image_id, recorded_at, upload_info,
+            len(image_bytes), checksum,
+        )
+        # ภาพเล็ก: แนบ bytes ไปด้วย (ยังอยู่ใน MinIO ตามปกติ)
+        inline = image_bytes if len(image_bytes) <= Config.RAW_EVENT_INLINE_MAX_BYTES else None
+        self.events.publish(event, inline=inline)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.stop()
+        if self.events is not None:
+            self.events.stop()
@@ -1,5 +1,4 @@
 # app/services/minio_uploader.py
-import io
 import hashlib
 import logging
 import os
@@ -9,6 +8,7 @@ from typing import Optional
 from minio import Minio
 from minio.error import S3Error
 from app import config as config_module  # import module to be safe
+from app import metrics
 from app.config import Config
 
 logger = logging.getLogger("minio_uploader")
@@ -27,6 +27,27 @@ def _resolve_minio_hostport() -> str:
     return ep
 
 
+class _BufferReader:
+    """
+    read()-only stream บน bytes/memoryview โดยไม่ copy ลง BytesIO ทุก attempt.
+    ถ้าอ่านทั้งก้อนจาก bytes (กรณี object เล็กกว่า part size) จะคืน object เดิมเลย
+    """
+
+    def __init__(self, data):
+        self._data = data
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        if self._pos == 0 and end == len(self._view) and isinstance(self._data, bytes):
+            chunk = self._data
+        else:
+            chunk = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
+
+
 class MinIOUploader:
     def __init__(self):
         endpoint = _resolve_minio_hostport()
@@ -37,8 +58,12 @@ class MinIOUploader:
             secret_key=getattr(Config, "MINIO_ROOT_PASSWORD", None),
             secure=secure,
         )
+        self._ensure_bucket(getattr(Config, "MINIO_RAW_BUCKET", "thermo-raw"))
+        if Config.IMAGE_VALIDATION == "quarantine":
+            self._ensure_bucket(Config.MINIO_QUARANTINE_BUCKET)
+
+    def _ensure_bucket(self, bucket: str):
         # ensure bucket exists (เงียบ ๆ ถ้าแข่งกันสร้าง)
-        bucket = getattr(Config, "MINIO_RAW_BUCKET", "thermo-raw")
         try:
             if not self.client.bucket_exists(bucket):
                 self.client.make_bucket(bucket)
@@ -49,12 +74,25 @@ class MinIOUploader:
             raise
 
     def upload_raw_image(
-        self, object_name: str, data: bytes, content_type="image/jpeg", max_retries: int = 3
+        self,
+        object_name: str,
+        data: bytes,
+        content_type="image/jpeg",
+        max_retries: int = 3,
+        checksum: Optional[str] = None,
+        bucket: Optional[str] = None,
+        metadata: Optional[dict] = None,
     ) -> dict:
-        bucket = getattr(Config, "MINIO_RAW_BUCKET", "thermo-raw")
-        checksum = hashlib.sha256(data).hexdigest()
+        """
+        อัปโหลด raw image; ส่ง checksum มาด้วยถ้าคำนวณไว้แล้ว (จะไม่ hash ซ้ำ)
+        bucket ไม่ระบุ = MINIO_RAW_BUCKET
+        """
+        bucket = bucket or getattr(Config, "MINIO_RAW_BUCKET", "thermo-raw")
+        if checksum is None:
+            checksum = hashlib.sha256(data).hexdigest()
         size = len(data)
 
+        start = time.perf_counter()
         attempt = 0
         while attempt < max_retries:
             try:
@@ -62,28 +100,25 @@ class MinIOUploader:
                 logger.debug(
                     "Uploading object %s to bucket %s (attempt %d)", object_name, bucket, attempt
                 )
-                data_stream = io.BytesIO(data)  # reset stream each try
-                etag = self.client.put_object(
+                result = self.client.put_object(
                     bucket_name=bucket,
                     object_name=object_name,
-                    data=data_stream,
+                    data=_BufferReader(data),  # stream ใหม่ทุก attempt แต่ไม่ copy data
                     length=size,
                     content_type=content_type,
+                    metadata=metadata,
                 )
 
-                object_version: Optional[str] = None
-                try:
-                    stat = self.client.stat_object(bucket, object_name)
-                    object_version = getattr(stat, "version_id", None)
-                except Exception:
-                    pass  # non-fatal if version info not available
-
+                metrics.MINIO_UPLOAD_SECONDS.observe(time.perf_counter() - start)
+                metrics.MINIO_UPLOAD_BYTES.observe(size)
+                # version/etag มากับ response ของ PUT แล้ว ไม่ต้อง stat_object ซ้ำ
                 return {
                     "bucket": bucket,
                     "object_name": object_name,
                     "checksum": checksum,
-                    "version": object_version,
-                    "etag": etag,
+                    "version": getattr(result, "version_id", None),
+                    "etag": getattr(result, "etag", None),
+                    "content_type": content_type,
                 }
             except S3Error as e:
                 logger.warning(
@@ -91,8 +126,10 @@ class MinIOUploader:
                 )
                 if attempt >= max_retries:
                     logger.error("Exceeded upload retries for %s", object_name)
+                    metrics.MINIO_UPLOAD_FAILURES.inc()
                     raise
                 time.sleep(2 ** attempt * 0.1)
             except Exception as e:
                 logger.exception("Unexpected error uploading %s: %s", object_name, e)
+                metrics.MINIO_UPLOAD_FAILURES.inc()
                 raise
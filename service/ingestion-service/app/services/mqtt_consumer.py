@@ -7,7 +7,11 @@ from urllib.parse import urlparse
 from paho.mqtt import client as mqtt_client
 
 from app.config import Config
-from app.services.ingestion_service import IngestionService
+from app.services.chunk_stream import ChunkStream, PoisonMessage
+from app.services.dispatcher import ChunkDispatcher
+from app.services.gap_detector import GapDetector
+from app.services.ingestion_service import IngestionService, camera_uid_from_topic
+from app.services.stale_reaper import StaleReaper
 
 logger = logging.getLogger("mqtt_consumer")
 
@@ -15,7 +19,48 @@ logger = logging.getLogger("mqtt_consumer")
 class MQTTConsumer:
     def __init__(self):
         self.ingestion = IngestionService()
-        self.client = mqtt_client.Client()
+        # stream mode: on_message แค่ XADD ลง Redis Stream, worker ใน consumer group ประกอบภาพ
+        self.stream = None
+        if Config.INGEST_STREAM_ENABLED:
+            self.stream = ChunkStream(
+                self.ingestion.assembler.redis,
+                key=Config.INGEST_STREAM_KEY,
+                group=Config.INGEST_STREAM_GROUP,
+                maxlen=Config.INGEST_STREAM_MAXLEN,
+                batch_size=Config.INGEST_STREAM_BATCH,
+                claim_idle_ms=Config.INGEST_STREAM_CLAIM_IDLE_MS,
+                max_deliveries=Config.INGEST_STREAM_MAX_DELIVERIES,
+            )
+        # Redis/MinIO/Postgres ทำใน worker pool ไม่ใช่บน paho network thread (INGEST_WORKERS=0 = ทำ inline แบบเดิม)
+        self.dispatcher = None
+        if self.stream is None and Config.INGEST_WORKERS > 0:
+            # handler ปล่อย exception ออกไปให้ dispatcher นับใน failed
+            self.dispatcher = ChunkDispatcher(
+                self.process_message,
+                workers=Config.INGEST_WORKERS,
+                queue_size=Config.INGEST_QUEUE_SIZE,
+                enqueue_timeout=Config.INGEST_ENQUEUE_TIMEOUT,
+            )
+        self.reaper = None
+        if Config.REAPER_INTERVAL_SECONDS > 0:
+            self.reaper = StaleReaper(
+                self.ingestion.assembler, Config.REAPER_INTERVAL_SECONDS, Config.REAPER_MAX_AGE_SECONDS
+            )
+        self.gap_detector = None
+        if Config.RESEND_SCAN_INTERVAL_SECONDS > 0:
+            self.gap_detector = GapDetector(
+                self.ingestion.assembler,
+                self.publish,
+                topic_template=Config.MQTT_RESEND_TOPIC,
+                interval_seconds=Config.RESEND_SCAN_INTERVAL_SECONDS,
+                idle_seconds=Config.RESEND_AFTER_SECONDS,
+                cooldown_seconds=Config.RESEND_COOLDOWN_SECONDS,
+                max_attempts=Config.RESEND_MAX_ATTEMPTS,
+            )
+        if Config.MQTT_PROTOCOL_V5:
+            self.client = mqtt_client.Client(protocol=mqtt_client.MQTTv5)
+        else:
+            self.client = mqtt_client.Client()
         if Config.MQTT_USER:
             self.client.username_pw_set(Config.MQTT_USER, Config.MQTT_PASSWORD)
         self.client.on_connect = self.on_connect
@@ -24,7 +69,7 @@ class MQTTConsumer:
         parsed = urlparse(Config.MQTT_BROKER_URL)
         self.host = parsed.hostname or "localhost"
         self.port = parsed.port or 1883
-        self.topic = "camera/+/image_json"
+        self.topics = Config.mqtt_subscriptions()
 
         # connect with simple retry/backoff loop but do not raise to kill process
         backoff = 1
@@ -39,36 +84,97 @@ class MQTTConsumer:
                 time.sleep(backoff)
                 backoff = min(backoff * 2, 30)
 
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            logger.info("MQTT connected, subscribing to %s", self.topic)
-            client.subscribe(self.topic)
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        # properties มาเฉพาะ MQTT v5 (rc เป็น ReasonCodes ที่เทียบกับ int ได้)
+        if rc == 0 and self.stream is not None and not Config.INGEST_STREAM_RECEIVE:
+            logger.info("MQTT connected (assembler-only replica, not subscribing)")
+        elif rc == 0:
+            logger.info("MQTT connected, subscribing to %s", self.topics)
+            client.subscribe([(topic, 0) for topic in self.topics])
         else:
             logger.error("MQTT connection error, rc=%s", rc)
 
     def on_message(self, client, userdata, msg):
-        try:
-            payload = json.loads(msg.payload.decode())
-        except Exception as e:
-            logger.error("Invalid JSON on topic %s: %s", msg.topic, e)
+        if self.stream is not None:
+            self.stream.append(msg.topic, msg.payload)
             return
+        if self.dispatcher is None:
+            self.handle_message(msg.topic, msg.payload)
+            return
+        # affinity ตามกล้อง: chunk ของ capture เดียวกันอยู่ worker เดียวกัน
+        self.dispatcher.submit(camera_uid_from_topic(msg.topic), msg.topic, msg.payload)
 
-        logger.info("Received chunk: id=%s index=%s total=%s", payload.get("id"), payload.get("index"), payload.get("total"))
+    def publish(self, topic: str, payload: bytes):
+        # paho publish เรียกจาก thread อื่นได้ (ส่งจริงบน network thread)
+        info = self.client.publish(topic, payload, qos=1)
+        if info.rc != mqtt_client.MQTT_ERR_SUCCESS:
+            raise RuntimeError(f"MQTT publish to {topic} failed, rc={info.rc}")
+
+    def handle_message(self, topic: str, raw_payload: bytes):
+        # inline บน paho thread (INGEST_WORKERS=0): exception ห้ามหลุดออกไปถึง paho
         try:
-            self.ingestion.process_chunk_message(payload, msg.topic)
+            self.process_message(topic, raw_payload)
+        except PoisonMessage as e:
+            logger.error("Invalid JSON on topic %s: %s", topic, e)
         except Exception:
-            logger.exception("Failed to process chunk message")
+            logger.exception("Failed to process chunk message on %s", topic)
+
+    def process_message(self, topic: str, raw_payload: bytes):
+        """
+        handler ของ dispatcher worker และ stream worker: ต่างจาก handle_message ตรงที่ปล่อย exception ออกไป
+        (dispatcher นับใน failed; stream entry จะไม่ถูก ack และถูก XCLAIM มาทำใหม่)
+        """
+        if mqtt_client.topic_matches_sub(Config.MQTT_TOPIC_BIN, topic):
+            logger.debug("Received binary chunk on %s (%d bytes)", topic, len(raw_payload))
+            self.ingestion.process_binary_message(raw_payload, topic)
+            return
+        try:
+            payload = json.loads(raw_payload.decode())
+        except Exception as e:
+            raise PoisonMessage(f"invalid JSON: {e}")
+        logger.info("Received chunk: id=%s index=%s total=%s", payload.get("id"), payload.get("index"), payload.get("total"))
+        self.ingestion.process_chunk_message(payload, topic)
 
     def start(self):
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+        if self.stream is not None and Config.INGEST_STREAM_WORKERS > 0:
+            self.stream.start_workers(self.process_message, Config.INGEST_STREAM_WORKERS)
+        if self.reaper is not None:
+            self.reaper.start()
+        if self.gap_detector is not None:
+            self.gap_detector.start()
         self.client.loop_start()
         # keep the thread alive
         while True:
             time.sleep(1)
 
+    def stats(self) -> dict:
+        return {
+            "engine": "thread",
+            "dispatcher": self.dispatcher.stats() if self.dispatcher is not None else None,
+            "stream": self.stream.stats() if self.stream is not None else None,
+            "device_cache": self.ingestion.devices.stats(),
+            "recently_processed": self.ingestion.recent.stats(),
+            "reaper": self.reaper.stats() if self.reaper is not None else None,
+            "gap_detector": self.gap_detector.stats() if self.gap_detector is not None else None,
+            "image_writer": self.ingestion.writer.stats() if self.ingestion.writer is not None else None,
+            "raw_events": self.ingestion.events.stats() if self.ingestion.events is not None else None,
+        }
+
     def stop(self):
         try:
             self.client.loop_stop()
             self.client.disconnect()
+            if self.dispatcher is not None:
+                self.dispatcher.stop()
+            if self.stream is not None:
+                self.stream.stop()
+            if self.reaper is not None:
+                self.reaper.stop()
+            if self.gap_detector is not None:
+                self.gap_detector.stop()
+            self.ingestion.close()
             logger.info("MQTT consumer stopped")
         except Exception as e:
             logger.warning("Error stopping MQTT consumer: %s", e)
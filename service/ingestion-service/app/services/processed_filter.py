@@ -0,0 +1,62 @@
+# app/services/processed_filter.py
+import threading
+import time
+from collections import deque
+
+
+class RecentlyProcessedFilter:
+    """
+    In-process set ของ image_id ที่เพิ่ง process เสร็จ แบ่งเป็น time bucket หมุนเวียน
+    (bucket เก่าสุดหลุดทิ้งทั้งก้อน ไม่ต้องไล่หมดอายุทีละตัว)
+
+    ใช้ดัก chunk ซ้ำ (QoS redelivery / firmware retry) ก่อนถึง Redis. เป็น exact set ไม่ใช่ Bloom filter
+    เพราะ false positive = ทิ้งภาพใหม่จริงๆ. ไม่เจอที่นี่ไม่ได้แปลว่ายังไม่ process: Redis ยังเป็น source of truth
+    """
+
+    def __init__(self, ttl_seconds: float = 600, buckets: int = 6, max_entries: int = 100000):
+        self.buckets = max(1, buckets)
+        self.bucket_seconds = ttl_seconds / self.buckets
+        self.max_per_bucket = max(1, max_entries // self.buckets)
+        self._sets = deque([set()])
+        self._bucket_started = time.monotonic()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _rotate(self, now: float):
+        if now - self._bucket_started >= self.bucket_seconds * self.buckets:
+            # เงียบไปนานกว่าทั้ง window: ทุก bucket หมดอายุแล้ว
+            self._sets = deque([set()])
+            self._bucket_started = now
+            return
+        while now - self._bucket_started >= self.bucket_seconds:
+            self._new_bucket()
+            self._bucket_started += self.bucket_seconds
+
+    def _new_bucket(self):
+        self._sets.append(set())
+        if len(self._sets) > self.buckets:
+            self._sets.popleft()
+
+    def add(self, image_id: str):
+        now = time.monotonic()
+        with self._lock:
+            self._rotate(now)
+            if len(self._sets[-1]) >= self.max_per_bucket:
+                # จำกัดหน่วยความจำ: หมุน bucket ก่อนเวลา (window จริงจะสั้นลง)
+                self._new_bucket()
+                self._bucket_started = now
+            self._sets[-1].add(image_id)
+
+    def __contains__(self, image_id: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._rotate(now)
+            for s in reversed(self._sets):
+                if image_id in s:
+                    self.hits += 1
+                    return True
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": sum(len(s) for s in self._sets), "buckets": len(self._sets), "hits": self.hits}
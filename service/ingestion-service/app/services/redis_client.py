@@ -2,6 +2,7 @@
 import os
 import threading
 import redis
+import redis.asyncio as aioredis
 from typing import Optional
 
 # Lazy singleton for Redis connection to avoid reconnect churn
@@ -53,3 +54,34 @@ class RedisClient:
             client.delete(name)
         except Exception:
             pass
+
+
+class AsyncRedisClient:
+    """
+    Shared redis.asyncio client สำหรับ async ingestion engine (ใช้ใน event loop ของ uvicorn เท่านั้น)
+    """
+    _client: Optional[aioredis.Redis] = None
+
+    @classmethod
+    def get_client(cls) -> aioredis.Redis:
+        if cls._client is None:
+            cls._client = aioredis.Redis(
+                host=os.getenv("REDIS_HOST", "localhost"),
+                port=int(os.getenv("REDIS_PORT", "6379")),
+                db=int(os.getenv("REDIS_DB", "0")),
+                decode_responses=False,
+            )
+        return cls._client
+
+    @classmethod
+    async def release_lock(cls, name: str) -> None:
+        try:
+            await cls.get_client().delete(name)
+        except Exception:
+            pass
+
+    @classmethod
+    async def close(cls) -> None:
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
@@ -0,0 +1,77 @@
+# app/services/stale_reaper.py
+import logging
+import threading
+import time
+
+from app.services.chunk_assembler import CHUNK_TTL_SECONDS, ChunkAssembler
+
+logger = logging.getLogger("stale_reaper")
+
+
+class StaleReaper:
+    """
+    Background thread เรียก ChunkAssembler.cleanup_stale ทุก interval_seconds
+    (รันหลาย replica พร้อมกันได้: การลบแต่ละ image เป็น Lua script atomic)
+    """
+
+    def __init__(self, assembler: ChunkAssembler, interval_seconds: float = 30, max_age_seconds: int = 120):
+        self.assembler = assembler
+        self.interval = interval_seconds
+        # ทุก chunk ต่อ TTL ของ key เป็น CHUNK_TTL_SECONDS: ถ้า partial อายุถึง max_age (+ รอบ interval) ตอนที่ key
+        # หมด TTL ไปเองแล้ว reaper จะลบได้แค่ index entry และไม่คืน memory เลย
+        limit = max(int(CHUNK_TTL_SECONDS - interval_seconds), 1)
+        if max_age_seconds > limit:
+            logger.warning(
+                "REAPER_MAX_AGE_SECONDS=%s is not below the chunk TTL (%ss) minus the reaper interval; using %ss",
+                max_age_seconds, CHUNK_TTL_SECONDS, limit,
+            )
+            max_age_seconds = limit
+        self.max_age_seconds = max_age_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stale-reaper", daemon=True)
+
+        self.runs = 0
+        self.reaped = 0
+        self.expired = 0
+        self.bytes = 0
+        self.last_run = None
+
+    def start(self):
+        self._thread.start()
+        logger.info("Stale partial reaper started (interval=%ss, max_age=%ss)", self.interval, self.max_age_seconds)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def run_once(self) -> dict:
+        try:
+            report = self.assembler.cleanup_stale(self.max_age_seconds)
+        except Exception as e:
+            logger.warning("Stale partial cleanup failed: %s", e)
+            return {}
+        self.runs += 1
+        self.reaped += report["reaped"]
+        self.expired += report["expired"]
+        self.bytes += report["bytes"]
+        self.last_run = int(time.time())
+        if report["reaped"] or report["expired"]:
+            logger.info(
+                "Reaped %d stale partials (%d bytes), dropped %d expired index entries",
+                report["reaped"], report["bytes"], report["expired"],
+            )
+        return report
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "reaped": self.reaped,
+            "expired": self.expired,
+            "reclaimed_bytes": self.bytes,
+            "last_run": self.last_run,
+        }
@@ -0,0 +1,369 @@
+"""
+Load generator / benchmark สำหรับ ingestion service
+
+จำลองกล้อง N ตัว ส่งภาพเป็น chunk ผ่าน MQTT (หรือเรียก IngestionService ใน process เดียวกันด้วย --in-process)
+แล้ววัดเวลาตั้งแต่ส่ง chunk สุดท้ายจนเห็นแถวใน thermo.image_objects (chunk -> DB row)
+
+ตัวอย่าง:
+    python loadgen.py --cameras 50 --images-per-camera 20 --rate 2 --image-size 200000 --format bin
+    python loadgen.py --cameras 10 --loss 0.01 --dup 0.05 --honor-resend --output results.json
+    python loadgen.py --in-process --fake-redis --cameras 20
+
+ผลลัพธ์เป็น JSON (stdout หรือ --output) เพื่อเก็บเทียบ regression
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+from app.services.chunk_frame import encode_frame
+
+TOPIC_TEMPLATE = "camera/{camera_uid}/image_json"
+BIN_TOPIC_TEMPLATE = "camera/{camera_uid}/image_bin"
+RESEND_TOPIC_TEMPLATE = "camera/{camera_uid}/resend"
+
+
+def parse_size(value: str):
+    # "200000" หรือช่วง "50000:400000"
+    if ":" in value:
+        lo, hi = value.split(":", 1)
+        return int(lo), int(hi)
+    return int(value), int(value)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Multi-camera ingestion load generator")
+    parser.add_argument("--cameras", type=int, default=10, help="จำนวนกล้องที่จำลอง")
+    parser.add_argument("--images-per-camera", type=int, default=10)
+    parser.add_argument("--rate", type=float, default=1.0, help="ภาพ/วินาที ต่อกล้อง (0 = เร็วที่สุด)")
+    parser.add_argument("--image-size", type=parse_size, default=(100000, 100000), help="bytes หรือช่วง min:max")
+    parser.add_argument("--chunk-size", type=int, default=8192, help="bytes ต่อ chunk (ก่อน base64)")
+    parser.add_argument("--format", choices=("json", "bin"), default="bin")
+    parser.add_argument("--loss", type=float, default=0.0, help="โอกาสที่ chunk หาย (0-1)")
+    parser.add_argument("--dup", type=float, default=0.0, help="โอกาสที่ chunk ถูกส่งซ้ำ (0-1)")
+    parser.add_argument("--honor-resend", action="store_true", help="ตอบ resend request (camera/<uid>/resend)")
+    parser.add_argument("--camera-prefix", default="load")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=60, help="วินาทีที่รอแถวใน DB หลังส่งครบ")
+    parser.add_argument("--no-verify", action="store_true", help="ไม่ poll DB (วัดแค่ฝั่งส่ง)")
+    parser.add_argument("--output", default=None, help="ไฟล์ JSON ผลลัพธ์ (default: stdout)")
+
+    parser.add_argument("--broker", default=os.getenv("LOADGEN_MQTT_HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("LOADGEN_MQTT_PORT", "1883")))
+    parser.add_argument("--user", default=os.getenv("MQTT_USER", ""))
+    parser.add_argument("--password", default=os.getenv("MQTT_PASSWORD", ""))
+
+    parser.add_argument(
+        "--in-process", action="store_true",
+        help="ไม่ผ่าน MQTT: ส่ง message เข้า IngestionService ใน process นี้ (ยังใช้ MinIO/Postgres จริง)",
+    )
+    parser.add_argument("--fake-redis", action="store_true", help="ใช้ fakeredis แทน Redis (ใช้กับ --in-process)")
+    parser.add_argument("--workers", type=int, default=4, help="worker ของ --in-process")
+    return parser.parse_args(argv)
+
+
+def make_jpeg(size: int, rng: random.Random) -> bytes:
+    """
+    JPEG ที่ decode ได้จริง ขนาดประมาณ size: ภาพเล็ก + COM segment ที่มีข้อมูลสุ่ม (checksum ไม่ซ้ำกัน)
+    """
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (16, 16), color=(rng.randrange(256), rng.randrange(256), rng.randrange(256))).save(
+        buf, format="JPEG"
+    )
+    base = buf.getvalue()
+    segments = []
+    remaining = size - len(base)
+    while remaining > 4:
+        n = min(remaining - 4, 65533)
+        segments.append(b"\xff\xfe" + (n + 2).to_bytes(2, "big") + rng.randbytes(n))
+        remaining -= n + 4
+    # COM segment ต่อท้าย SOI
+    return base[:2] + b"".join(segments) + base[2:]
+
+
+def split_chunks(image_bytes: bytes, fmt: str, chunk_size: int):
+    data = base64.b64encode(image_bytes).decode() if fmt == "json" else image_bytes
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def encode_chunk(fmt: str, camera_uid: str, image_id: str, chunks, index: int):
+    total = len(chunks)
+    if fmt == "bin":
+        return BIN_TOPIC_TEMPLATE.format(camera_uid=camera_uid), encode_frame(image_id, index, total, chunks[index])
+    payload = {"id": camera_uid, "image_id": image_id, "index": index, "total": total, "data": chunks[index]}
+    return TOPIC_TEMPLATE.format(camera_uid=camera_uid), json.dumps(payload).encode()
+
+
+def percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def pick(p):
+        k = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+        return round(ordered[k] * 1000, 2)
+
+    return {
+        "p50": pick(50), "p90": pick(90), "p95": pick(95), "p99": pick(99),
+        "max": round(ordered[-1] * 1000, 2), "mean": round(sum(ordered) / len(ordered) * 1000, 2),
+    }
+
+
+class MqttSink:
+    def __init__(self, args):
+        import paho.mqtt.client as mqtt
+
+        self.client = mqtt.Client()
+        if args.user:
+            self.client.username_pw_set(args.user, args.password)
+        self.client.connect(args.broker, args.port)
+        self.client.loop_start()
+
+    def send(self, topic: str, payload: bytes):
+        self.client.publish(topic, payload)
+
+    def on_resend(self, callback, camera_prefix: str):
+        # MQTT wildcard กรอง prefix ไม่ได้: subscribe ทุกกล้องแล้วรับเฉพาะกล้องของ loadgen (ไม่ยุ่งกับกล้องจริงบน broker เดียวกัน)
+        pos = RESEND_TOPIC_TEMPLATE.split("/").index("{camera_uid}")
+
+        def on_message(client, userdata, msg):
+            parts = msg.topic.split("/")
+            if len(parts) > pos and parts[pos].startswith(camera_prefix):
+                callback(msg.topic, msg.payload)
+
+        self.client.on_message = on_message
+        self.client.subscribe(RESEND_TOPIC_TEMPLATE.format(camera_uid="+"), qos=1)
+
+    def close(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class InProcessSink:
+    """
+    ส่ง message เข้า IngestionService ตรงๆ ผ่าน ChunkDispatcher (เหมือนหลัง MQTT callback)
+    """
+
+    def __init__(self, args):
+        if args.fake_redis:
+            import fakeredis
+            from app.services.redis_client import RedisClient
+
+            RedisClient._client = fakeredis.FakeRedis()
+        from paho.mqtt.client import topic_matches_sub
+
+        from app.config import Config
+        from app.services.dispatcher import ChunkDispatcher
+        from app.services.ingestion_service import IngestionService, camera_uid_from_topic
+
+        self.ingestion = IngestionService()
+        self._camera_uid_from_topic = camera_uid_from_topic
+
+        def handle(topic, payload):
+            if topic_matches_sub(Config.MQTT_TOPIC_BIN, topic):
+                self.ingestion.process_binary_message(payload, topic)
+            else:
+                self.ingestion.process_chunk_message(json.loads(payload), topic)
+
+        self.dispatcher = ChunkDispatcher(handle, workers=args.workers, queue_size=10000, enqueue_timeout=30)
+        self.dispatcher.start()
+
+    def send(self, topic: str, payload: bytes):
+        self.dispatcher.submit(self._camera_uid_from_topic(topic), topic, payload)
+
+    def on_resend(self, callback, camera_prefix: str):
+        pass  # gap detector ไม่ได้รันใน mode นี้
+
+    def close(self):
+        self.dispatcher.stop()
+        self.ingestion.close()
+
+
+class DbWatcher(threading.Thread):
+    """
+    poll thermo.image_objects หาแถวของ run นี้จาก metadata->>'image_id' (ใช้ได้ทั้ง RAW_OBJECT_NAMING=capture/content)
+    เวลาที่บันทึกคือเวลาที่ poll เจอ (ละเอียดเท่า poll_interval)
+    """
+
+    def __init__(self, run_id: str, poll_interval: float = 0.05):
+        super().__init__(daemon=True)
+        from sqlalchemy import text
+
+        from app.database import engine
+
+        self.engine = engine
+        self.query = text(
+            "SELECT id, metadata->>'image_id' FROM thermo.image_objects"
+            " WHERE id > :last_id AND metadata->>'image_id' LIKE :pattern ORDER BY id"
+        )
+        self.pattern = f"{run_id}%"
+        self.poll_interval = poll_interval
+        self.seen = {}
+        self._stop = threading.Event()
+        with self.engine.connect() as conn:
+            self.last_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM thermo.image_objects")).scalar()
+
+    def run(self):
+        while not self._stop.is_set():
+            with self.engine.connect() as conn:
+                rows = conn.execute(self.query, {"last_id": self.last_id, "pattern": self.pattern}).all()
+            now = time.perf_counter()
+            for row_id, image_id in rows:
+                self.last_id = max(self.last_id, row_id)
+                self.seen.setdefault(image_id, now)
+            self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def run_camera(cam: int, args, run_id: str, sink, state, rng: random.Random):
+    camera_uid = f"{args.camera_prefix}{cam:04d}"
+    interval = 1.0 / args.rate if args.rate > 0 else 0
+    next_at = time.perf_counter()
+    for seq in range(args.images_per_camera):
+        image_id = f"{run_id}{cam:04d}{seq:06d}"  # 16 ตัวอักษร = ขนาด field ใน binary frame
+        image = make_jpeg(rng.randint(*args.image_size), rng)
+        chunks = split_chunks(image, args.format, args.chunk_size)
+        with state["lock"]:
+            if args.honor_resend:
+                state["images"][image_id] = (camera_uid, chunks)  # เก็บไว้ตอบ resend
+            state["bytes"] += len(image)
+        for i in range(len(chunks)):
+            if rng.random() < args.loss:
+                with state["lock"]:
+                    state["dropped"] += 1
+                continue
+            topic, payload = encode_chunk(args.format, camera_uid, image_id, chunks, i)
+            sink.send(topic, payload)
+            sent = 1
+            if rng.random() < args.dup:
+                sink.send(topic, payload)
+                sent += 1
+            with state["lock"]:
+                state["chunks"] += sent
+                state["duplicated"] += sent - 1
+        with state["lock"]:
+            state["sent_at"][image_id] = time.perf_counter()
+        if interval:
+            next_at += interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    run_id = uuid.uuid4().hex[:6]
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+
+    sink = InProcessSink(args) if args.in_process else MqttSink(args)
+    state = {
+        "lock": threading.Lock(), "images": {}, "sent_at": {},
+        "chunks": 0, "bytes": 0, "dropped": 0, "duplicated": 0, "resent": 0,
+    }
+
+    def on_resend(topic, payload):
+        try:
+            req = json.loads(payload)
+        except ValueError:
+            return
+        with state["lock"]:
+            entry = state["images"].get(req.get("image_id"))
+        if entry is None:
+            return
+        camera_uid, chunks = entry
+        for i in req.get("missing", []):
+            if 0 <= i < len(chunks):
+                sink.send(*encode_chunk(args.format, camera_uid, req["image_id"], chunks, i))
+                with state["lock"]:
+                    state["resent"] += 1
+
+    if args.honor_resend:
+        sink.on_resend(on_resend, args.camera_prefix)
+
+    watcher = None
+    if not args.no_verify:
+        watcher = DbWatcher(run_id)
+        watcher.start()
+
+    started = time.perf_counter()
+    threads = [
+        threading.Thread(target=run_camera, args=(cam, args, run_id, sink, state, random.Random(seed + cam)), daemon=True)
+        for cam in range(args.cameras)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    send_done = time.perf_counter()
+    expected = len(state["sent_at"])
+
+    if watcher is not None:
+        deadline = send_done + args.timeout
+        while time.perf_counter() < deadline and len(watcher.seen) < expected:
+            time.sleep(0.1)
+        watcher.stop()
+    finished = time.perf_counter()
+    sink.close()
+
+    latencies = []
+    completed = 0
+    last_row = send_done
+    if watcher is not None:
+        for image_id, seen_at in watcher.seen.items():
+            sent_at = state["sent_at"].get(image_id)
+            if sent_at is None:
+                continue
+            completed += 1
+            latencies.append(max(seen_at - sent_at, 0.0))
+            last_row = max(last_row, seen_at)
+
+    # throughput วัดถึงแถวสุดท้ายที่เห็นใน DB (หรือถึงส่งเสร็จถ้าไม่ verify)
+    elapsed = (last_row if watcher is not None and completed else send_done) - started
+    result = {
+        "run_id": run_id,
+        "timestamp": int(time.time()),
+        "config": {
+            "cameras": args.cameras, "images_per_camera": args.images_per_camera, "rate": args.rate,
+            "image_size": list(args.image_size), "chunk_size": args.chunk_size, "format": args.format,
+            "loss": args.loss, "dup": args.dup, "honor_resend": args.honor_resend,
+            "in_process": args.in_process, "fake_redis": args.fake_redis, "seed": seed,
+        },
+        "sent": {
+            "images": expected, "chunks": state["chunks"], "bytes": state["bytes"],
+            "dropped_chunks": state["dropped"], "duplicated_chunks": state["duplicated"],
+            "resent_chunks": state["resent"], "send_seconds": round(send_done - started, 3),
+        },
+        "verified": watcher is not None,
+        "completed_images": completed,
+        "missing_images": expected - completed if watcher is not None else None,
+        "elapsed_seconds": round(elapsed, 3),
+        "wait_seconds": round(finished - send_done, 3),
+        "throughput": {
+            "images_per_second": round((completed if watcher is not None else expected) / elapsed, 2) if elapsed else None,
+            "chunks_per_second": round(state["chunks"] / elapsed, 2) if elapsed else None,
+            "megabytes_per_second": round(state["bytes"] / 1e6 / elapsed, 3) if elapsed else None,
+        },
+        "latency_ms": percentiles(latencies),
+    }
+
+    out = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out + "\n")
+        print(f"Wrote results to {args.output}", file=sys.stderr)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,21 @@
 import paho.mqtt.client as mqtt
+import argparse
 import base64
 import json
 import time
 import sys
 from pathlib import Path
 
+from app.services.chunk_frame import encode_frame
+
 # ปรับค่าตามจริง
 MQTT_BROKER = "192.168.1.104"  # broker ภายนอกที่คุณใช้
 MQTT_PORT = 1883
 MQTT_USER = "admin"            # ถ้ามี
 MQTT_PASSWORD = "admin1234"    # ถ้ามี
 TOPIC_TEMPLATE = "camera/{device_uid}/image_json"
+BIN_TOPIC_TEMPLATE = "camera/{device_uid}/image_bin"
+RESEND_TOPIC_TEMPLATE = "camera/{device_uid}/resend"
 DEVICE_UID = "2"
 IMAGE_PATH = "small.jpg"  # สร้างไฟล์ทดสอบไว้ข้างล่าง
 CHUNK_SIZE = 1024 * 8  # base64 size per chunk before splitting (tweak ifอยากลองหลายชิ้น)
@@ -18,24 +23,96 @@ CHUNK_SIZE = 1024 * 8  # base64 size per chunk before splitting (tweak ifอย
 def load_image_bytes(path):
     return Path(path).read_bytes()
 
-def chunk_and_publish(client, image_bytes, image_id):
-    b64 = base64.b64encode(image_bytes).decode()
-    # แบ่งเป็น chunk เล็ก
-    total = (len(b64) + CHUNK_SIZE - 1) // CHUNK_SIZE
-    for i in range(total):
-        part = b64[i * CHUNK_SIZE : (i + 1) * CHUNK_SIZE]
+def split_chunks(image_bytes, fmt):
+    # json: แบ่ง base64 string, bin: แบ่ง raw bytes
+    data = base64.b64encode(image_bytes).decode() if fmt == "json" else image_bytes
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+def publish_chunk(client, fmt, image_id, chunks, i):
+    total = len(chunks)
+    if fmt == "bin":
+        # raw bytes ต่อ chunk (ไม่มี base64) + header คงที่ 28 bytes
+        topic = BIN_TOPIC_TEMPLATE.format(device_uid=DEVICE_UID)
+        client.publish(topic, encode_frame(image_id, i, total, chunks[i]))
+    else:
+        topic = TOPIC_TEMPLATE.format(device_uid=DEVICE_UID)
         payload = {
             "id": image_id,
             "index": i,
             "total": total,
-            "data": part,
+            "data": chunks[i],
         }
-        topic = TOPIC_TEMPLATE.format(device_uid=DEVICE_UID)
         client.publish(topic, json.dumps(payload))
-        print(f"Published chunk {i+1}/{total} to {topic}")
+    print(f"Published {fmt} chunk {i+1}/{total} to {topic}")
+
+def chunk_and_publish(client, image_bytes, image_id, skip=()):
+    chunks = split_chunks(image_bytes, "json")
+    for i in range(len(chunks)):
+        if i in skip:
+            print(f"Dropping chunk {i+1}/{len(chunks)} (simulated loss)")
+            continue
+        publish_chunk(client, "json", image_id, chunks, i)
         time.sleep(0.1)  # ค่าเล็กๆ ช่วยให้ไม่อัดเร็วเกินไป
 
+def chunk_and_publish_binary(client, image_bytes, image_id, skip=()):
+    chunks = split_chunks(image_bytes, "bin")
+    for i in range(len(chunks)):
+        if i in skip:
+            print(f"Dropping chunk {i+1}/{len(chunks)} (simulated loss)")
+            continue
+        publish_chunk(client, "bin", image_id, chunks, i)
+        time.sleep(0.1)
+
+def honor_resend_requests(client, fmt, image_id, chunks):
+    """
+    subscribe camera/<uid>/resend แล้วส่ง chunk ที่ ingestion ขอใหม่ (เหมือน firmware ที่ยังเก็บภาพล่าสุดไว้)
+
+    bin: ตอบเฉพาะ request ที่ image_id ตรงกัน; json: firmware เดิมไม่ส่ง image_id (service ใช้ camera session)
+    จึงตอบ request ที่ total ตรงกัน
+    """
+    topic = RESEND_TOPIC_TEMPLATE.format(device_uid=DEVICE_UID)
+
+    def on_message(c, userdata, msg):
+        try:
+            req = json.loads(msg.payload)
+        except ValueError:
+            return
+        if fmt == "bin" and req.get("image_id") != image_id:
+            return
+        if req.get("total") != len(chunks):
+            return
+        missing = [i for i in req.get("missing", []) if 0 <= i < len(chunks)]
+        print(f"Resend request (attempt {req.get('attempt')}): chunks {missing}")
+        for i in missing:
+            publish_chunk(c, fmt, image_id, chunks, i)
+
+    client.on_message = on_message
+    client.subscribe(topic, qos=1)
+    print(f"Listening for resend requests on {topic}")
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Publish a test image as MQTT chunks")
+    parser.add_argument(
+        "--format", choices=("json", "bin"), default="json",
+        help="json = base64 ใน JSON (firmware เดิม), bin = binary frame",
+    )
+    parser.add_argument(
+        "--drop", type=int, nargs="*", default=[],
+        help="index ของ chunk ที่จะไม่ส่งในรอบแรก (จำลอง chunk หาย)",
+    )
+    parser.add_argument(
+        "--honor-resend", action="store_true",
+        help="ฟัง camera/<uid>/resend และส่ง chunk ที่ถูกขอใหม่",
+    )
+    parser.add_argument(
+        "--resend-wait", type=float, default=60,
+        help="วินาทีที่รอ resend request หลังส่งรอบแรก (ใช้กับ --honor-resend)",
+    )
+    return parser.parse_args(argv)
+
 def main():
+    args = parse_args(sys.argv[1:])
+
     # สร้างไฟล์ภาพเล็กๆ ถ้าไม่มี (1x1 pixel JPEG)
     if not Path(IMAGE_PATH).exists():
         from PIL import Image
@@ -50,8 +127,14 @@ def main():
     client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
     client.connect(MQTT_BROKER, MQTT_PORT)
     client.loop_start()
-    chunk_and_publish(client, image_bytes, image_id)
-    time.sleep(2)  # รอให้ ingestion ประมวลผล
+    if args.honor_resend:
+        honor_resend_requests(client, args.format, image_id, split_chunks(image_bytes, args.format))
+    skip = set(args.drop)
+    if args.format == "bin":
+        chunk_and_publish_binary(client, image_bytes, image_id, skip)
+    else:
+        chunk_and_publish(client, image_bytes, image_id, skip)
+    time.sleep(args.resend_wait if args.honor_resend else 2)  # รอให้ ingestion ประมวลผล
     client.loop_stop()
     client.disconnect()
     print("Done publishing. Image ID:", image_id)
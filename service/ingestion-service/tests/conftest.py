@@ -0,0 +1,21 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+# ให้ import app.* ได้เมื่อรัน pytest จาก service/ingestion-service
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.redis_client import RedisClient  # noqa: E402
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """
+    fakeredis แทน Redis จริง (ต้องมี lupa: pip install "fakeredis[lua]" เพราะ ingest ผ่าน Lua script)
+    """
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(RedisClient, "_client", client)
+    return client
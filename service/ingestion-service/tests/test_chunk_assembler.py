@@ -0,0 +1,124 @@
+# tests/test_chunk_assembler.py
+import pytest
+
+from app.config import Config
+from app.services.chunk_assembler import INFLIGHT_KEY, ChunkAssembler, IngestResult
+from app.services.chunk_frame import MAX_CHUNKS, decode_frame, encode_frame, valid_chunk_range
+
+IMAGE = bytes(range(256)) * 3 + b"tail"  # 772 bytes -> chunk 256 x 3 + 4
+
+
+def _chunks(data: bytes, size: int = 256):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def assembler(redis_client, monkeypatch):
+    monkeypatch.setattr(Config, "CHUNK_STORAGE_MODE", "offset")
+    return ChunkAssembler()
+
+
+def _ingest(assembler, index, total, data, image_id="img-1"):
+    return assembler.ingest_chunk(image_id, index, total, data, f"assemble:{image_id}", 30, "cam-1")
+
+
+def test_offset_in_order(assembler):
+    chunks = _chunks(IMAGE)
+    results = [_ingest(assembler, i, len(chunks), c) for i, c in enumerate(chunks)]
+    assert results == [IngestResult.STORED] * 3 + [IngestResult.READY]
+    assert assembler.assemble("img-1") == IMAGE
+
+
+def test_offset_tail_first_and_out_of_order(assembler):
+    chunks = _chunks(IMAGE)
+    order = [3, 1, 0, 2]
+    results = [_ingest(assembler, i, len(chunks), chunks[i]) for i in order]
+    assert results[-1] is IngestResult.READY
+    assert assembler.assemble("img-1") == IMAGE
+
+
+def test_offset_duplicate_chunk_does_not_count_twice(assembler):
+    chunks = _chunks(IMAGE)
+    assert _ingest(assembler, 0, 4, chunks[0]) is IngestResult.STORED
+    assert _ingest(assembler, 0, 4, chunks[0]) is IngestResult.STORED
+    assert assembler.missing_chunks("img-1") == ("cam-1", 4, [1, 2, 3])
+
+
+def test_offset_chunk_size_mismatch_is_invalid(assembler):
+    assert _ingest(assembler, 0, 4, b"x" * 256) is IngestResult.STORED
+    assert _ingest(assembler, 1, 4, b"x" * 100) is IngestResult.INVALID
+
+
+def test_offset_index_beyond_recorded_total_is_ignored(assembler, redis_client):
+    assert _ingest(assembler, 0, 2, b"x" * 256) is IngestResult.STORED
+    # total ใหม่ใหญ่กว่าที่บันทึกไว้: ใช้ total เดิม ไม่เขียน chunk
+    assert _ingest(assembler, 5, 8, b"x" * 256) is IngestResult.STORED
+    assert redis_client.bitcount("image_bits:img-1") == 1
+
+
+def test_offset_processed_image_is_duplicate(assembler):
+    chunks = _chunks(IMAGE)
+    for i, c in enumerate(chunks):
+        _ingest(assembler, i, len(chunks), c)
+    assembler.mark_processed("img-1")
+    assert _ingest(assembler, 0, 4, chunks[0]) is IngestResult.DUPLICATE
+    assert assembler.redis.zscore(INFLIGHT_KEY, "img-1") is None
+
+
+@pytest.fixture
+def hash_assembler(redis_client, monkeypatch):
+    monkeypatch.setattr(Config, "CHUNK_STORAGE_MODE", "hash")
+    return ChunkAssembler()
+
+
+def test_hash_index_beyond_recorded_total_is_not_stored(hash_assembler, redis_client):
+    chunks = _chunks(IMAGE[:600])
+    assert _ingest(hash_assembler, 0, 3, chunks[0]) is IngestResult.STORED
+    # total ใหม่ใหญ่กว่าที่บันทึกไว้: ไม่เก็บและไม่นับว่าครบ
+    assert _ingest(hash_assembler, 4, 5, b"x" * 256) is IngestResult.STORED
+    assert redis_client.hkeys("image_chunks:img-1") == [b"0"]
+    assert _ingest(hash_assembler, 1, 3, chunks[1]) is IngestResult.STORED
+    assert _ingest(hash_assembler, 2, 3, chunks[2]) is IngestResult.READY
+    assert hash_assembler.assemble("img-1") == IMAGE[:600]
+
+
+@pytest.mark.parametrize("index,total", [(-1, 4), (4, 4), (0, 0), (0, -3), (0, MAX_CHUNKS + 1)])
+def test_invalid_chunk_range(index, total):
+    assert not valid_chunk_range(index, total)
+
+
+def test_decode_frame_rejects_out_of_range_index():
+    frame = bytearray(encode_frame("img-1", 0, 4, b"data"))
+    frame[20:22] = (7).to_bytes(2, "big")
+    with pytest.raises(ValueError):
+        decode_frame(bytes(frame))
+
+
+@pytest.mark.parametrize("index,total", [(-1, 4), (9, 4), ("x", 4), (0, None)])
+def test_json_chunk_with_bad_range_never_reaches_redis(redis_client, index, total):
+    from app.services.ingestion_service import IngestionService
+
+    service = IngestionService.__new__(IngestionService)  # ไม่ต่อ MinIO / RabbitMQ / DB
+    payload = {"index": index, "total": total, "data": "eA=="}
+    assert service.process_chunk_message(payload, "camera/cam-1/image_json") is None
+    assert redis_client.keys("*") == []  # ไม่มีแม้แต่ camera_session
+
+
+def test_camera_session_ttl_refreshed_per_chunk(redis_client):
+    from app.services.ingestion_service import SESSION_TTL_SECONDS, get_or_create_session_for_camera
+
+    first = get_or_create_session_for_camera("cam-1")
+    redis_client.expire("camera_session:cam-1", 5)  # เหมือนเวลาผ่านไปจนเกือบหมดอายุ
+    assert get_or_create_session_for_camera("cam-1") == first
+    assert redis_client.ttl("camera_session:cam-1") > SESSION_TTL_SECONDS - 5
+
+
+@pytest.mark.parametrize("image_id", [None, "img-1", "x" * 16, "3f2b8c1e-9a4d-4e57-b1c2-7d9e0f6a5b43", "y" * 64])
+def test_frame_round_trip(image_id):
+    frame = decode_frame(encode_frame(image_id, 2, 5, b"chunk-data"))
+    assert (frame.image_id, frame.index, frame.total, bytes(frame.data)) == (image_id, 2, 5, b"chunk-data")
+
+
+def test_encode_frame_rejects_too_long_image_id():
+    with pytest.raises(ValueError):
+        encode_frame("z" * 65, 0, 1, b"data")
@@ -0,0 +1,121 @@
+# tests/test_chunk_stream.py
+import fakeredis
+import pytest
+
+from app.config import Config
+from app.services.chunk_assembler import ChunkAssembler
+from app.services.chunk_hasher import IncrementalHasher
+from app.services.chunk_stream import ChunkStream
+from app.services.processed_filter import RecentlyProcessedFilter
+
+TOPIC = "camera/cam-1/image_bin"
+
+
+class FlakyRedis(fakeredis.FakeRedis):
+    def __init__(self, *args, failures: int = 0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def xadd(self, *args, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return super().xadd(*args, **kwargs)
+
+
+class FailingUploader:
+    def __init__(self):
+        self.calls = 0
+
+    def upload_raw_image(self, *args, **kwargs):
+        self.calls += 1
+        raise OSError("MinIO unavailable")
+
+
+class RecordingUploader(FailingUploader):
+    def upload_raw_image(self, object_name, data, **kwargs):
+        self.uploaded = (object_name, kwargs.get("content_type"))
+        return super().upload_raw_image(object_name, data, **kwargs)
+
+
+def _service(uploader):
+    from app.services.ingestion_service import IngestionService
+
+    service = IngestionService.__new__(IngestionService)  # ไม่ต่อ MinIO / RabbitMQ / DB
+    service.assembler = ChunkAssembler()
+    service.uploader = uploader
+    service.hasher = IncrementalHasher()
+    service.recent = RecentlyProcessedFilter(60)
+    service.writer = service.events = None
+    service.atomic_ingest = True
+    service.content_addressed = False
+    return service
+
+
+@pytest.mark.parametrize("failures,appended", [(2, True), (3, False)])
+def test_append_retries_transient_errors(failures, appended):
+    stream = ChunkStream(FlakyRedis(failures=failures), append_retries=2, append_backoff=0)
+    assert stream.append(TOPIC, b"chunk") is appended
+    assert stream.redis.xlen(stream.key) == (1 if appended else 0)
+    assert stream.stats()["append_failed"] == (0 if appended else 1)
+
+
+def test_upload_failure_leaves_entry_pending_and_reassembles(redis_client, monkeypatch):
+    monkeypatch.setattr(Config, "IMAGE_VALIDATION", "off")
+    service = _service(FailingUploader())
+
+    stream = ChunkStream(redis_client)
+    stream.ensure_group()
+    stream.append(TOPIC, b"single chunk image")
+    (_, entries), = redis_client.xreadgroup(stream.group, "c-1", {stream.key: ">"})
+    entry_id, fields = entries[0]
+
+    def handler(topic, payload):
+        service.process_chunk("cam-1", "img-1", 0, 1, payload, topic)
+
+    stream._handle(handler, entry_id, fields)
+    assert stream.stats()["failed"] == 1
+    assert redis_client.xpending(stream.key, stream.group)["pending"] == 1  # ไม่ ack
+
+    # XCLAIM ส่ง entry เดิมมาอีกครั้ง: chunk ครบอยู่แล้วจึงได้ READY และประกอบ/upload ใหม่
+    stream._handle(handler, entry_id, fields)
+    assert service.uploader.calls == 2
+    assert not service.assembler.already_processed("img-1")
+
+
+@pytest.mark.parametrize("fmt,ext,content_type", [("PNG", "png", "image/png"), ("JPEG", "jpg", "image/jpeg")])
+def test_raw_upload_uses_detected_format(redis_client, monkeypatch, fmt, ext, content_type):
+    import io
+
+    from PIL import Image
+
+    monkeypatch.setattr(Config, "IMAGE_VALIDATION", "reject")
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format=fmt)
+    service = _service(RecordingUploader())
+    with pytest.raises(OSError):
+        service.process_chunk("cam-1", "img-1", 0, 1, buf.getvalue(), TOPIC)
+    object_name, uploaded_type = service.uploader.uploaded
+    assert object_name.endswith(f".{ext}") and uploaded_type == content_type
+
+
+def test_non_atomic_path_counts_chunk_results(redis_client, monkeypatch):
+    from app import metrics
+
+    monkeypatch.setattr(Config, "IMAGE_VALIDATION", "off")
+    service = _service(FailingUploader())
+    service.atomic_ingest = False
+
+    def count(status):
+        return metrics.RESULT_BY_STATUS[status]._value.get()
+
+    before = {status: count(status) for status in metrics.RESULT_BY_STATUS}
+    service.process_chunk("cam-1", "img-2", 0, 2, b"first", TOPIC)
+    with pytest.raises(OSError):
+        service.process_chunk("cam-1", "img-2", 1, 2, b"second", TOPIC)
+    service.assembler.mark_processed("img-2")
+    service.recent = RecentlyProcessedFilter(60)
+    service.process_chunk("cam-1", "img-2", 1, 2, b"second", TOPIC)
+    assert {status: count(status) - before[status] for status in ("stored", "ready", "duplicate")} == {
+        "stored": 1, "ready": 1, "duplicate": 1,
+    }
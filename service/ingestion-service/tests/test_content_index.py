@@ -0,0 +1,17 @@
+# tests/test_content_index.py
+from app.services.content_index import checksum_index_key, content_object_name
+from app.services.image_writer import image_object_row
+
+CHECKSUM = "ab" + "0" * 62
+
+
+def test_identical_bytes_from_different_cameras_do_not_collapse():
+    assert content_object_name("cam-1", CHECKSUM) != content_object_name("cam-2", CHECKSUM)
+    assert checksum_index_key("cam-1", CHECKSUM) != checksum_index_key("cam-2", CHECKSUM)
+    assert content_object_name("cam-1", CHECKSUM, "png") == f"cam-1/sha256/ab/{CHECKSUM}.png"
+
+
+def test_row_metadata_records_capture():
+    upload_info = {"bucket": "thermo-raw", "object_name": content_object_name("cam-1", CHECKSUM)}
+    row = image_object_row(7, None, upload_info, CHECKSUM, "camera/cam-1/image_bin", "cam-1", "img-1")
+    assert row["metadata"] == {"source_topic": "camera/cam-1/image_bin", "camera_uid": "cam-1", "image_id": "img-1"}
@@ -21,6 +21,17 @@ load_dotenv(dotenv_path)
 
 # --- Core config container ---
 class Config:
+    # --- Database (processing profiles) ---
+    DB_HOST: str = os.getenv("DB_HOST", "localhost")
+    DB_PORT: str = os.getenv("DB_PORT", "5432")
+    DB_NAME: str = os.getenv("DB_NAME", "thermosense_db")
+    DB_USER: str = os.getenv("DB_USER", "postgres")
+    DB_PASSWORD: str = os.getenv("DB_PASSWORD", "password")
+
+    @classmethod
+    def FULL_DATABASE_URL(cls) -> str:
+        return f"postgresql+psycopg2://{urllib.parse.quote(cls.DB_USER)}:{urllib.parse.quote(cls.DB_PASSWORD)}@{cls.DB_HOST}:{cls.DB_PORT}/{cls.DB_NAME}"
+
     # --- RabbitMQ ---
     RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "localhost")
     RABBITMQ_PORT: int = int(os.getenv("RABBITMQ_PORT", "5672"))
@@ -41,6 +52,27 @@ class Config:
     MINIO_RAW_BUCKET: str = os.getenv("MINIO_RAW_BUCKET", "thermo-raw")
     MINIO_PROCESSED_BUCKET: str = os.getenv("MINIO_PROCESSED_BUCKET", "thermo-processed")
 
+    # --- Processing engine ---
+    # 0 = process ทีละ message บน pika thread (เดิม); N = process pool N ตัว + prefetch หลาย message
+    PROCESSING_WORKERS: int = int(os.getenv("PROCESSING_WORKERS", "0"))
+    # message ที่ดึงมาค้างไว้พร้อมกัน (0 = 2 เท่าของ PROCESSING_WORKERS) ให้ download/upload ซ้อนกับการ process
+    PROCESSING_PREFETCH: int = int(os.getenv("PROCESSING_PREFETCH", "0"))
+    # OpenCV threads ต่อ worker process (workers x threads ไม่ควรเกินจำนวน core)
+    OPENCV_THREADS: int = int(os.getenv("OPENCV_THREADS", "1"))
+
+    # ด้านสั้นของ ROI (หรือทั้งภาพ) ที่ OCR ต้องการเป็น px: JPEG ที่ใหญ่กว่านี้ 2/4/8 เท่า decode แบบย่อ
+    # (IMREAD_REDUCED_*), 0 = decode ความละเอียดเต็มเสมอ
+    DECODE_MIN_SIDE: int = int(os.getenv("DECODE_MIN_SIDE", "0"))
+    # รัน steps ผ่าน CompiledPipeline (gray ครั้งเดียว, kernel คำนวณไว้ก่อน, dst buffer ใช้ซ้ำต่อ worker)
+    PROCESSING_COMPILED_PIPELINE: bool = os.getenv("PROCESSING_COMPILED_PIPELINE", "true").lower() in ("1", "true", "yes")
+    # decode เป็น gray ตรงๆ เมื่อ step แรกต้องการ gray (ข้าม cvtColor) ค่า gray ของ decoder ไม่ตรงกับ cvtColor
+    # ผล denoise / threshold จึงเปลี่ยนไปจาก pipeline เดิม: เปิดเฉพาะเมื่อยอมรับ OCR input ที่ต่างออกไปได้
+    PROCESSING_GRAY_DECODE: bool = os.getenv("PROCESSING_GRAY_DECODE", "false").lower() in ("1", "true", "yes")
+
+    # --- Per-device processing profiles (thermo.processing_profiles) ---
+    PROFILES_ENABLED: bool = os.getenv("PROFILES_ENABLED", "false").lower() in ("1", "true", "yes")
+    PROFILES_RELOAD_SECONDS: float = float(os.getenv("PROFILES_RELOAD_SECONDS", "30"))
+
     # --- Optional / general ---
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     CONNECTION_TIMEOUT: int = int(os.getenv("CONNECTION_TIMEOUT", "10"))
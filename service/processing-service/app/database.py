@@ -5,7 +5,7 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 from app.config import Config
 
 # Create SQLAlchemy Engine
-engine = create_engine(Config.FULL_DATABASE_URL, pool_pre_ping=True)
+engine = create_engine(Config.FULL_DATABASE_URL(), pool_pre_ping=True)
 
 # Create Session Factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -0,0 +1,25 @@
+# app/models/processing_profile.py
+from sqlalchemy import Boolean, Column, Integer, JSON, TIMESTAMP, Text
+from sqlalchemy.sql import func
+
+from app.database import Base
+
+
+class ProcessingProfileRow(Base):
+    """
+    thermo.processing_profiles: pipeline ต่อกล้อง (device_id NULL = profile default ของทุกกล้อง)
+    """
+    __tablename__ = "processing_profiles"
+    __table_args__ = {"schema": "thermo"}
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(Integer, nullable=True)
+    roi_x = Column(Integer, nullable=False, default=0)
+    roi_y = Column(Integer, nullable=False, default=0)
+    roi_w = Column(Integer, nullable=False, default=0)
+    roi_h = Column(Integer, nullable=False, default=0)
+    steps = Column(JSON, nullable=False, default=list)  # [["denoise", {"h": 5}], ["threshold_adaptive", {...}]]
+    output_format = Column(Text, nullable=False, default="png")
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), nullable=False)
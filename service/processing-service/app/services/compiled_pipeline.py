@@ -0,0 +1,164 @@
+# service/processing-service/app/services/compiled_pipeline.py
+
+import cv2
+import numpy as np
+
+from app.services.processing import rect_kernel
+
+# step ที่ compile ได้ (correct_orientation / orient_and_crop ต้องใช้สถานะ EXIF ของ ImageProcessor -> ใช้ pipeline เดิม)
+COMPILED_STEPS = frozenset({
+    "crop_roi", "to_grayscale", "denoise", "threshold_adaptive", "invert_colors",
+    "morphology_open", "morphology_close", "dilate", "deskew",
+})
+
+
+class CompiledPipeline:
+    """
+    ImageProcessor.pipeline(steps) ที่แปลงรายการ step ครั้งเดียวตอนสร้าง แล้วใช้ซ้ำทุก message:
+
+    * แปลงเป็น gray ครั้งเดียว (denoise / threshold_adaptive / to_grayscale ไม่ cvtColor ซ้ำ); ถ้า step แรกต้องการ
+      gray อยู่แล้ว `grayscale` = True: decode เป็น gray ตรงๆ ได้ (ผลไม่ตรงกับ cvtColor ทุก pixel, Processor ใช้เฉพาะเมื่อเปิด
+      PROCESSING_GRAY_DECODE)
+    * threshold_adaptive + invert_colors รวมเป็น THRESH_BINARY_INV pass เดียว (เมื่อ C เป็นจำนวนเต็ม);
+      invert_colors สองครั้งติดกันหักล้างกัน
+    * kernel ของ morphology_* / dilate สร้างไว้ตอน compile
+    * ผลของแต่ละ step เขียนลง dst buffer ของ step นั้น (จองครั้งแรก จองใหม่เฉพาะเมื่อขนาดภาพเปลี่ยน)
+
+    array ที่ run() คืนเป็น buffer ที่ถูกเขียนทับใน run ครั้งถัดไป: encode ก่อนเรียกซ้ำ.
+    ไม่ thread-safe: ใช้หนึ่ง instance ต่อ worker (Processor สร้างแยกในแต่ละ worker process อยู่แล้ว)
+    """
+
+    def __init__(self, steps):
+        self.steps = tuple(steps)
+        self.grayscale = False
+        self._ops = []  # (fn, slot, kwargs)
+        self._buffers = {}
+        self._compile()
+
+    def _compile(self):
+        gray = False
+        for name, kwargs in self.steps:
+            if name not in COMPILED_STEPS:
+                raise ValueError(f"step {name!r} cannot be compiled")
+            kwargs = dict(kwargs)
+            if name == "crop_roi":
+                self._append(self._crop, kwargs)
+                continue
+            if name in ("to_grayscale", "denoise", "threshold_adaptive") and not gray:
+                # decode เป็น gray ได้เลยถ้ายังไม่มี step ไหนใช้สีก่อนหน้า (crop ไม่นับ)
+                self.grayscale = all(fn == self._crop for fn, _, _ in self._ops)
+                self._append(self._to_gray, {})
+                gray = True
+            if name == "to_grayscale":
+                continue
+            if name == "invert_colors":
+                last = self._ops[-1] if self._ops else None
+                if last and last[0] == self._threshold and float(last[2].get("C", 1.5)).is_integer():
+                    # C ที่มีเศษ: BINARY ปัด C ขึ้นแต่ BINARY_INV ปัดลง ผลไม่ตรงกับ invert -> ไม่รวม
+                    last[2]["inverted"] = not last[2]["inverted"]
+                elif last and last[0] == self._invert:
+                    self._ops.pop()
+                else:
+                    self._append(self._invert, {})
+                continue
+            if name == "denoise":
+                self._append(self._denoise, kwargs)
+            elif name == "threshold_adaptive":
+                kwargs["inverted"] = False
+                self._append(self._threshold, kwargs)
+            elif name in ("morphology_open", "morphology_close"):
+                size = kwargs.pop("kernel_size", (2, 2) if name == "morphology_open" else (3, 3))
+                kwargs["op"] = cv2.MORPH_OPEN if name == "morphology_open" else cv2.MORPH_CLOSE
+                kwargs["kernel"] = rect_kernel(tuple(size))
+                self._append(self._morphology, kwargs)
+            elif name == "dilate":
+                kwargs["kernel"] = rect_kernel(tuple(kwargs.pop("kernel_size", (2, 2))))
+                self._append(self._dilate, kwargs)
+            elif name == "deskew":
+                self._append(self._deskew, kwargs)
+
+    def _append(self, fn, kwargs: dict):
+        self._ops.append((fn, len(self._ops), kwargs))
+
+    def _buffer(self, key, shape: tuple) -> np.ndarray:
+        buf = self._buffers.get(key)
+        if buf is None or buf.shape != shape:
+            buf = self._buffers[key] = np.empty(shape, np.uint8)
+        return buf
+
+    def _points(self, key, n: int, shape: tuple) -> np.ndarray:
+        # buffer พิกัด int32 ที่โตตามจำนวนจุดสูงสุดที่เคยเจอ; คืน view n แถวแรก
+        buf = self._buffers.get(key)
+        if buf is None or len(buf) < n:
+            buf = self._buffers[key] = np.empty((n,) + shape, np.int32)
+        return buf[:n]
+
+    def _owns(self, img: np.ndarray) -> bool:
+        return any(img is buf for buf in self._buffers.values())
+
+    def run(self, img: np.ndarray) -> np.ndarray:
+        for fn, slot, kwargs in self._ops:
+            img = fn(img, slot, **kwargs)
+        return img
+
+    # ---------- steps ----------
+
+    def _crop(self, img, slot, x: int, y: int, w: int, h: int):
+        return img[y:y+h, x:x+w]
+
+    def _to_gray(self, img, slot):
+        if img.ndim == 2:
+            return img
+        return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=self._buffer(slot, img.shape[:2]))
+
+    def _denoise(self, img, slot, h: float = 10.0, templateWindowSize: int = 7, searchWindowSize: int = 21):
+        return cv2.fastNlMeansDenoising(
+            img, self._buffer(slot, img.shape), h, templateWindowSize, searchWindowSize
+        )
+
+    def _threshold(self, img, slot, block_size: int = 11, C: float = 1.5, inverted: bool = False):
+        return cv2.adaptiveThreshold(
+            img, 255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY_INV if inverted else cv2.THRESH_BINARY,
+            block_size, C,
+            dst=self._buffer(slot, img.shape),
+        )
+
+    def _invert(self, img, slot):
+        # buffer ของ step ก่อนหน้า: invert ในที่เลย
+        dst = img if self._owns(img) else self._buffer(slot, img.shape)
+        return cv2.bitwise_not(img, dst=dst)
+
+    def _morphology(self, img, slot, op: int, kernel: np.ndarray):
+        return cv2.morphologyEx(img, op, kernel, dst=self._buffer(slot, img.shape))
+
+    def _dilate(self, img, slot, kernel: np.ndarray, iterations: int = 1):
+        return cv2.dilate(img, kernel, dst=self._buffer(slot, img.shape), iterations=iterations)
+
+    def _deskew(self, img, slot, max_skew: float = 2.0):
+        gray = self._to_gray(img, (slot, "gray"))
+        blur = cv2.GaussianBlur(gray, (9, 9), 0, dst=self._buffer((slot, "blur"), gray.shape))
+        h, w = gray.shape
+        bw = cv2.threshold(
+            blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst=self._buffer((slot, "bw"), gray.shape)
+        )[1]
+        n = cv2.countNonZero(bw)
+        if n == 0:
+            return img
+        found = cv2.findNonZero(bw, self._points((slot, "xy"), n, (1, 2)))
+        # (x, y) -> (row, col) เรียงตามแถว เหมือน np.where ของ ImageProcessor.deskew (มุมของ minAreaRect ตรงกัน)
+        coords = self._points((slot, "rc"), n, (2,))
+        np.copyto(coords, found[:, 0, ::-1])
+        angle = cv2.minAreaRect(coords)[-1]
+        if angle < -45:
+            angle = -(90 + angle)
+        else:
+            angle = -angle
+        if abs(angle) <= max_skew:
+            return img
+        M = cv2.getRotationMatrix2D((w//2, h//2), angle, 1.0)
+        return cv2.warpAffine(
+            img, M, (w, h), dst=self._buffer(slot, img.shape),
+            flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE,
+        )
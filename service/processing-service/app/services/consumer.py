@@ -1,7 +1,9 @@
 # service/processing-service/app/services/consumer.py
 
+import functools
 import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Callable, Optional
 
 import pika
@@ -12,11 +14,29 @@ from app.utils.logger import get_logger
 from app.utils.retry import retry
 from app.services.minio_uploader import MinioUploader
 from app.services.processor import Processor
+from app.services.profiles import ProfileStore
 from app.services.publisher import Publisher
+from app.services.worker_pool import ProcessingPool
 
 logger = get_logger("consumer")
 
 
+def device_keys(msg: dict, raw_object_name: str) -> tuple:
+    """
+    (device_id, device_uid) ของ raw.created สำหรับเลือก profile:
+    ingestion ส่ง device_id / camera_uid มาเอง; watcher-service ส่ง metadata.deviceId และชื่อ object
+    ของ ingestion ขึ้นต้นด้วย <camera_uid>/ (ทั้งโหมด capture และ content)
+    """
+    device_id = msg.get("device_id")
+    if device_id is None:
+        metadata = msg.get("metadata")
+        device_id = metadata.get("deviceId") if isinstance(metadata, dict) else None
+    device_uid = msg.get("camera_uid")
+    if not device_uid and "/" in raw_object_name:
+        device_uid = raw_object_name.split("/", 1)[0]
+    return device_id, device_uid
+
+
 class RabbitMQConsumer:
     def __init__(self, on_error: Optional[Callable[[Exception], None]] = None, roi: tuple[int, int, int, int] = (0, 0, 0, 0)):
         self.url = Config.get_rabbitmq_url()
@@ -34,6 +54,21 @@ class RabbitMQConsumer:
         self.processor = Processor(self.roi)
         self.publisher = Publisher()
 
+        # pipeline ต่อกล้อง (thermo.processing_profiles) cache ใน memory + hot reload
+        self.profiles: Optional[ProfileStore] = None
+        if Config.PROFILES_ENABLED:
+            self.profiles = ProfileStore(self.processor.default_profile, Config.PROFILES_RELOAD_SECONDS)
+
+        # worker mode: message ละ thread (download/upload/publish) + CPU ไปทำใน process pool
+        # ack/nack ส่งกลับผ่าน add_callback_threadsafe (channel ใช้ได้จาก connection thread เท่านั้น)
+        self.pool: Optional[ProcessingPool] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.prefetch = 1
+        if Config.PROCESSING_WORKERS > 0:
+            self.prefetch = Config.PROCESSING_PREFETCH or Config.PROCESSING_WORKERS * 2
+            self.pool = ProcessingPool(Config.PROCESSING_WORKERS, self.roi, Config.OPENCV_THREADS)
+            self._executor = ThreadPoolExecutor(max_workers=self.prefetch, thread_name_prefix="process-msg")
+
     @retry(total_tries=5, initial_delay=1.0, backoff=2.0)
     def _connect(self):
         logger.info("Attempting to connect to RabbitMQ")
@@ -47,32 +82,70 @@ class RabbitMQConsumer:
         self.channel.queue_bind(
             queue=self.raw_queue, exchange=self.exchange, routing_key=self.raw_routing_key
         )
-        self.channel.basic_qos(prefetch_count=1)
+        self.channel.basic_qos(prefetch_count=self.prefetch)
         logger.info("Connected to RabbitMQ and queue declared/bound")
 
     def _handle_message(self, ch, method, properties, body):
-        delivery_tag = method.delivery_tag
+        if self._executor is not None:
+            self._executor.submit(self._handle_in_worker, ch, method.delivery_tag, properties, body)
+            return
+        self._process_message(ch, method.delivery_tag, properties, body, ack=self._ack_inline)
+
+    def _ack_inline(self, ch, delivery_tag: int, ok: bool):
+        if ok:
+            ch.basic_ack(delivery_tag=delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+
+    def _ack_threadsafe(self, ch, delivery_tag: int, ok: bool):
+        # ถ้า connection หลุดไปแล้ว ack ไม่ถึง broker: message จะถูกส่งใหม่เอง
+        self.connection.add_callback_threadsafe(functools.partial(self._ack_inline, ch, delivery_tag, ok))
+
+    def _handle_in_worker(self, ch, delivery_tag, properties, body):
+        try:
+            self._process_message(ch, delivery_tag, properties, body, ack=self._ack_threadsafe)
+        except Exception:
+            logger.exception("Unexpected error in processing worker")
+
+    def _process_message(self, ch, delivery_tag, properties, body, ack):
         image_id = None
         try:
-            msg = json.loads(body)
+            headers = (properties.headers or {}) if properties is not None else {}
+            if headers.get("inline"):
+                # ingestion แนบภาพเล็กมาใน body แล้ว (metadata อยู่ใน headers) ไม่ต้อง download
+                msg = headers
+                raw_bytes = body
+            else:
+                msg = json.loads(body)
+                raw_bytes = None
             image_id = msg.get("id") or str(uuid.uuid4())
             # support both keys
             raw_object_name = msg.get("raw_object_name") or msg.get("objectKey")
             if not raw_object_name:
                 raise ValueError("raw_object_name missing in message")
-            logger.info(f"Received raw.created: id={image_id} object={raw_object_name}")
+            logger.info(
+                f"Received raw.created: id={image_id} object={raw_object_name} inline={raw_bytes is not None}"
+            )
 
             # Download raw image
-            raw_bytes = self.uploader.download_raw(raw_object_name)
-
-            # Process image
-            processed_bytes = self.processor.process(raw_bytes)
+            if raw_bytes is None:
+                raw_bytes = self.uploader.download_raw(raw_object_name)
+
+            # Process image ด้วย profile ของกล้อง (device_id -> metadata.deviceId -> camera prefix ของ object)
+            if self.profiles is not None:
+                profile = self.profiles.get(*device_keys(msg, raw_object_name))
+            else:
+                profile = self.processor.default_profile
+            if self.pool is not None:
+                processed_bytes = self.pool.process(raw_bytes, profile)
+            else:
+                processed_bytes = self.processor.process(raw_bytes, profile)
 
             # Prepare processed object name
             processed_name = f"processed-{raw_object_name}"
 
             # Upload processed image
-            self.uploader.upload_processed(processed_name, processed_bytes)
+            self.uploader.upload_processed(processed_name, processed_bytes, content_type=profile.content_type)
 
             # Publish event downstream
             self.publisher.publish_processed_event(
@@ -80,7 +153,7 @@ class RabbitMQConsumer:
                 processed_object_name=processed_name
             )
 
-            ch.basic_ack(delivery_tag=delivery_tag)
+            ack(ch, delivery_tag, True)
             logger.info(f"Finished processing {image_id}")
         except Exception as e:
             logger.exception(f"Error processing message id={image_id}")
@@ -91,7 +164,7 @@ class RabbitMQConsumer:
                     logger.warning("on_error callback raised exception")
             # NACK without requeue to avoid infinite loop unless you want DLQ
             try:
-                ch.basic_nack(delivery_tag=delivery_tag, requeue=False)
+                ack(ch, delivery_tag, False)
             except Exception:
                 logger.warning("Failed to nack message", exc_info=True)
 
@@ -110,10 +183,12 @@ class RabbitMQConsumer:
             logger.error("No channel available after connection; aborting consumption")
             return
 
+        if self.profiles is not None:
+            self.profiles.start()
         self.channel.basic_consume(
             queue=self.raw_queue, on_message_callback=self._handle_message
         )
-        logger.info("Start consuming raw queue")
+        logger.info("Start consuming raw queue (prefetch=%d, workers=%d)", self.prefetch, Config.PROCESSING_WORKERS)
         try:
             self.channel.start_consuming()
         except KeyboardInterrupt:
@@ -121,6 +196,12 @@ class RabbitMQConsumer:
         except Exception:
             logger.exception("Unexpected error in consuming loop")
         finally:
+            if self.profiles is not None:
+                self.profiles.stop()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            if self.pool is not None:
+                self.pool.shutdown()
             if self.connection and not self.connection.is_closed:
                 try:
                     self.connection.close()
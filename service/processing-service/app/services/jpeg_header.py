@@ -0,0 +1,145 @@
+# service/processing-service/app/services/jpeg_header.py
+
+import struct
+
+import cv2
+import numpy as np
+
+ORIENTATION_TAG = 0x0112
+
+
+def _segments(data: bytes):
+    """
+    ไล่ marker segment ของ JPEG ตั้งแต่ SOI จนถึง SOS (อ่านแค่ header ไม่แตะ entropy-coded data)
+    yield (marker, payload_offset, payload_length)
+    """
+    if data[:2] != b"\xff\xd8":
+        return
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            return
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            pos += 2
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS: header จบแล้ว
+            return
+        (length,) = struct.unpack_from(">H", data, pos + 2)
+        if length < 2:
+            return
+        yield marker, pos + 4, length - 2
+        pos += 2 + length
+
+
+def exif_orientation(data: bytes) -> int:
+    """
+    EXIF Orientation (1-8) จาก APP1 ของ JPEG; 1 ถ้าไม่มีหรืออ่านไม่ได้
+    """
+    try:
+        for marker, offset, length in _segments(data):
+            if marker != 0xE1 or data[offset:offset + 6] != b"Exif\x00\x00":
+                continue
+            tiff = offset + 6
+            order = data[tiff:tiff + 2]
+            if order == b"II":
+                endian = "<"
+            elif order == b"MM":
+                endian = ">"
+            else:
+                return 1
+            (ifd,) = struct.unpack_from(endian + "I", data, tiff + 4)
+            ifd += tiff
+            (count,) = struct.unpack_from(endian + "H", data, ifd)
+            for i in range(count):
+                entry = ifd + 2 + i * 12
+                tag, typ = struct.unpack_from(endian + "HH", data, entry)
+                if tag == ORIENTATION_TAG:
+                    (value,) = struct.unpack_from(endian + "H", data, entry + 8)
+                    return value if 1 <= value <= 8 else 1
+            return 1
+    except struct.error:
+        pass
+    return 1
+
+
+def oriented_size(width: int, height: int, orientation: int) -> tuple:
+    # 5-8 สลับกว้าง/สูง
+    return (height, width) if orientation >= 5 else (width, height)
+
+
+def apply_orientation(img: np.ndarray, orientation: int) -> np.ndarray:
+    """
+    หมุน/กลับภาพตาม EXIF orientation (เหมือน PIL ImageOps.exif_transpose) ด้วย rotate/flip ของ OpenCV
+    """
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(img), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def _to_raw(u: int, v: int, width: int, height: int, orientation: int) -> tuple:
+    # pixel (u, v) ของภาพที่หมุนแล้ว -> pixel (x, y) ของภาพดิบขนาด width x height
+    if orientation == 2:
+        return width - 1 - u, v
+    if orientation == 3:
+        return width - 1 - u, height - 1 - v
+    if orientation == 4:
+        return u, height - 1 - v
+    if orientation == 5:
+        return v, u
+    if orientation == 6:
+        return v, height - 1 - u
+    if orientation == 7:
+        return width - 1 - v, height - 1 - u
+    if orientation == 8:
+        return width - 1 - v, u
+    return u, v
+
+
+def roi_to_raw(x: int, y: int, w: int, h: int, width: int, height: int, orientation: int) -> tuple:
+    """
+    ROI ในพิกัดของภาพที่หมุนตรงแล้ว -> ROI ในพิกัดภาพดิบ (clip ให้อยู่ในภาพ)
+    crop ภาพดิบด้วยค่านี้แล้วค่อย apply_orientation = หมุนทั้งภาพแล้ว crop ด้วย ROI เดิม แต่หมุนแค่ส่วนที่ crop
+    """
+    ow, oh = oriented_size(width, height, orientation)
+    u0, v0 = max(0, x), max(0, y)
+    u1, v1 = min(ow, x + w), min(oh, y + h)
+    if u1 <= u0 or v1 <= v0:
+        return 0, 0, 0, 0
+    ax, ay = _to_raw(u0, v0, width, height, orientation)
+    bx, by = _to_raw(u1 - 1, v1 - 1, width, height, orientation)
+    rx, ry = min(ax, bx), min(ay, by)
+    return rx, ry, max(ax, bx) - rx + 1, max(ay, by) - ry + 1
+
+
+# SOF markers ที่มีขนาดภาพ (C4 = DHT, C8 = JPG, CC = DAC ไม่ใช่ SOF)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data: bytes):
+    """
+    (width, height) จาก SOFn ของ JPEG (ก่อนหมุนตาม EXIF); None ถ้าไม่ใช่ JPEG หรือ header เสีย
+    """
+    try:
+        for marker, offset, length in _segments(data):
+            if marker in _SOF_MARKERS and length >= 5:
+                height, width = struct.unpack_from(">HH", data, offset + 1)
+                return width, height
+    except struct.error:
+        pass
+    return None
@@ -1,8 +1,42 @@
-import io
+from functools import lru_cache
+
 import cv2
 import numpy as np
-from io import BytesIO
-from PIL import Image, ImageOps, ExifTags
+
+from app.services.jpeg_header import apply_orientation, exif_orientation, jpeg_size, roi_to_raw
+
+# cv2.IMREAD_REDUCED_*: libjpeg ลดขนาดระหว่าง decode (DCT scaling) เร็วและใช้หน่วยความจำน้อยกว่า decode เต็มแล้ว resize
+_REDUCED_COLOR = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_REDUCED_GRAYSCALE = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def choose_decode_scale(image_bytes: bytes, roi: tuple, min_side: int) -> int:
+    """
+    scale factor (1, 2, 4, 8) ที่ใหญ่ที่สุดที่ด้านสั้นของ ROI (หรือทั้งภาพถ้าไม่มี ROI) ยังเหลืออย่างน้อย min_side px
+    ใช้กับ JPEG เท่านั้น (format อื่น OpenCV decode เต็มแล้วค่อยย่อ ไม่ได้ประหยัด)
+    """
+    if min_side <= 0:
+        return 1
+    size = jpeg_size(image_bytes)
+    if size is None:
+        return 1
+    x, y, w, h = roi
+    short_side = min(w, h) if w > 0 and h > 0 else min(size)
+    for scale in (8, 4, 2):
+        if short_side // scale >= min_side:
+            return scale
+    return 1
+
+
+@lru_cache(maxsize=32)
+def rect_kernel(kernel_size: tuple) -> np.ndarray:
+    """
+    MORPH_RECT kernel (cache ไว้ ไม่สร้างใหม่ทุกครั้งที่เรียก morphology_* / dilate); ห้ามแก้ array ที่คืนไป
+    """
+    return cv2.getStructuringElement(cv2.MORPH_RECT, tuple(kernel_size))
+
 
 class ImageProcessor:
     """
@@ -12,8 +46,7 @@ class ImageProcessor:
         processor = ImageProcessor(image_bytes)
         processed_bytes = (
             processor
-                .correct_orientation()
-                .crop_roi(x, y, w, h)
+                .orient_and_crop(x, y, w, h)
                 .to_grayscale()
                 .denoise(h=10)
                 .threshold_adaptive(block_size=11, C=2)
@@ -24,28 +57,61 @@ class ImageProcessor:
         )
     """
 
-    def __init__(self, image_bytes: bytes):
+    def __init__(self, image_bytes: bytes, scale: int = 1, grayscale: bool = False):
+        """
+        :param scale: decode ที่ 1/scale ของความละเอียดเต็ม (1, 2, 4, 8; ดู choose_decode_scale)
+        :param grayscale: decode เป็น grayscale ตรงๆ (ข้าม cvtColor ถ้า pipeline ใช้แค่ gray)
+        """
         # Store raw bytes
         self.original_bytes = image_bytes
-        # Decode initial image as BGR
-        arr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        self.scale = scale if scale in _REDUCED_COLOR else 1
+        self.grayscale = grayscale
+        # Decode ครั้งเดียว; imdecode คืน array ใหม่อยู่แล้ว ไม่ต้อง copy
+        # IMREAD_IGNORE_ORIENTATION: หมุนเองจาก EXIF header ด้านล่าง (ไม่ให้ OpenCV หมุนซ้ำ)
+        img = self._decode()
         if img is None:
             raise ValueError("Could not decode image bytes")
-        self.processed = img.copy()
+        self.processed = img
+        # EXIF orientation อ่านจาก header bytes เท่านั้น
+        self.orientation = exif_orientation(image_bytes)
+        self._oriented = self.orientation == 1
+
+    def _decode(self):
+        arr = np.frombuffer(self.original_bytes, np.uint8)
+        if self.scale > 1:
+            flags = (_REDUCED_GRAYSCALE if self.grayscale else _REDUCED_COLOR)[self.scale]
+        else:
+            flags = cv2.IMREAD_GRAYSCALE if self.grayscale else cv2.IMREAD_COLOR
+        return cv2.imdecode(arr, flags | cv2.IMREAD_IGNORE_ORIENTATION)
 
     def correct_orientation(self) -> "ImageProcessor":
         """
-        Read EXIF orientation and rotate pixel data accordingly (reset tag).
+        Apply EXIF orientation to the current pixels with a rotate/flip (no second decode).
+        Applied once; keeps any crop done before it (ROI then is in raw sensor coordinates).
         """
-        try:
-            pil = Image.open(BytesIO(self.original_bytes))
-            pil = ImageOps.exif_transpose(pil)
-            self.processed = cv2.cvtColor(np.array(pil), cv2.COLOR_RGB2BGR)
-        except Exception:
-            pass
+        if not self._oriented:
+            self.processed = apply_orientation(self.processed, self.orientation)
+            self._oriented = True
         return self
 
+    def orient_and_crop(self, x: int = 0, y: int = 0, w: int = 0, h: int = 0) -> "ImageProcessor":
+        """
+        Crop ROI given in upright (EXIF-corrected) full-resolution coordinates and orient the result.
+        The ROI is mapped back to raw coordinates so only the cropped region is rotated.
+        """
+        if w <= 0 or h <= 0:
+            return self.correct_orientation()
+        if self.scale > 1:
+            # ROI เป็นพิกัดของภาพเต็ม: ย่อตาม scale ที่ decode (ปัดขอบออกเพื่อไม่ตัดส่วนที่ต้องการ)
+            s = self.scale
+            x, y, w, h = x // s, y // s, -(-(x + w) // s) - x // s, -(-(y + h) // s) - y // s
+        if self._oriented:
+            return self.crop_roi(x, y, w, h)
+        height, width = self.processed.shape[:2]
+        rx, ry, rw, rh = roi_to_raw(x, y, w, h, width, height, self.orientation)
+        self.processed = self.processed[ry:ry+rh, rx:rx+rw]
+        return self.correct_orientation()
+
     def crop_roi(self, x: int, y: int, w: int, h: int) -> "ImageProcessor":
         """
         Crop region of interest from the processed image.
@@ -91,7 +157,7 @@ class ImageProcessor:
         """
         Remove small white specks (noise) by opening (erosion + dilation).
         """
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+        kernel = rect_kernel(tuple(kernel_size))
         self.processed = cv2.morphologyEx(
             self.processed,
             cv2.MORPH_OPEN,
@@ -103,7 +169,7 @@ class ImageProcessor:
         """
         Apply morphological closing to close small holes in text strokes.
         """
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+        kernel = rect_kernel(tuple(kernel_size))
         self.processed = cv2.morphologyEx(
             self.processed, cv2.MORPH_CLOSE, kernel
         )
@@ -113,7 +179,7 @@ class ImageProcessor:
         """
         Thicken strokes by dilating the binary image.
         """
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, kernel_size)
+        kernel = rect_kernel(tuple(kernel_size))
         self.processed = cv2.dilate(self.processed, kernel, iterations=iterations)
         return self
 
@@ -152,8 +218,8 @@ class ImageProcessor:
         return buf.tobytes()
 
     def reset(self) -> "ImageProcessor":
-        arr = np.frombuffer(self.original_bytes, np.uint8)
-        self.processed = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        self.processed = self._decode()
+        self._oriented = self.orientation == 1
         return self
 
     def pipeline(self, steps: list) -> "ImageProcessor":
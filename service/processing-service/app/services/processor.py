@@ -1,60 +1,108 @@
 # service/processing-service/app/services/processor.py
 
+from typing import NamedTuple, Optional
+
 from app.utils.logger import get_logger
 from app.utils.retry import retry
-from app.services.processing import ImageProcessor  # <-- pulls in your full-featured class
+from app.config import Config
+from app.services.processing import ImageProcessor, choose_decode_scale  # <-- pulls in your full-featured class
+from app.services.compiled_pipeline import COMPILED_STEPS, CompiledPipeline
 
 logger = get_logger("processor")
 
+# pipeline เดิม (ใช้เมื่อไม่มี profile ของกล้อง)
+DEFAULT_STEPS = (("denoise", {"h": 5}),)
+
+# step ที่ profile เรียกได้ (method ของ ImageProcessor ที่แปลงภาพ; ไม่รวม reset/get_bytes/pipeline)
+ALLOWED_STEPS = frozenset({
+    "correct_orientation", "orient_and_crop", "crop_roi", "to_grayscale", "denoise", "threshold_adaptive",
+    "invert_colors", "morphology_open", "morphology_close", "dilate", "deskew",
+})
+
+# จำนวน CompiledPipeline (พร้อม buffer) ที่เก็บไว้ต่อ Processor
+MAX_COMPILED_PIPELINES = 16
+
+# output_format -> (ext ของ cv2.imencode, content type)
+OUTPUT_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+class ProcessingProfile(NamedTuple):
+    """
+    pipeline ของกล้องหนึ่งตัว (ดู ProfileStore); picklable เพื่อส่งเข้า worker process ได้
+    """
+    roi: tuple = (0, 0, 0, 0)
+    steps: tuple = DEFAULT_STEPS
+    output_format: str = "png"
+
+    @property
+    def content_type(self) -> str:
+        return OUTPUT_FORMATS[self.output_format][1]
+
 
 class Processor:
-    def __init__(self, roi: tuple[int, int, int, int]):
+    def __init__(self, roi: tuple[int, int, int, int], min_side: int = None):
         """
         Initialize with a region of interest for cropping before OCR.
 
         :param roi: (x, y, width, height)
+        :param min_side: OCR resolution ที่ต้องการ (px ของด้านสั้นของ ROI); default = Config.DECODE_MIN_SIDE
         """
         self.logger = logger
         self.roi = roi
+        self.min_side = Config.DECODE_MIN_SIDE if min_side is None else min_side
+        self.default_profile = ProcessingProfile(roi=tuple(roi))
+        self.compiled = Config.PROCESSING_COMPILED_PIPELINE
+        self.gray_decode = Config.PROCESSING_GRAY_DECODE
+        # repr(steps) -> CompiledPipeline (None = มี step ที่ compile ไม่ได้ ใช้ ImageProcessor.pipeline)
+        self._pipelines = {}
+
+    def _compiled_for(self, steps: tuple) -> Optional[CompiledPipeline]:
+        """
+        CompiledPipeline ของ steps ชุดนี้ (สร้างครั้งแรกแล้วใช้ซ้ำพร้อม buffer ของมัน)
+        """
+        key = repr(steps)
+        if key not in self._pipelines:
+            if len(self._pipelines) >= MAX_COMPILED_PIPELINES:
+                # profile ถูกแก้ (hot reload) จนมีหลายชุด: ทิ้งชุดเก่าสุด
+                self._pipelines.pop(next(iter(self._pipelines)))
+            compilable = all(name in COMPILED_STEPS for name, _ in steps)
+            self._pipelines[key] = CompiledPipeline(steps) if compilable else None
+        return self._pipelines[key]
 
     @retry(total_tries=3, initial_delay=0.5, backoff=2.0)
-    def process(self, raw_bytes: bytes) -> bytes:
+    def process(self, raw_bytes: bytes, profile: Optional[ProcessingProfile] = None) -> bytes:
         """
-        Full OCR-prep pipeline:
-          1) correct_orientation
-          2) crop_roi
-          3) to_grayscale
-          4) denoise
-          5) threshold_adaptive
-          6) invert_colors
-          7) morphology_close
-          8) deskew (if skew > max_skew)
-          9) encode to PNG bytes
+        OCR-prep pipeline:
+          1-2) orient_and_crop (EXIF orientation from header, ROI in upright coordinates; decoded once)
+          3)   profile.steps (default: denoise h=5), e.g. to_grayscale / threshold_adaptive / invert_colors /
+               morphology_close / deskew; ผ่าน CompiledPipeline ถ้าเปิด PROCESSING_COMPILED_PIPELINE
+          4)   encode to profile.output_format (default PNG)
         """
+        profile = profile or self.default_profile
         self.logger.info("Starting image processing pipeline")
-        proc = ImageProcessor(raw_bytes)
-
-        # 2) Crop to ROI if provided
-        x, y, w, h = self.roi
-        if w > 0 and h > 0:
-            proc = proc.crop_roi(x, y, w, h)
-        # 3-7) Grayscale, denoise, threshold, invert, morphology) Grayscale, denoise, threshold, invert, morphology
-        proc = (
-            proc
-            .correct_orientation()
-            # .crop_roi(x, y, w, h)
-            # .to_grayscale()
-            .denoise(h=5)
-            # .threshold_adaptive(block_size=11, C=3)
-            # .invert_colors()
-            # # .morphology_open(kernel_size=(2,2))
-            # .morphology_close(kernel_size=(3,3))
-            # .dilate(kernel_size=(2,2), iterations=1)   # <-- เพิ่มตรงนี้
-            # .deskew(max_skew=2.0)
+        compiled = self._compiled_for(profile.steps) if self.compiled else None
+        # ROI เล็กกว่าภาพมาก: decode ที่ 1/2, 1/4, 1/8 โดยยังได้ความละเอียดพอสำหรับ OCR
+        proc = ImageProcessor(
+            raw_bytes,
+            scale=choose_decode_scale(raw_bytes, profile.roi, self.min_side),
+            grayscale=self.gray_decode and compiled is not None and compiled.grayscale,
         )
 
-        # 9) Encode out as PNG
-        result_bytes = proc.get_bytes(ext=".png")
+        # 1-2) Orient + crop: crop ภาพดิบตาม ROI ที่ map กลับแล้ว หมุนเฉพาะส่วนที่ crop
+        # (เดิม correct_orientation decode ใหม่ทั้งภาพผ่าน PIL และทับ crop ทิ้ง)
+        x, y, w, h = profile.roi
+        proc = proc.orient_and_crop(x, y, w, h)
+        # 3) Steps ของกล้องนี้
+        if compiled is not None:
+            proc.processed = compiled.run(proc.processed)
+        else:
+            proc = proc.pipeline(profile.steps)
+
+        # 4) Encode
+        result_bytes = proc.get_bytes(ext=OUTPUT_FORMATS[profile.output_format][0])
         self.logger.info("Image processing complete")
         return result_bytes
-
@@ -0,0 +1,136 @@
+# service/processing-service/app/services/profiles.py
+
+import threading
+from typing import Dict
+
+from sqlalchemy import column, func, select, table
+
+from app.database import SessionLocal
+from app.models.processing_profile import ProcessingProfileRow
+from app.services.processor import ALLOWED_STEPS, OUTPUT_FORMATS, ProcessingProfile
+from app.utils.logger import get_logger
+
+logger = get_logger("profiles")
+
+# thermo.devices (ตารางของ ingestion/watcher): ใช้แค่ map device_uid -> profile
+_devices = table("devices", column("id"), column("device_uid"), schema="thermo")
+
+
+def profile_from_row(row: ProcessingProfileRow) -> ProcessingProfile:
+    """
+    ตรวจ row ก่อนใช้ (step ต้องเป็น method ที่อนุญาต, kwargs เป็น dict); ไม่ผ่าน = ValueError
+    """
+    roi = (row.roi_x or 0, row.roi_y or 0, row.roi_w or 0, row.roi_h or 0)
+    if any(v < 0 for v in roi):
+        raise ValueError(f"negative ROI {roi}")
+    steps = []
+    for step in row.steps or []:
+        if not isinstance(step, (list, tuple)) or len(step) != 2:
+            raise ValueError(f"step must be [name, kwargs]: {step!r}")
+        name, kwargs = step
+        if name not in ALLOWED_STEPS:
+            raise ValueError(f"unknown step {name!r}")
+        if not isinstance(kwargs, dict):
+            raise ValueError(f"kwargs of {name} must be an object")
+        steps.append((name, kwargs))
+    output_format = (row.output_format or "png").lower()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"unsupported output_format {output_format!r}")
+    return ProcessingProfile(roi=roi, steps=tuple(steps), output_format=output_format)
+
+
+class ProfileStore:
+    """
+    Cache ของ thermo.processing_profiles ใน memory: lookup ต่อ message ไม่แตะ DB
+    thread แยก reload ทุก reload_seconds (hot reload) แต่อ่านทั้งตารางเฉพาะเมื่อ max(updated_at)/count เปลี่ยน
+    row ที่ device_id เป็น NULL = default ของกล้องที่ไม่มี profile; row ที่ไม่ผ่านการตรวจจะถูกข้าม (log warning)
+    หาได้ทั้งจาก device id และ device_uid (event จาก watcher-service บางตัวระบุกล้องได้จาก prefix ของ objectKey เท่านั้น)
+    """
+
+    def __init__(self, default: ProcessingProfile, reload_seconds: float = 30):
+        self.base_default = default
+        self.reload_seconds = reload_seconds
+        self._profiles: Dict[int, ProcessingProfile] = {}
+        self._by_uid: Dict[str, ProcessingProfile] = {}
+        self._default = default
+        self._version = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-reload", daemon=True)
+
+        self.reloads = 0
+        self.errors = 0
+        self.invalid = 0
+
+    def start(self):
+        try:
+            self.reload()
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Initial profile load failed, using default pipeline: %s", e)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.reload_seconds):
+            try:
+                self.reload()
+            except Exception as e:
+                self.errors += 1
+                logger.warning("Profile reload failed (keeping cached profiles): %s", e)
+
+    def reload(self) -> bool:
+        with SessionLocal() as db:
+            version = tuple(db.execute(
+                select(func.max(ProcessingProfileRow.updated_at), func.count(ProcessingProfileRow.id))
+            ).one())
+            if version == self._version:
+                return False
+            rows = db.execute(
+                select(ProcessingProfileRow, _devices.c.device_uid)
+                .outerjoin(_devices, _devices.c.id == ProcessingProfileRow.device_id)
+                .where(ProcessingProfileRow.enabled.is_(True))
+            ).all()
+
+        profiles, by_uid = {}, {}
+        default = self.base_default
+        for row, device_uid in rows:
+            try:
+                profile = profile_from_row(row)
+            except ValueError as e:
+                self.invalid += 1
+                logger.warning("Skipping invalid processing profile id=%s (device %s): %s", row.id, row.device_id, e)
+                continue
+            if row.device_id is None:
+                default = profile
+            else:
+                profiles[row.device_id] = profile
+                if device_uid:
+                    by_uid[device_uid] = profile
+        # สลับ reference ทีเดียว: thread ที่อ่านอยู่เห็นชุดเก่าหรือชุดใหม่ครบชุด
+        self._profiles, self._by_uid, self._default = profiles, by_uid, default
+        self._version = version
+        self.reloads += 1
+        logger.info("Loaded %d processing profiles", len(profiles))
+        return True
+
+    def get(self, device_id, device_uid: str = None) -> ProcessingProfile:
+        """
+        profile ของ device_id; ไม่มีค่อยหาจาก device_uid แล้วจึงใช้ default
+        """
+        try:
+            profile = self._profiles.get(int(device_id))
+        except (TypeError, ValueError):
+            profile = None
+        if profile is None and device_uid:
+            profile = self._by_uid.get(device_uid)
+        return profile or self._default
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self._profiles),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "invalid": self.invalid,
+        }
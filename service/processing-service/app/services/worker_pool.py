@@ -0,0 +1,68 @@
+# service/processing-service/app/services/worker_pool.py
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from app.utils.logger import get_logger
+from app.services.processor import ProcessingProfile, Processor
+
+logger = get_logger("worker_pool")
+
+# Processor ของแต่ละ worker process (สร้างครั้งเดียวตอน start process)
+_processor = None
+
+
+def _init_worker(roi: tuple, cv_threads: int):
+    global _processor
+    # N process x M OpenCV threads ไม่ควรเกินจำนวน core (ค่าเริ่มต้น 1 thread ต่อ process)
+    cv2.setNumThreads(cv_threads)
+    _processor = Processor(roi)
+
+
+def _process(raw_bytes: bytes, profile: ProcessingProfile = None) -> bytes:
+    return _processor.process(raw_bytes, profile)
+
+
+class ProcessingPool:
+    """
+    รัน Processor.process (CPU-bound: decode / denoise / encode) ใน process pool แทน pika thread
+    ใช้ spawn เพื่อไม่ fork process ที่มี thread ของ uvicorn/pika ค้างอยู่
+    """
+
+    def __init__(self, workers: int, roi: tuple = (0, 0, 0, 0), cv_threads: int = 1):
+        self.workers = workers
+        self.roi = roi
+        self.cv_threads = cv_threads
+        self._lock = threading.Lock()
+        self._executor = self._create()
+        logger.info("Started processing pool: %d processes x %d OpenCV threads", workers, cv_threads)
+
+    def _create(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.roi, self.cv_threads),
+        )
+
+    def process(self, raw_bytes: bytes, profile: ProcessingProfile = None) -> bytes:
+        """
+        ส่งภาพไปทำใน worker process แล้วรอผล (เรียกจาก consumer thread ใดก็ได้)
+        """
+        executor = self._executor
+        try:
+            return executor.submit(_process, raw_bytes, profile).result()
+        except BrokenProcessPool:
+            # worker ตาย (OOM / segfault ใน native code): สร้าง pool ใหม่ให้ message ถัดไป (ครั้งเดียวต่อ pool ที่พัง)
+            with self._lock:
+                if self._executor is executor:
+                    logger.error("Processing pool broken; restarting worker processes")
+                    self._executor = self._create()
+            raise
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# ให้ import app.* ได้เมื่อรัน pytest จาก service/processing-service
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
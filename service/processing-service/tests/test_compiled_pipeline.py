@@ -0,0 +1,99 @@
+# tests/test_compiled_pipeline.py
+import cv2
+import numpy as np
+import pytest
+
+from app.services.compiled_pipeline import CompiledPipeline
+from app.services.processing import ImageProcessor
+from app.services.processor import DEFAULT_STEPS, Processor, ProcessingProfile
+
+
+def _encode(img: np.ndarray) -> bytes:
+    # + noise: ให้ denoise / threshold มีรายละเอียดให้ต่างกันได้จริง
+    img = cv2.add(img, np.random.default_rng(7).integers(0, 40, img.shape, dtype=np.uint8))
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 85])
+    assert ok
+    return buf.tobytes()
+
+
+def _jpeg(width: int = 320, height: int = 240) -> bytes:
+    # ตัวเลขบนพื้นหลังไล่สี
+    img = np.zeros((height, width, 3), np.uint8)
+    img[:] = np.linspace(40, 200, width, dtype=np.uint8)[None, :, None]
+    cv2.putText(img, "36.6 C", (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2.0, (20, 230, 90), 5)
+    return _encode(img)
+
+
+def _skewed_jpeg(angle: float = 8.0) -> bytes:
+    # แถบสว่างเอียงบนพื้นมืด: deskew เจอมุมเกิน max_skew และหมุนภาพจริง
+    img = np.full((240, 320, 3), 30, np.uint8)
+    cv2.rectangle(img, (60, 100), (260, 140), (220, 220, 220), -1)
+    M = cv2.getRotationMatrix2D((160, 120), angle, 1.0)
+    return _encode(cv2.warpAffine(img, M, (320, 240), borderMode=cv2.BORDER_REPLICATE))
+
+
+IMAGE = _jpeg()
+SKEWED = _skewed_jpeg()
+
+CASES = {
+    "crop": [("crop_roi", {"x": 10, "y": 20, "w": 200, "h": 150})],
+    "gray": [("to_grayscale", {})],
+    "denoise": list(DEFAULT_STEPS),
+    "threshold": [("threshold_adaptive", {"block_size": 15, "C": 2})],
+    "threshold_fractional_c": [("threshold_adaptive", {})],
+    "threshold_invert": [("threshold_adaptive", {"C": 2}), ("invert_colors", {})],
+    "threshold_fractional_c_invert": [("threshold_adaptive", {"C": 1.5}), ("invert_colors", {})],
+    "threshold_double_invert": [("threshold_adaptive", {"C": 2}), ("invert_colors", {}), ("invert_colors", {})],
+    "double_invert": [("invert_colors", {}), ("invert_colors", {})],
+    "invert_color": [("invert_colors", {})],
+    "morphology": [
+        ("to_grayscale", {}), ("morphology_open", {}), ("morphology_close", {"kernel_size": (5, 5)}),
+        ("dilate", {"kernel_size": (3, 3), "iterations": 2}),
+    ],
+    "deskew": [("deskew", {"max_skew": 2.0})],
+    "ocr_chain": [
+        ("crop_roi", {"x": 0, "y": 40, "w": 300, "h": 160}), ("denoise", {"h": 10}),
+        ("threshold_adaptive", {"block_size": 11, "C": 2}), ("invert_colors", {}),
+        ("morphology_close", {"kernel_size": (3, 3)}), ("deskew", {}),
+    ],
+}
+
+
+def _legacy(image_bytes: bytes, steps) -> np.ndarray:
+    return ImageProcessor(image_bytes).pipeline(steps).processed
+
+
+@pytest.mark.parametrize("image_bytes", [IMAGE, SKEWED], ids=["upright", "skewed"])
+@pytest.mark.parametrize("case", sorted(CASES))
+def test_compiled_matches_image_processor(case, image_bytes):
+    steps = CASES[case]
+    compiled = CompiledPipeline(steps)
+    # รันสองรอบ: รอบสองใช้ buffer ที่จองไว้แล้ว ต้องได้ผลเดิม
+    for _ in range(2):
+        out = compiled.run(ImageProcessor(image_bytes).processed).copy()
+        np.testing.assert_array_equal(out, _legacy(image_bytes, steps))
+
+
+def test_deskew_case_rotates():
+    before = ImageProcessor(SKEWED).processed.copy()
+    assert not np.array_equal(ImageProcessor(SKEWED).deskew().processed, before)
+
+
+def test_buffers_follow_image_size():
+    steps = CASES["ocr_chain"][1:]
+    compiled = CompiledPipeline(steps)
+    small = _jpeg(160, 120)
+    for image_bytes in (IMAGE, small, IMAGE):
+        out = compiled.run(ImageProcessor(image_bytes).processed).copy()
+        np.testing.assert_array_equal(out, _legacy(image_bytes, steps))
+
+
+@pytest.mark.parametrize("case", ["denoise", "ocr_chain"])
+def test_processor_default_output_unchanged(case):
+    # ค่าเริ่มต้น (decode สี) ต้องได้ bytes เดียวกับ pipeline เดิม: ไม่เปลี่ยน OCR input ของกล้องที่ใช้อยู่
+    profile = ProcessingProfile(steps=tuple(CASES[case]))
+    compiled = Processor((0, 0, 0, 0))
+    legacy = Processor((0, 0, 0, 0))
+    legacy.compiled = False
+    assert compiled.compiled and not compiled.gray_decode
+    assert compiled.process(IMAGE, profile) == legacy.process(IMAGE, profile)
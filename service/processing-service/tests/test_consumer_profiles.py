@@ -0,0 +1,73 @@
+# tests/test_consumer_profiles.py
+import json
+
+import pytest
+
+from app.services.consumer import RabbitMQConsumer
+from app.services.processor import ProcessingProfile
+from app.services.profiles import ProfileStore
+
+DEFAULT = ProcessingProfile()
+CAM_7 = ProcessingProfile(roi=(10, 10, 100, 50), output_format="jpg")
+
+
+class FakeUploader:
+    def __init__(self):
+        self.uploads = []
+
+    def download_raw(self, object_name):
+        return b"raw"
+
+    def upload_processed(self, object_name, data, content_type):
+        self.uploads.append((object_name, content_type))
+
+
+class FakeProcessor:
+    default_profile = DEFAULT
+
+    def __init__(self):
+        self.profiles = []
+
+    def process(self, raw_bytes, profile):
+        self.profiles.append(profile)
+        return b"processed"
+
+
+class FakePublisher:
+    def publish_processed_event(self, image_id, processed_object_name):
+        pass
+
+
+@pytest.fixture
+def consumer():
+    store = ProfileStore(DEFAULT)
+    store._profiles, store._by_uid = {7: CAM_7}, {"cam-7": CAM_7}  # เหมือนหลัง reload()
+    c = RabbitMQConsumer.__new__(RabbitMQConsumer)  # ไม่ต่อ RabbitMQ / MinIO / DB
+    c.profiles, c.pool, c.on_error = store, None, None
+    c.uploader, c.processor, c.publisher = FakeUploader(), FakeProcessor(), FakePublisher()
+    return c
+
+
+def _consume(consumer, body: dict):
+    acks = []
+    consumer._process_message(None, 1, None, json.dumps(body).encode(), ack=lambda ch, tag, ok: acks.append(ok))
+    assert acks == [True]
+    return consumer.processor.profiles[-1]
+
+
+@pytest.mark.parametrize("body", [
+    # ingestion (RAW_EVENT_PUBLISH_ENABLED=true)
+    {"id": 1, "device_id": 7, "camera_uid": "cam-7", "raw_object_name": "cam-7/img-1-1700000000.jpg"},
+    # watcher-service: device id อยู่ใน metadata
+    {"bucket": "thermo-raw", "objectKey": "cam-7/img-1-1700000000.jpg", "metadata": {"imageObjectId": 1, "deviceId": 7}},
+    # watcher-service ที่ deviceId ไม่ตรงกับ profile (parse จากชื่อไฟล์): ใช้ camera prefix ของ objectKey
+    {"bucket": "thermo-raw", "objectKey": "cam-7/sha256/ab/ab00.jpg", "metadata": {"imageObjectId": 1, "deviceId": 99}},
+])
+def test_profile_resolved_for_each_producer(consumer, body):
+    assert _consume(consumer, body) is CAM_7
+    assert consumer.uploader.uploads[-1][1] == "image/jpeg"
+
+
+def test_unknown_device_uses_default(consumer):
+    body = {"bucket": "thermo-raw", "objectKey": "mg400-1.jpg", "metadata": {"deviceId": 3}}
+    assert _consume(consumer, body) is DEFAULT